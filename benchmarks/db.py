@@ -0,0 +1,234 @@
+"""Micro-benchmarks of the database layer.
+
+Run from the repository root:
+
+    python -m benchmarks.db connections --ops 5000
+    python -m benchmarks.db expiry --rows 1000000
+
+Each benchmark compares database/db_manager.py against the way the bot
+used the database before, reimplemented here as the baseline. Results
+are printed as JSON for comparing runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+import aiosqlite
+import database.db_manager as db_manager
+from config import EXPIRY_SWEEP_PAGE_SIZE
+from utils.helpers import to_epoch_ms
+
+
+async def _per_call_schedule(db_path: str, chat_id: int, message_id: int, delete_at: str):
+    """Baseline: a new connection (and its thread) for every query"""
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute(
+            "INSERT INTO messages (chat_id, message_id, delete_at, handler_name) VALUES (?, ?, ?, ?)",
+            (chat_id, message_id, delete_at, "del_after_24"),
+        )
+        await db.commit()
+
+
+async def _per_call_delete(db_path: str, record_id: int):
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("DELETE FROM messages WHERE id = ?", (record_id,))
+        await db.commit()
+
+
+async def _timed(operations, concurrency: int) -> float:
+    """Run the operation factories `concurrency` at a time, returns operations per second"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(operation):
+        async with semaphore:
+            await operation()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(operation) for operation in operations))
+    return round(len(operations) / (time.perf_counter() - started))
+
+
+async def benchmark_connections(args, directory: str) -> dict:
+    """/del scheduling and record deletion, per-call connect against the shared connection"""
+    delete_at = datetime.now(timezone.utc) + timedelta(days=1)
+
+    baseline_path = os.path.join(directory, "per_call.db")
+    async with aiosqlite.connect(baseline_path) as db:
+        await db.execute("""
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                delete_at TEXT NOT NULL,
+                handler_name TEXT DEFAULT 'del_after_24'
+            )
+        """)
+        await db.commit()
+    baseline = {
+        "schedule_per_second": await _timed(
+            [lambda i=i: _per_call_schedule(baseline_path, -100, i, delete_at.isoformat()) for i in range(args.ops)],
+            args.concurrency
+        ),
+        "delete_per_second": await _timed(
+            [lambda i=i: _per_call_delete(baseline_path, i) for i in range(1, args.ops + 1)],
+            args.concurrency
+        ),
+    }
+
+    db_manager.DB_PATH = os.path.join(directory, "shared.db")
+    await db_manager.init_db()
+    try:
+        shared = {
+            "schedule_per_second": await _timed(
+                [lambda i=i: db_manager.save_message_for_deletion(-100, i, to_epoch_ms(delete_at))
+                 for i in range(args.ops)],
+                args.concurrency
+            ),
+            "delete_per_second": await _timed(
+                [lambda i=i: db_manager.delete_message_record(i) for i in range(1, args.ops + 1)],
+                args.concurrency
+            ),
+        }
+    finally:
+        await db_manager.close_db()
+
+    return {
+        "ops": args.ops,
+        "concurrency": args.concurrency,
+        "per_call_connect": baseline,
+        "shared_connection": shared,
+        "speedup": {key: round(shared[key] / baseline[key], 1) for key in baseline},
+    }
+
+
+async def _median_ms(query, repeat: int) -> float:
+    """Median duration of `query()` in milliseconds"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await query()
+        durations.append(time.perf_counter() - started)
+    return round(statistics.median(durations) * 1000, 3)
+
+
+def _pending_rows(rows: int, due: int, now: datetime):
+    """(chat_id, message_id, deadline) of `rows` records, `due` of them past their deadline"""
+    for row in range(rows):
+        # Due records first, the rest spread over the next ten days
+        offset = timedelta(seconds=-1 - row) if row < due else timedelta(seconds=row * 864_000 // rows + 60)
+        yield -100 - row % 500, row, now + offset
+
+
+async def benchmark_expiry(args, directory: str) -> dict:
+    """Finding due records among --rows pending ones, ISO text column against indexed epoch ms"""
+    now = datetime.now(timezone.utc)
+
+    # Baseline: ISO-8601 text deadlines, no index, compared as strings
+    baseline_path = os.path.join(directory, "iso.db")
+    with sqlite3.connect(baseline_path) as db:
+        db.execute("""
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                delete_at TEXT NOT NULL,
+                handler_name TEXT DEFAULT 'del_after_24'
+            )
+        """)
+        db.executemany(
+            "INSERT INTO messages (chat_id, message_id, delete_at, handler_name) VALUES (?, ?, ?, ?)",
+            ((chat_id, message_id, deadline.isoformat(), f"del_after_{args.hours}h")
+             for chat_id, message_id, deadline in _pending_rows(args.rows, args.due, now))
+        )
+    async with aiosqlite.connect(baseline_path) as db:
+        async def baseline_query():
+            async with db.execute(
+                "SELECT id, chat_id, message_id FROM messages WHERE delete_at <= ?", (now.isoformat(),)
+            ) as cursor:
+                return await cursor.fetchall()
+
+        baseline_due = len(await baseline_query())
+        baseline = {"select_due_ms": await _median_ms(baseline_query, args.repeat)}
+    baseline["file_mb"] = round(os.path.getsize(baseline_path) / 1024 ** 2, 1)
+
+    # Current schema, created by the migrations
+    db_manager.DB_PATH = os.path.join(directory, "epoch.db")
+    await db_manager.init_db()
+    await db_manager.close_db()
+    with sqlite3.connect(db_manager.DB_PATH) as db:
+        db.executemany(
+            "INSERT INTO messages (chat_id, message_id, delete_at, handler_name, sent_at) VALUES (?, ?, ?, ?, ?)",
+            ((chat_id, message_id, to_epoch_ms(deadline), f"del_{args.hours * 3600}s",
+              to_epoch_ms(deadline - timedelta(hours=args.hours)))
+             for chat_id, message_id, deadline in _pending_rows(args.rows, args.due, now))
+        )
+
+    await db_manager.init_db()
+    try:
+        now_ms = to_epoch_ms(now)
+        current_due = len(await db_manager.get_expired_messages(now_ms))
+        current = {
+            "select_due_ms": await _median_ms(lambda: db_manager.get_expired_messages(now_ms), args.repeat),
+            # What a sweep runs per page; the lease ends at once so every run claims the same page
+            "claim_page_ms": await _median_ms(
+                lambda: db_manager.claim_expired_messages("benchmark", now_ms, now_ms, EXPIRY_SWEEP_PAGE_SIZE),
+                args.repeat
+            ),
+            "next_deadlines_ms": await _median_ms(
+                lambda: db_manager.get_upcoming_deadlines(now_ms, 1000), args.repeat
+            ),
+        }
+    finally:
+        await db_manager.close_db()
+    # The database runs in WAL mode: move the rows still in the log into the file before measuring it
+    with closing(sqlite3.connect(db_manager.DB_PATH)) as db:
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    current["file_mb"] = round(os.path.getsize(db_manager.DB_PATH) / 1024 ** 2, 1)
+
+    assert baseline_due == current_due == args.due
+    return {
+        "rows": args.rows,
+        "due": args.due,
+        "iso_text": baseline,
+        "epoch_ms_indexed": current,
+        "speedup": round(baseline["select_due_ms"] / current["select_due_ms"], 1),
+    }
+
+
+BENCHMARKS = {
+    "connections": benchmark_connections,
+    "expiry": benchmark_expiry,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS), help="what to measure")
+    parser.add_argument("--ops", type=int, default=2000, help="operations of each kind")
+    parser.add_argument("--concurrency", type=int, default=1, help="operations in flight at once")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="pending deletion records (expiry)")
+    parser.add_argument("--due", type=int, default=500, help="records among them already due (expiry)")
+    parser.add_argument("--hours", type=int, default=24, help="deletion delay of the records (expiry)")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each query, the median is reported")
+    parser.add_argument("--output", help="write the JSON results to this file as well")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_db_") as directory:
+        results = asyncio.run(BENCHMARKS[args.benchmark](args, directory))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
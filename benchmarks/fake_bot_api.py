@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+import tornado.httpserver
+import tornado.netutil
+import tornado.web
+
+# Methods answered with a Message object
+MESSAGE_METHODS = {"sendMessage", "editMessageText", "sendDocument", "sendPhoto"}
+
+# Methods that are never answered with an injected error
+RELIABLE_METHODS = {"getMe", "setWebhook", "deleteWebhook", "getUpdates"}
+
+
+class FakeBotApi:
+    """Local stand-in for the Telegram Bot API.
+
+    Answers every method with a plausible result after an optional delay,
+    serves registered files for download and queued updates through
+    getUpdates, logs the calls it receives and can answer a share of them,
+    or the next few, with flood-control (429) or other (400) errors.
+    """
+
+    def __init__(self, latency: float = 0.0, flood_rate: float = 0.0, error_rate: float = 0.0,
+                 retry_after: int = 1, seed: int = 0):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.errors = Counter()
+        # (time.monotonic(), method, params) of every call, in arrival order
+        self.log = []
+        # Calls still to be answered with 429, whatever the flood rate
+        self._floods = 0
+        # file_path -> bytes
+        self._files = {}
+        self._message_ids = itertools.count(1_000_000)
+        # Updates not yet confirmed by a getUpdates offset
+        self._updates = []
+        self._updates_added = asyncio.Event()
+        self._random = random.Random(seed)
+        self._server = None
+        self.url = None
+
+    def add_file(self, file_id: str, data: bytes):
+        """Make a file available through getFile and its download URL"""
+        self._files[file_id] = data
+
+    def get_file(self, file_path: str) -> bytes | None:
+        return self._files.get(file_path)
+
+    def flood_next(self, calls: int = 1):
+        """Answer the next `calls` calls with flood-control errors"""
+        self._floods += calls
+
+    def add_update(self, update: dict):
+        """Queue an update for the bot's next getUpdates"""
+        self._updates.append(update)
+        self._updates_added.set()
+
+    async def _wait_for_updates(self, params: dict) -> list:
+        """Long polling: pending updates from the offset on, waiting up to the timeout for one"""
+        offset = int(params.get("offset", 0))
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates:
+            self._updates_added.clear()
+            try:
+                await asyncio.wait_for(self._updates_added.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(params.get("limit", 100))]
+
+    async def start(self, host: str = "127.0.0.1") -> str:
+        """Start serving on a free port, returns the base URL (for BOT_API_URL)"""
+        application = tornado.web.Application([
+            (r"/bot[^/]+/(\w+)", _MethodHandler, {"api": self}),
+            (r"/file/bot[^/]+/(.+)", _FileHandler, {"api": self}),
+        ])
+        sockets = tornado.netutil.bind_sockets(0, host)
+        self._server = tornado.httpserver.HTTPServer(application)
+        self._server.add_sockets(sockets)
+        self.url = f"http://{host}:{sockets[0].getsockname()[1]}"
+        return self.url
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.stop()
+            # Answer a pending long poll instead of leaving it to be cancelled
+            self._updates_added.set()
+            await asyncio.sleep(self.latency)
+            await self._server.close_all_connections()
+            self._server = None
+
+    async def call(self, method: str, params: dict) -> tuple[int, dict]:
+        """Answer a Bot API call, returns (HTTP status, response body)"""
+        updates = await self._wait_for_updates(params) if method == "getUpdates" else None
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[method] += 1
+        self.log.append((time.monotonic(), method, params))
+
+        if method not in RELIABLE_METHODS:
+            draw = self._random.random()
+            if self._floods or draw < self.flood_rate:
+                self._floods = max(0, self._floods - 1)
+                self.errors[method] += 1
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }
+            if draw < self.flood_rate + self.error_rate:
+                self.errors[method] += 1
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: injected error"}
+
+        if updates is not None:
+            return 200, {"ok": True, "result": updates}
+        try:
+            return 200, {"ok": True, "result": self._result(method, params)}
+        except KeyError as e:
+            return 400, {"ok": False, "error_code": 400, "description": f"Bad Request: {e} not found"}
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {
+                "id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot",
+                "can_join_groups": True, "can_read_all_group_messages": True, "supports_inline_queries": False,
+            }
+        if method == "getFile":
+            file_id = params["file_id"]
+            data = self._files[file_id]
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(data), "file_path": file_id}
+        if method == "getChatMember":
+            return {"status": "member", "user": {"id": int(params["user_id"]), "is_bot": False, "first_name": "User"}}
+        if method == "sendMediaGroup":
+            return [self._message(method, params) for _ in json.loads(params["media"])]
+        if method in MESSAGE_METHODS:
+            return self._message(method, params)
+        return True
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id = params.get("chat_id", "0")
+        message_id = int(params["message_id"]) if method == "editMessageText" else next(self._message_ids)
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if chat_id.lstrip("-").isdigit() else 0, "type": "supergroup"},
+            "text": params.get("text", ""),
+        }
+
+        uploaded_id = f"uploaded-{message_id}"
+        if method == "sendDocument" or (method == "sendMediaGroup" and "document" in params.get("media", "")):
+            message["document"] = {"file_id": uploaded_id, "file_unique_id": uploaded_id}
+        elif method in ("sendPhoto", "sendMediaGroup"):
+            message["photo"] = [{"file_id": uploaded_id, "file_unique_id": uploaded_id, "width": 1, "height": 1}]
+        return message
+
+
+class _MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api: FakeBotApi):
+        self.api = api
+
+    async def post(self, method):
+        # Form fields (JSON-encoded values) and multipart fields alike
+        params = {key: values[0].decode() for key, values in self.request.body_arguments.items()}
+        status, body = await self.api.call(method, params)
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(body))
+
+
+class _FileHandler(tornado.web.RequestHandler):
+    def initialize(self, api: FakeBotApi):
+        self.api = api
+
+    async def get(self, file_path):
+        if self.api.latency:
+            await asyncio.sleep(self.api.latency)
+        data = self.api.get_file(file_path)
+        if data is None:
+            raise tornado.web.HTTPError(404)
+        self.finish(data)
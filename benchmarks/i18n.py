@@ -0,0 +1,115 @@
+"""Micro-benchmark of t(), the lookup behind every user-facing string.
+
+Run from the repository root:
+
+    python -m benchmarks.i18n --number 200000
+
+The current translations.py (flattened keys, templates compiled at load time,
+per-chat language with fallback) is compared with the Translator it
+replaced, reimplemented here as the baseline: split the dotted key, walk
+the nested sections, format whenever arguments are given. Each case is
+timed with timeit, best of --repeat interleaved runs, in nanoseconds per
+call. Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import translations
+from translations import TRANSLATIONS_DIR, init_translator, reset_language, t, use_language
+
+CASES = {
+    "plain": ("status.enabled", {}),
+    # Given arguments, but the text has no replacement fields
+    "plain_with_arguments": ("to_jpg.converting", {"chat_id": -100123}),
+    "formatted": ("del_message.scheduled_confirmation", {"time_text": "2 hour(s)"}),
+    "missing_key": ("no_such.section.key", {}),
+}
+
+
+class _BaselineTranslator:
+    """translations.Translator as it was before keys were flattened"""
+
+    def __init__(self, language="en"):
+        self.language = language
+        file_path = f"{TRANSLATIONS_DIR}/{language}.json"
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                self.translations = json.load(f)
+        else:
+            self.translations = {}
+
+    def get(self, key, **kwargs):
+        keys = key.split('.')
+        value = self.translations
+
+        try:
+            for k in keys:
+                value = value[k]
+            return value.format(**kwargs) if kwargs else value
+        except (KeyError, AttributeError):
+            return key
+
+
+def _time_ns(functions: list, number: int, repeat: int) -> list:
+    """Best time of one call of each function, in nanoseconds
+
+    The functions take turns in every run, so they share the machine's
+    noise instead of one of them getting a quiet moment.
+    """
+    timers = [timeit.Timer(function) for function in functions]
+    best = [float("inf")] * len(timers)
+    for _ in range(repeat):
+        for index, timer in enumerate(timers):
+            best[index] = min(best[index], timer.timeit(number))
+    return [round(seconds / number * 1e9) for seconds in best]
+
+
+def benchmark(args) -> dict:
+    init_translator(args.language)
+    results = {"number": args.number, "repeat": args.repeat, "language": args.language, "cases": {}}
+
+    for chat_language in (None, args.chat_language):
+        # The baseline had one global language, so a chat language means loading that file instead
+        baseline = _BaselineTranslator(chat_language or args.language)
+        token = use_language(chat_language)
+        try:
+            for name, (key, kwargs) in CASES.items():
+                assert t(key, **kwargs) == baseline.get(key, **kwargs)
+                before, after = _time_ns(
+                    [lambda: baseline.get(key, **kwargs), lambda: t(key, **kwargs)], args.number, args.repeat
+                )
+                case = name if chat_language is None else f"{name}_chat_{chat_language}"
+                results["cases"][case] = {
+                    "baseline_ns": before,
+                    "current_ns": after,
+                    "speedup": round(before / after, 1),
+                }
+        finally:
+            reset_language(token)
+
+    results["locales_loaded"] = sorted(translations._locales)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=200_000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=9, help="timing runs, the best is reported")
+    parser.add_argument("--language", default="en", help="default language of the bot")
+    parser.add_argument("--chat-language", default="fa", help="language chosen by a chat")
+    parser.add_argument("--output", help="write the JSON results to this file as well")
+    args = parser.parse_args()
+
+    results = benchmark(args)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Measure the offline language detector on a labelled set of chat messages.
+
+Run from the repository root:
+
+    python -m benchmarks.langid --output langid.json
+
+data/langid_eval.json holds short messages in every profiled language
+(expected to be recognized) and in languages without a profile (expected
+to be left to the translation service). A detection counts only at or
+above LANGUAGE_DETECTION_MIN_CONFIDENCE, the way /translate uses it.
+Profiled languages in NEAR_NEIGHBOURS are never detected, so their
+messages are all left to the service.
+Results are printed as JSON for comparing runs.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from benchmarks.replay import percentile
+from config import LANGUAGE_DETECTION_MIN_CONFIDENCE
+from utils.language_detector import LanguageDetector, NEAR_NEIGHBOURS, SAMPLES_PATH
+
+EVAL_PATH = os.path.join(os.path.dirname(SAMPLES_PATH), "langid_eval.json")
+
+
+def classify(detector: LanguageDetector, messages: list, min_confidence: float) -> tuple[list, list]:
+    """Accepted detections (None when left to upstream) and the time each took"""
+    detected = []
+    seconds = []
+    for message in messages:
+        started = time.perf_counter()
+        language, confidence = detector.detect(message)
+        seconds.append(time.perf_counter() - started)
+        detected.append(language if language and confidence >= min_confidence else None)
+    return detected, seconds
+
+
+def run_benchmark(args) -> dict:
+    with open(args.eval, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    detector = LanguageDetector(args.samples)
+    started = time.perf_counter()
+    profiled = detector.languages
+    build_seconds = time.perf_counter() - started
+
+    known = {}
+    unknown = {}
+    latencies = []
+    for _ in range(args.repeat):
+        latencies.clear()
+        for language, messages in corpus["languages"].items():
+            detected, seconds = classify(detector, messages, args.min_confidence)
+            latencies.extend(seconds)
+            known[language] = {
+                "correct": round(sum(d == language for d in detected) / len(messages), 3),
+                "wrong": round(sum(d not in (None, language) for d in detected) / len(messages), 3),
+                "confused_with": sorted({d for d in detected if d not in (None, language)}),
+            }
+        for language, messages in corpus["unknown"].items():
+            detected, seconds = classify(detector, messages, args.min_confidence)
+            latencies.extend(seconds)
+            unknown[language] = {
+                "accepted": round(sum(d is not None for d in detected) / len(messages), 3),
+                "taken_for": sorted({d for d in detected if d}),
+            }
+
+    missing = sorted(set(known) - profiled - NEAR_NEIGHBOURS.keys())
+    return {
+        "min_confidence": args.min_confidence,
+        "profile_build_ms": round(build_seconds * 1000, 1),
+        "known": {
+            "languages": len(known),
+            "without_profile": missing,
+            "near_neighbours": sorted(set(known) & NEAR_NEIGHBOURS.keys()),
+            "correct": round(sum(r["correct"] for r in known.values()) / len(known), 3),
+            "wrong": round(sum(r["wrong"] for r in known.values()) / len(known), 3),
+            "per_language": known,
+        },
+        "unknown": {
+            "languages": len(unknown),
+            # Share of messages given a (necessarily wrong) label instead of going upstream
+            "accepted": round(sum(r["accepted"] for r in unknown.values()) / len(unknown), 3),
+            "per_language": unknown,
+        },
+        "detect_us": {
+            "count": len(latencies),
+            "mean": round(sum(latencies) / len(latencies) * 1e6, 1),
+            "p50": round(percentile(latencies, 50) * 1e6, 1),
+            "p99": round(percentile(latencies, 99) * 1e6, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval", default=EVAL_PATH, help="labelled messages to detect")
+    parser.add_argument("--samples", default=SAMPLES_PATH, help="training samples of the profiles")
+    parser.add_argument("--min-confidence", type=float, default=LANGUAGE_DETECTION_MIN_CONFIDENCE,
+                        help="confidence at which a detection is trusted")
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the messages, for stable timings")
+    parser.add_argument("--output", help="write the JSON results to this file as well")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
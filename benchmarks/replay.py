@@ -0,0 +1,380 @@
+"""Replay synthetic update streams through TelegramBot against a fake Bot API.
+
+Run from the repository root:
+
+    python -m benchmarks.replay --updates 2000 --seed-rows 100000 --output results.json
+
+The bot runs with its real handlers, database, conversion pool and rate
+limiter; only Telegram (benchmarks.fake_bot_api) and the translation
+service (a stub answering after --translate-latency-ms) are replaced.
+Updates are put straight into the application's queue, or with
+--ingress they arrive the way Telegram delivers them: through getUpdates
+long polling on the fake API, or posted by a local client to the bot's
+webhook server. Results are printed as JSON for comparing runs.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+import httpx
+from PIL import Image
+from benchmarks.fake_bot_api import FakeBotApi
+
+BOT_TOKEN = "123456:benchmark"
+ADMIN_USER_ID = 1000
+# Telegram group ids start at -100...
+FIRST_CHAT_ID = -1001000000000
+WEBHOOK_SECRET_TOKEN = "benchmark-secret"
+
+
+def percentile(values: list, q: float) -> float:
+    """q-th percentile (0-100) of the values, nearest rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(seconds: list) -> dict:
+    """p50/p99/max of durations, in milliseconds"""
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 2),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 2),
+        "max_ms": round(max(seconds, default=0) * 1000, 2),
+    }
+
+
+def make_fixtures(size: int) -> dict:
+    """Image fixtures by format, the same picture in every format"""
+    image = Image.effect_mandelbrot((size, size * 3 // 4), (-2, -1.2, 1, 1.2), 100).convert("RGB")
+    formats = {"png": "PNG", "tiff": "TIFF"}
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+        formats["heic"] = "HEIF"
+    except ImportError:
+        pass
+
+    fixtures = {}
+    for name, pillow_format in formats.items():
+        buffer = io.BytesIO()
+        image.save(buffer, format=pillow_format)
+        fixtures[name] = buffer.getvalue()
+    return fixtures
+
+
+def load_texts() -> list[str]:
+    """Sentences in several languages for /translate"""
+    with open("data/langid_samples.json", encoding="utf-8") as f:
+        samples = json.load(f)
+    texts = []
+    for language, text in samples.items():
+        if language != "en":
+            texts.extend(sentence.strip() + "." for sentence in text.split(".") if len(sentence.strip()) > 20)
+    return texts
+
+
+class StubTranslator:
+    """Stands in for googletrans: answers after a fixed delay"""
+
+    class _Client:
+        async def aclose(self):
+            pass
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.client = self._Client()
+
+    async def translate(self, text, src="auto", dest="en"):
+        await asyncio.sleep(self.latency)
+        return _Translation(text[::-1], "de" if src == "auto" else src)
+
+
+class _Translation:
+    def __init__(self, text, src):
+        self.text = text
+        self.src = src
+
+
+def make_updates(args, fixtures: dict, texts: list) -> list[tuple[str, dict]]:
+    """Synthetic (kind, update) pairs in a random but reproducible order"""
+    rng = random.Random(args.seed)
+    mix = {kind: float(weight) for kind, weight in (item.split("=") for item in args.mix.split(","))}
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=args.updates)
+    image_formats = sorted(fixtures)
+    now = int(time.time())
+
+    updates = []
+    for update_id, kind in enumerate(kinds, start=1):
+        chat_id = FIRST_CHAT_ID - rng.randrange(args.chats)
+        chat = {"id": chat_id, "type": "supergroup", "title": "Benchmark"}
+        user = {"id": ADMIN_USER_ID + rng.randrange(1, 100), "is_bot": False, "first_name": "User"}
+        target = {"message_id": update_id * 2, "date": now, "chat": chat, "from": user}
+
+        if kind == "del":
+            command = f"/del {rng.choice(['1m', '2h', '1d'])}"
+            target["text"] = "to be deleted"
+        elif kind == "tojpg":
+            command = "/tojpg"
+            image_format = rng.choice(image_formats)
+            # A few sources come back again, as they do in real groups
+            file_id = f"fixture-{image_format}"
+            unique_id = f"{image_format}-{rng.randrange(args.updates if args.unique_images else 10)}"
+            target["document"] = {
+                "file_id": file_id, "file_unique_id": unique_id, "file_name": f"image.{image_format}",
+                "mime_type": f"image/{image_format}", "file_size": len(fixtures[image_format]),
+            }
+        else:
+            command = "/translate"
+            target["text"] = rng.choice(texts)
+
+        updates.append((kind, {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id * 2 + 1,
+                "date": now,
+                "chat": chat,
+                "from": user,
+                "text": command,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(command.split()[0])}],
+                "reply_to_message": target,
+            },
+        }))
+    return updates
+
+
+def seed_messages(db_path: str, rows: int, chats: int):
+    """Insert `rows` deletion records that are already due
+
+    The messages were sent up to 60 hours ago, so a fifth of them are past
+    Telegram's deletion window, as after a long downtime.
+    """
+    now = int(time.time() * 1000)
+    due = now - 60_000
+    connection = sqlite3.connect(db_path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO messages (chat_id, message_id, delete_at, handler_name, sent_at) VALUES (?, ?, ?, 'del', ?)",
+            ((FIRST_CHAT_ID - row % chats, row, due + row % 1000, now - (row % 60 + 1) * 3_600_000)
+             for row in range(rows))
+        )
+    connection.close()
+
+
+async def measure_loop_lag(samples: list, interval: float = 0.01):
+    """Record how late the event loop wakes up from a short sleep"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - started - interval))
+
+
+def free_port(host: str = "127.0.0.1") -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+async def post_update(client: httpx.AsyncClient, url: str, data: dict) -> bool:
+    """Deliver an update to the webhook the way Telegram does, returns whether it was accepted"""
+    response = await client.post(url, json=data, headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET_TOKEN})
+    return response.status_code == 200
+
+
+async def run_benchmark(args) -> dict:
+    api = FakeBotApi(args.api_latency_ms / 1000, args.flood_rate, args.error_rate, seed=args.seed)
+    fixtures = make_fixtures(args.image_size)
+    for image_format, data in fixtures.items():
+        api.add_file(f"fixture-{image_format}", data)
+    await api.start()
+
+    # config.py reads the environment when the bot modules are imported
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_"), "messages.db")
+    webhook_port = free_port()
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "BOT_API_URL": api.url,
+        "DB_PATH": db_path,
+        "ADMIN_USER_ID": str(ADMIN_USER_ID),
+        "ALLOWED_GROUPS": ",".join(str(FIRST_CHAT_ID - index) for index in range(args.chats)),
+        "CONCURRENT_UPDATES": str(args.concurrency),
+        "BOT_MODE": "webhook" if args.ingress == "webhook" else "polling",
+        "WEBHOOK_URL": "https://benchmark.invalid",
+        "WEBHOOK_LISTEN": "127.0.0.1",
+        "WEBHOOK_PORT": str(webhook_port),
+        "WEBHOOK_PATH": "telegram",
+        "WEBHOOK_SECRET_TOKEN": WEBHOOK_SECRET_TOKEN,
+        "METRICS_PORT": "0",
+    })
+    import logging
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    import group_manager_bot
+    from database.db_manager import init_db, count_pending_messages
+    from handlers.translate import TranslateHandler
+    from utils.metrics import metrics
+    from translations import init_translator
+    logging.getLogger().setLevel(logging.WARNING)
+    # Injected errors are counted in the results, not logged per request
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)
+
+    if not args.telegram_limits:
+        # Measure the bot, not Telegram's flood limits
+        group_manager_bot.RATE_LIMIT_GLOBAL_PER_SECOND = 1_000_000
+        group_manager_bot.RATE_LIMIT_GROUP_PER_MINUTE = 1_000_000
+        group_manager_bot.RATE_LIMIT_PRIVATE_PER_SECOND = 1_000_000
+
+    init_translator(group_manager_bot.LANGUAGE)
+    await init_db()
+    seed_messages(db_path, args.seed_rows, args.chats)
+
+    loop_lag = []
+    lag_task = asyncio.create_task(measure_loop_lag(loop_lag))
+
+    # Phase 1: the sweep of the seeded backlog starts as soon as the bot is set up
+    bot = group_manager_bot.TelegramBot()
+    await bot.setup()
+    for handler in bot.handlers:
+        if isinstance(handler, TranslateHandler):
+            await handler.on_shutdown()
+            handler._translator = StubTranslator(args.translate_latency_ms / 1000)
+
+    # Runs after every other handler group, so it sees the update once it has been handled
+    started_at = {}
+    latencies = defaultdict(list)
+    kinds = {}
+    all_done = asyncio.Event()
+
+    async def record_done(update, context):
+        latencies[kinds[update.update_id]].append(time.perf_counter() - started_at[update.update_id])
+        if sum(map(len, latencies.values())) == len(started_at):
+            all_done.set()
+
+    bot.app.add_handler(TypeHandler(Update, record_done), group=99)
+    await bot.app.initialize()
+    await bot.app.start()
+    if args.ingress != "queue":
+        await bot._start_receiving_updates()
+    sweep_started = time.perf_counter()
+
+    sweep_seconds = None
+    if args.seed_rows:
+        while (await count_pending_messages(int(time.time() * 1000)))[1]:
+            if time.perf_counter() - sweep_started > args.timeout:
+                break
+            await asyncio.sleep(0.05)
+        else:
+            sweep_seconds = time.perf_counter() - sweep_started
+    sweep_calls = api.calls["deleteMessages"]
+
+    # Phase 2: replay the update stream
+    updates = make_updates(args, fixtures, load_texts())
+    api.calls.clear()
+    lag_offset = len(loop_lag)
+    replay_started = time.perf_counter()
+    webhook_client = httpx.AsyncClient()
+    webhook_url = f"http://127.0.0.1:{webhook_port}/telegram"
+    posts = []
+    for kind, data in updates:
+        kinds[data["update_id"]] = kind
+        started_at[data["update_id"]] = time.perf_counter()
+        if args.ingress == "polling":
+            api.add_update(data)
+        elif args.ingress == "webhook":
+            posts.append(asyncio.create_task(post_update(webhook_client, webhook_url, data)))
+        else:
+            await bot.app.update_queue.put(Update.de_json(data, bot.app.bot))
+        if args.rate:
+            await asyncio.sleep(1 / args.rate)
+    rejected = (await asyncio.gather(*posts)).count(False)
+    await webhook_client.aclose()
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(all_done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+    replay_seconds = time.perf_counter() - replay_started
+    replay_lag = loop_lag[lag_offset:]
+
+    lag_task.cancel()
+    await bot.shutdown()
+    await api.stop()
+
+    handled = sum(map(len, latencies.values()))
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "sweep": {
+            "rows": args.seed_rows,
+            "seconds": round(sweep_seconds, 3) if sweep_seconds is not None else None,
+            "rows_per_second": round(args.seed_rows / sweep_seconds) if sweep_seconds else None,
+            "delete_calls": sweep_calls,
+            "skipped": int(metrics.total("deletions_skipped_total")),
+        },
+        "replay": {
+            "updates": len(updates),
+            "ingress": args.ingress,
+            "handled": handled,
+            "rejected_by_webhook": rejected,
+            "timed_out": timed_out,
+            "seconds": round(replay_seconds, 3),
+            "updates_per_second": round(handled / replay_seconds, 1) if replay_seconds else None,
+            "latency": {
+                "all": summarize([value for values in latencies.values() for value in values]),
+                **{kind: summarize(values) for kind, values in sorted(latencies.items())},
+            },
+            "event_loop_lag": summarize(replay_lag),
+            "api_calls": dict(sorted(api.calls.items())),
+            "api_errors_injected": sum(api.errors.values()),
+        },
+        "peak_rss_mb": {
+            # ru_maxrss is in kilobytes on Linux; conversion workers count as children once they exit
+            "bot": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=500, help="updates to replay")
+    parser.add_argument("--mix", default="del=5,tojpg=2,translate=3", help="relative share of each command")
+    parser.add_argument("--chats", type=int, default=50, help="number of groups the updates come from")
+    parser.add_argument("--rate", type=float, default=0, help="updates per second (0 = all at once)")
+    parser.add_argument("--concurrency", type=int, default=8, help="CONCURRENT_UPDATES")
+    parser.add_argument("--ingress", choices=["queue", "polling", "webhook"], default="queue",
+                        help="how updates reach the bot")
+    parser.add_argument("--seed-rows", type=int, default=0, help="due deletion records to sweep first")
+    parser.add_argument("--image-size", type=int, default=1024, help="width of the image fixtures")
+    parser.add_argument("--unique-images", action="store_true", help="never repeat a /tojpg source")
+    parser.add_argument("--api-latency-ms", type=float, default=20, help="delay of every Bot API answer")
+    parser.add_argument("--flood-rate", type=float, default=0, help="share of calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of calls answered with 400")
+    parser.add_argument("--translate-latency-ms", type=float, default=150, help="delay of the stub translator")
+    parser.add_argument("--telegram-limits", action="store_true", help="keep the configured flood limits")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for each phase")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the update stream")
+    parser.add_argument("--output", help="write the JSON results to this file as well")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 1 if results["replay"]["timed_out"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
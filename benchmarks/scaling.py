@@ -0,0 +1,66 @@
+"""Update throughput of the replay benchmark at several concurrency settings.
+
+Run from the repository root:
+
+    python -m benchmarks.scaling --levels 1,2,4,8,16 --updates 500
+
+Runs benchmarks.replay once per CONCURRENT_UPDATES value, each in its own
+process since the setting is read when the bot modules are imported.
+1 is the sequential processing the bot had before. Options this script
+does not know are passed on to every replay run. Results are printed as
+JSON.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def run_replay(concurrency: int, replay_args: list) -> dict:
+    """Results of one replay run with CONCURRENT_UPDATES=concurrency"""
+    with tempfile.TemporaryDirectory(prefix="bench_scaling_") as directory:
+        output = os.path.join(directory, "replay.json")
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.replay", *replay_args,
+             "--concurrency", str(concurrency), "--output", output],
+            stdout=subprocess.DEVNULL, check=False
+        )
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,2,4,8,16", help="CONCURRENT_UPDATES values to compare")
+    parser.add_argument("--output", help="write the JSON results to this file as well")
+    args, replay_args = parser.parse_known_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    results = {"replay_args": replay_args, "levels": {}}
+    for level in levels:
+        replay = run_replay(level, replay_args)["replay"]
+        results["levels"][level] = {
+            "updates_per_second": replay["updates_per_second"],
+            "timed_out": replay["timed_out"],
+            "latency": {kind: {"p50_ms": values["p50_ms"], "p99_ms": values["p99_ms"]}
+                        for kind, values in replay["latency"].items()},
+            "event_loop_lag_p99_ms": replay["event_loop_lag"]["p99_ms"],
+        }
+    baseline = results["levels"][levels[0]]["updates_per_second"]
+    results["speedup"] = {
+        level: round(result["updates_per_second"] / baseline, 1) if baseline else None
+        for level, result in results["levels"].items()
+    }
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
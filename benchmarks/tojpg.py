@@ -0,0 +1,209 @@
+"""Measure the memory one /tojpg conversion takes, per source format.
+
+Run from the repository root:
+
+    python -m benchmarks.tojpg --width 3000 --output tojpg.json
+
+Each conversion runs in a fresh process with a fresh worker, so peak RSS
+(the kernel's high-water mark) belongs to that conversion alone; the
+bot's peak is reset through /proc before the download, so this needs
+Linux. The
+current pipeline (single download buffer or spooled file, decoding from
+it in the worker, uploading the result as is) is compared with the one
+it replaced (bytearray download, a temporary copy on disk, a BytesIO copy
+for decoding and another for the upload). Both stream the file in 1 MB
+chunks the way a download arrives. Results are printed as JSON.
+"""
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from telegram import InputFile
+from config import TOJPG_SPOOL_THRESHOLD_MB
+from utils.image_converter import HEIC_SUPPORTED, convert_to_jpg, init_worker
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _baseline_convert(image_bytes, temp_file_path: str = None) -> bytes:
+    """convert_to_jpg as it was before the single-copy pipeline"""
+    if temp_file_path and temp_file_path.lower().endswith(('.heic', '.heif')):
+        image = Image.open(temp_file_path)
+    else:
+        image = Image.open(io.BytesIO(image_bytes))
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        rgb_image = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        if image.mode in ('RGBA', 'LA'):
+            rgb_image.paste(image, mask=image.split()[-1])
+        else:
+            rgb_image.paste(image)
+        image = rgb_image
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=90, optimize=True)
+    return output.getvalue()
+
+
+def _noop():
+    return b""
+
+
+def _stream(path: str, write):
+    """Pass a file to `write` chunk by chunk, like a download"""
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            write(chunk)
+
+
+async def _baseline_pipeline(executor, path: str, work_dir: str):
+    buffer = bytearray()
+    _stream(path, buffer.extend)
+    # The original was written to disk for HEIC's sake, whatever its format
+    temp_path = os.path.join(work_dir, os.path.basename(path))
+    with open(temp_path, 'wb') as f:
+        f.write(buffer)
+    loop = asyncio.get_running_loop()
+    jpg = await loop.run_in_executor(executor, _baseline_convert, buffer, temp_path)
+    InputFile(io.BytesIO(jpg))
+
+
+async def _current_pipeline(executor, path: str, work_dir: str):
+    if os.path.getsize(path) > TOJPG_SPOOL_THRESHOLD_MB * 1024 * 1024:
+        source = os.path.join(work_dir, "spooled")
+        with open(source, 'wb') as f:
+            _stream(path, f.write)
+    else:
+        buffer = io.BytesIO()
+        _stream(path, buffer.write)
+        source = buffer.getvalue()
+    loop = asyncio.get_running_loop()
+    jpg = await loop.run_in_executor(executor, convert_to_jpg, source)
+    InputFile(jpg)
+
+
+PIPELINES = {
+    "baseline": _baseline_pipeline,
+    "current": _current_pipeline,
+    "idle": None,
+}
+
+
+def _status_mb(field: str) -> float:
+    """A memory figure of this process from /proc/self/status, in MB"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def _measure(pipeline: str, path: str, results):
+    """Run one conversion in this (fresh) process, report peak RSS growth in MB"""
+    async def run():
+        with tempfile.TemporaryDirectory(prefix="bench_tojpg_") as work_dir:
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=init_worker) as executor:
+                if PIPELINES[pipeline] is None:
+                    await asyncio.get_running_loop().run_in_executor(executor, _noop)
+                else:
+                    await PIPELINES[pipeline](executor, path, work_dir)
+
+    # Forget the peak reached while importing
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before = _status_mb("VmRSS")
+    started = time.perf_counter()
+    asyncio.run(run())
+    seconds = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux; the worker has exited and counts as a child
+    results.put({
+        "bot_mb": _status_mb("VmHWM") - before,
+        "worker_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "seconds": seconds,
+    })
+
+
+def measure(pipeline: str, path: str) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_measure, args=(pipeline, path, results))
+    process.start()
+    result = results.get(timeout=600)
+    process.join()
+    return result
+
+
+def make_fixtures(width: int, directory: str) -> dict:
+    """Photo-like (poorly compressible) fixtures, the same picture in every format"""
+    height = width * 3 // 4
+    noise = Image.frombytes("L", (width // 8, height // 8), os.urandom(width // 8 * (height // 8)))
+    image = Image.merge("RGB", [
+        Image.effect_mandelbrot((width, height), (-2, -1.2, 1, 1.2), 100),
+        noise.resize((width, height), Image.Resampling.BICUBIC),
+        Image.linear_gradient("L").resize((width, height)),
+    ])
+    formats = {"png": "PNG", "tiff": "TIFF"}
+    if HEIC_SUPPORTED:
+        formats["heic"] = "HEIF"
+
+    paths = {}
+    for name, pillow_format in formats.items():
+        paths[name] = os.path.join(directory, f"image.{name}")
+        image.save(paths[name], format=pillow_format)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=3000, help="width of the fixture images (4:3)")
+    parser.add_argument("--output", help="write the JSON results to this file as well")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_tojpg_")
+    try:
+        fixtures = make_fixtures(args.width, directory)
+        idle = measure("idle", fixtures["png"])
+        results = {
+            "width": args.width,
+            "spool_threshold_mb": TOJPG_SPOOL_THRESHOLD_MB,
+            "idle_worker_mb": round(idle["worker_mb"], 1),
+            "formats": {},
+        }
+        for name, path in fixtures.items():
+            entry = {"file_mb": round(os.path.getsize(path) / 1024 ** 2, 1)}
+            for pipeline in ("baseline", "current"):
+                result = measure(pipeline, path)
+                entry[pipeline] = {
+                    # Peak RSS added by the conversion, in the bot and in its worker
+                    "bot_peak_mb": round(result["bot_mb"], 1),
+                    "worker_peak_mb": round(result["worker_mb"] - idle["worker_mb"], 1),
+                    "seconds": round(result["seconds"], 2),
+                }
+            results["formats"][name] = entry
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
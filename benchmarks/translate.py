@@ -0,0 +1,183 @@
+"""Count the upstream round trips and connections one /translate makes.
+
+Run from the repository root:
+
+    python -m benchmarks.translate --commands 200 --latency-ms 20
+
+googletrans is pointed at a local stub of the translation service, which
+counts the HTTP requests and TCP connections it receives. The current
+TranslateHandler._translate (one client for the bot lifetime, the source
+language taken from the translate answer) is compared with the way the
+bot translated before: a new client per command and a detect request
+ahead of the translation. The stub speaks plain HTTP/1.1, so a new
+connection costs a TCP handshake here; against the real service it also
+costs a TLS handshake. Results are printed as JSON.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import httpx
+import tornado.httpserver
+import tornado.netutil
+import tornado.web
+from googletrans import Translator
+from benchmarks.replay import summarize
+
+TEXT = "Guten Morgen, wie geht es euch allen heute?"
+
+
+class StubTranslationService:
+    """Local stand-in for translate.googleapis.com, counting requests and connections"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self._server = None
+        self.port = None
+
+    async def start(self, host: str = "127.0.0.1"):
+        service = self
+
+        class Server(tornado.httpserver.HTTPServer):
+            def handle_stream(self, stream, address):
+                service.connections += 1
+                super().handle_stream(stream, address)
+
+        application = tornado.web.Application([(r"/translate_a/single", _TranslateHandler, {"service": self})])
+        sockets = tornado.netutil.bind_sockets(0, host)
+        self._server = Server(application)
+        self._server.add_sockets(sockets)
+        self.port = sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.stop()
+            await self._server.close_all_connections()
+            self._server = None
+
+    def reset(self):
+        self.requests = 0
+        self.connections = 0
+
+
+class _TranslateHandler(tornado.web.RequestHandler):
+    def initialize(self, service: StubTranslationService):
+        self.service = service
+
+    async def get(self):
+        self.service.requests += 1
+        if self.service.latency:
+            await asyncio.sleep(self.service.latency)
+        text = self.get_query_argument("q")
+        # The fields googletrans reads: translation, source language, detection
+        self.write(json.dumps([[[text[::-1], text, None, None]], None, "de", None, None, None, None, None,
+                               [["de"], None, [0.98], ["de"]]]))
+
+
+class _StubTransport(httpx.AsyncHTTPTransport):
+    """Sends every request to the stub service instead of Google"""
+
+    def __init__(self, port: int):
+        super().__init__()
+        self.port = port
+
+    async def handle_async_request(self, request):
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        return await super().handle_async_request(request)
+
+
+def make_translator(port: int) -> Translator:
+    """A googletrans Translator whose HTTP client talks to the stub"""
+    translator = Translator()
+    translator.client = httpx.AsyncClient(transport=_StubTransport(port), headers=translator.client.headers)
+    return translator
+
+
+async def _baseline_translate(port: int, text: str, source_language: str, target_language: str):
+    """TranslateHandler._translate as it was before the shared client"""
+    async with make_translator(port) as translator:
+        if source_language == "auto":
+            detected = await translator.detect(text)
+            source_language = detected.lang
+
+        if source_language == target_language:
+            return text, source_language
+
+        translation = await translator.translate(text, src=source_language, dest=target_language)
+        return translation.text, translation.src
+
+
+async def _run(service: StubTranslationService, translate, commands: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+
+    async def command():
+        async with semaphore:
+            started = time.perf_counter()
+            await translate(TEXT, "auto", "en")
+            durations.append(time.perf_counter() - started)
+
+    service.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(command() for _ in range(commands)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests_per_command": round(service.requests / commands, 2),
+        "connections_per_command": round(service.connections / commands, 2),
+        "commands_per_second": round(commands / elapsed),
+        "latency": summarize(durations),
+    }
+
+
+async def benchmark(args) -> dict:
+    from handlers.translate import TranslateHandler
+
+    service = StubTranslationService(args.latency_ms / 1000)
+    await service.start()
+    try:
+        baseline = await _run(
+            service,
+            lambda text, source, target: _baseline_translate(service.port, text, source, target),
+            args.commands, args.concurrency
+        )
+
+        handler = TranslateHandler()
+        handler._translator = make_translator(service.port)
+        try:
+            current = await _run(service, handler._translate, args.commands, args.concurrency)
+        finally:
+            await handler.on_shutdown()
+    finally:
+        await service.stop()
+
+    return {
+        "commands": args.commands,
+        "concurrency": args.concurrency,
+        "service_latency_ms": args.latency_ms,
+        "client_per_command_with_detect": baseline,
+        "shared_client": current,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=200, help="/translate commands to run")
+    parser.add_argument("--concurrency", type=int, default=1, help="commands in flight at once")
+    parser.add_argument("--latency-ms", type=float, default=20, help="stub service answer delay")
+    parser.add_argument("--output", help="write the JSON results to this file as well")
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
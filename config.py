@@ -1,25 +1,137 @@
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Bot Configuration
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-DB_PATH = os.getenv("DB_PATH", "messages.db")
-ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", "0"))
-ALLOWED_GROUPS = list(map(int, os.getenv("ALLOWED_GROUPS", "").split(","))) if os.getenv("ALLOWED_GROUPS") else []
-
-# Language
-LANGUAGE = os.getenv("LANGUAGE", "en")
-
-# Translation Configuration
-DEFAULT_TRANSLATE_TO = os.getenv("DEFAULT_TRANSLATE_TO", "en")
-TRANSLATE_FROM = os.getenv("TRANSLATE_FROM", "auto")
-
-# If True, the bot will only work in ALLOWED_GROUPS groups
-# If False, the bot will work in all groups
-RESTRICT_TO_ALLOWED_GROUPS = True
-
-# Handler Configurations
-DELETE_AFTER_HOURS = 24 #24H
-SUPPORTED_IMAGE_FORMATS = ['.png', '.gif', '.bmp', '.webp', '.tiff', '.heic', '.heif', '.avif', '.jpg']
\ No newline at end of file
+import os
+import socket
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Bot Configuration
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+DB_PATH = os.getenv("DB_PATH", "messages.db")
+ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", "0"))
+ALLOWED_GROUPS = list(map(int, os.getenv("ALLOWED_GROUPS", "").split(","))) if os.getenv("ALLOWED_GROUPS") else []
+
+# Bot API server, e.g. a self-hosted telegram-bot-api instance (unset = api.telegram.org)
+BOT_API_URL = os.getenv("BOT_API_URL")
+
+# Update delivery: "polling" (getUpdates) or "webhook" (Telegram posts to a local HTTP server)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Public HTTPS URL Telegram posts updates to, usually a reverse proxy in front of the local server
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# Telegram sends this in the X-Telegram-Bot-Api-Secret-Token header; requests
+# without it are rejected (a random token is generated when left empty)
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+
+# Prometheus metrics served on http://METRICS_LISTEN:METRICS_PORT/metrics (0 = disabled)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+
+# Database Configuration
+# Where scheduled deletions are stored (sqlite: the database at DB_PATH)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+# Name this bot instance claims deletion records under; must differ between
+# instances sharing a database
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Instances sharing a database are told apart by setting INSTANCE_ID
+SHARED_DATABASE = bool(os.getenv("INSTANCE_ID"))
+# Number of prepared statements kept per SQLite connection
+DB_CACHED_STATEMENTS = 128
+
+# Language
+LANGUAGE = os.getenv("LANGUAGE", "en")
+
+# Translation Configuration
+DEFAULT_TRANSLATE_TO = os.getenv("DEFAULT_TRANSLATE_TO", "en")
+TRANSLATE_FROM = os.getenv("TRANSLATE_FROM", "auto")
+# Translations kept in memory, and how long cached translations stay valid
+TRANSLATION_CACHE_SIZE = 1000
+TRANSLATION_CACHE_TTL_HOURS = 24
+# Offline language detection is trusted (no upstream detection) above this confidence
+LANGUAGE_DETECTION_MIN_CONFIDENCE = 0.9
+# Long texts are translated in chunks of at most this many characters
+TRANSLATE_CHUNK_SIZE = 1500
+# Maximum number of translation requests in flight at once
+TRANSLATE_MAX_CONCURRENCY = 4
+
+# Updates processed at the same time (1 = one after another); a chat's
+# updates always run in the order they arrived
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "8"))
+# Lower limits for individual commands, applied within CONCURRENT_UPDATES
+COMMAND_CONCURRENCY = {
+    "tojpg": 4,
+    "translate": 8,
+}
+
+# Outgoing Bot API requests, kept within Telegram's flood limits
+RATE_LIMIT_GLOBAL_PER_SECOND = 30
+RATE_LIMIT_GROUP_PER_MINUTE = 20
+RATE_LIMIT_PRIVATE_PER_SECOND = 1
+# Times a request is queued again after Telegram answers with RetryAfter
+RATE_LIMIT_MAX_RETRIES = 3
+
+# If True, the bot will only work in allowed groups (ALLOWED_GROUPS and those added with /allow)
+# If False, the bot will work in all groups
+RESTRICT_TO_ALLOWED_GROUPS = True
+# How long a group admin lookup (getChatMember) is cached
+ADMIN_CACHE_TTL_SECONDS = 600
+# With a shared database, the allowed groups are re-read this often, so /allow
+# and /disallow sent to another bot instance apply here too (0 = never)
+ACCESS_RELOAD_SECONDS = 60 if SHARED_DATABASE else 0
+
+# Handler Configurations
+DELETE_AFTER_HOURS = 24 #24H
+# Maximum number of expired records loaded per page during a deletion sweep
+EXPIRY_SWEEP_PAGE_SIZE = 500
+# Number of upcoming deletion deadlines kept in memory by the scheduler
+DEADLINE_PRELOAD_SIZE = 1000
+# Delay before retrying a deletion sweep that failed
+SWEEP_RETRY_SECONDS = 30
+# How long a sweep keeps the records it claimed; records of an instance that
+# crashed are swept by another one after this (must outlast a page of deletions)
+SWEEP_LEASE_SECONDS = 300
+# With a shared database, deadlines are re-read this often, so records scheduled
+# by other bot instances, or left behind by a crashed one, are swept too (0 = never)
+DEADLINE_RELOAD_SECONDS = 60 if SHARED_DATABASE else 0
+# Telegram lets bots delete group messages only this long after they were sent
+DELETION_WINDOW_HOURS = 48
+# On startup, drain deletions that fell due during downtime in recovery mode:
+# most urgent first, chats in parallel, with a summary for the admin
+DELETION_RECOVERY = os.getenv("DELETION_RECOVERY", "true").lower() != "false"
+# Lifetime of bot notices (errors, confirmations) before they are deleted
+EPHEMERAL_MESSAGE_SECONDS = 10
+# Notice deadlines are rounded up to this step so close ones are deleted together
+EPHEMERAL_BATCH_SECONDS = 5
+SUPPORTED_IMAGE_FORMATS = ['.png', '.gif', '.bmp', '.webp', '.tiff', '.heic', '.heif', '.avif', '.jpg']
+# Worker processes used for image conversion
+TOJPG_WORKERS = 2
+# Conversions allowed to wait for a free worker before new ones are refused
+TOJPG_MAX_QUEUE = 8
+# Maximum time a single conversion may take
+TOJPG_TIMEOUT_SECONDS = 60
+# Files larger than this are downloaded to a temporary file instead of memory
+TOJPG_SPOOL_THRESHOLD_MB = 8
+# Directory for the on-disk cache of converted images (unset = disabled)
+TOJPG_CACHE_DIR = os.getenv("TOJPG_CACHE_DIR")
+# Size cap of the on-disk conversion cache
+TOJPG_CACHE_MAX_MB = 200
+# Album items downloaded and converted at the same time
+TOJPG_ALBUM_CONCURRENCY = 4
+# Number of recent albums remembered for /tojpg
+TOJPG_ALBUM_CACHE_SIZE = 200
+# Default encoding profile for /tojpg: fast, balanced, smallest or a target size such as 500k
+TOJPG_DEFAULT_PROFILE = os.getenv("TOJPG_DEFAULT_PROFILE", "balanced")
+# Per-group encoding profiles, e.g. "-1001234567890:smallest,-1009876543210:fast"
+TOJPG_GROUP_PROFILES = dict(
+    (int(chat_id), profile)
+    for chat_id, profile in (item.split(":") for item in os.getenv("TOJPG_GROUP_PROFILES", "").split(",") if item)
+)
+# Files larger than this are refused before download
+TOJPG_MAX_FILE_MB = 20
+# Images with more pixels than this are refused before decoding
+TOJPG_MAX_MEGAPIXELS = 50
+# Decode oversized JPEGs at a reduced scale instead of refusing them
+TOJPG_DOWNSCALE_OVERSIZED = True
+# Address space limit of each conversion worker (0 = unlimited)
+TOJPG_WORKER_MEMORY_MB = 1536
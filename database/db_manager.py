@@ -1,40 +1,524 @@
-import aiosqlite
-from config import DB_PATH
-
-async def init_db():
-    """Initial setup for the database"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER NOT NULL,
-                message_id INTEGER NOT NULL,
-                delete_at TEXT NOT NULL,
-                handler_name TEXT DEFAULT 'del_after_24'
-            )
-        """)
-        await db.commit()
-
-async def save_message_for_deletion(chat_id: int, message_id: int, delete_at: str, handler_name: str = 'del_after_24'):
-    """Save a message for later deletion"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO messages (chat_id, message_id, delete_at, handler_name) VALUES (?, ?, ?, ?)",
-            (chat_id, message_id, delete_at, handler_name),
-        )
-        await db.commit()
-
-async def get_expired_messages(current_time: str):
-    """Retrieve messages that are expired"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute(
-            "SELECT id, chat_id, message_id FROM messages WHERE delete_at <= ?",
-            (current_time,)
-        ) as cursor:
-            return await cursor.fetchall()
-
-async def delete_message_record(message_record_id: int):
-    """Delete a message record from the database"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM messages WHERE id = ?", (message_record_id,))
-        await db.commit()
+import json
+import logging
+import aiosqlite
+from config import DB_PATH, DB_CACHED_STATEMENTS
+from utils.metrics import metrics
+
+# Shared connection, opened once by init_db() and closed by close_db()
+_db = None
+
+# Pragmas applied once to the shared connection
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def _get_db() -> aiosqlite.Connection:
+    """Return the shared connection"""
+    if _db is None:
+        raise RuntimeError("Database is not initialized, call init_db() first")
+    return _db
+
+
+async def _migration_1_create_messages(db):
+    """Create the original messages table"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            delete_at TEXT NOT NULL,
+            handler_name TEXT DEFAULT 'del_after_24'
+        )
+    """)
+
+
+async def _migration_2_epoch_delete_at(db):
+    """Store delete_at as epoch milliseconds, index it and make (chat_id, message_id) unique"""
+    await db.execute("""
+        CREATE TABLE messages_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            delete_at INTEGER NOT NULL,
+            handler_name TEXT NOT NULL DEFAULT 'del',
+            UNIQUE (chat_id, message_id)
+        )
+    """)
+    # julianday() understands the ISO-8601 timestamps (with any UTC offset) written so far.
+    # Old 'del_after_{hours}h' names are shortened to 'del_{seconds}s', and for
+    # duplicated messages the most recent request wins.
+    await db.execute("""
+        INSERT OR REPLACE INTO messages_new (chat_id, message_id, delete_at, handler_name)
+        SELECT
+            chat_id,
+            message_id,
+            CAST(ROUND((julianday(delete_at) - 2440587.5) * 86400000) AS INTEGER),
+            CASE
+                WHEN handler_name LIKE 'del\\_after\\_%h' ESCAPE '\\' THEN
+                    'del_' || CAST(ROUND(CAST(substr(handler_name, 11, length(handler_name) - 11) AS REAL) * 3600) AS INTEGER) || 's'
+                ELSE COALESCE(handler_name, 'del')
+            END
+        FROM messages
+        WHERE julianday(delete_at) IS NOT NULL
+        ORDER BY id
+    """)
+    await db.execute("DROP TABLE messages")
+    await db.execute("ALTER TABLE messages_new RENAME TO messages")
+    await db.execute("CREATE INDEX idx_messages_delete_at ON messages (delete_at)")
+
+
+async def _migration_3_conversion_cache(db):
+    """Add the table mapping converted images to their uploaded Telegram file_id"""
+    await db.execute("""
+        CREATE TABLE conversion_cache (
+            cache_key TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+async def _migration_4_translation_cache(db):
+    """Add the persistent translation cache"""
+    await db.execute("""
+        CREATE TABLE translation_cache (
+            cache_key TEXT PRIMARY KEY,
+            translated_text TEXT NOT NULL,
+            source_language TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    await db.execute("CREATE INDEX idx_translation_cache_created_at ON translation_cache (created_at)")
+
+
+async def _migration_5_chat_settings(db):
+    """Add per-chat settings, starting with the UI language"""
+    await db.execute("""
+        CREATE TABLE chat_settings (
+            chat_id INTEGER PRIMARY KEY,
+            language TEXT
+        )
+    """)
+
+
+async def _migration_6_allowed_groups(db):
+    """Keep the allowed groups, and their rules, in the database"""
+    await db.execute("""
+        CREATE TABLE allowed_groups (
+            chat_id INTEGER PRIMARY KEY,
+            del_admins_only INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+async def _migration_7_deletion_leases(db):
+    """Let a bot instance claim due deletion records for a limited time (lease)"""
+    await db.execute("ALTER TABLE messages ADD COLUMN claimed_by TEXT")
+    await db.execute("ALTER TABLE messages ADD COLUMN claimed_until INTEGER")
+
+
+async def _migration_8_sent_at(db):
+    """Remember when a message was sent, to know until when Telegram lets us delete it"""
+    await db.execute("ALTER TABLE messages ADD COLUMN sent_at INTEGER")
+    # Recovery sweeps claim records by deletion cutoff; an unknown send time counts as the deadline
+    await db.execute("CREATE INDEX idx_messages_cutoff ON messages (COALESCE(sent_at, delete_at))")
+
+
+async def _migration_9_disallowed_groups(db):
+    """Remember groups disallowed at runtime, so the configured list does not bring them back"""
+    await db.execute("CREATE TABLE disallowed_groups (chat_id INTEGER PRIMARY KEY)")
+
+
+# Schema migrations, applied in order; a migration's version is its position in this list
+MIGRATIONS = [
+    _migration_1_create_messages,
+    _migration_2_epoch_delete_at,
+    _migration_3_conversion_cache,
+    _migration_4_translation_cache,
+    _migration_5_chat_settings,
+    _migration_6_allowed_groups,
+    _migration_7_deletion_leases,
+    _migration_8_sent_at,
+    _migration_9_disallowed_groups,
+]
+
+
+async def _get_schema_version(db) -> int:
+    """Latest applied migration, 0 for a new database"""
+    async with db.execute("SELECT MAX(version) FROM schema_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0] or 0
+
+
+async def _apply_migrations(db):
+    """Bring the database schema up to the latest version
+
+    Bot instances sharing the database may start at the same time, so each
+    migration takes the write lock first and checks again that no other
+    instance has applied it in the meantime.
+    """
+    await db.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    current_version = await _get_schema_version(db)
+
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version <= current_version:
+            continue
+
+        # Each migration and its version bump run in one transaction
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            if await _get_schema_version(db) >= version:
+                await db.rollback()
+                continue
+            await migration(db)
+            await db.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+        logging.info(f"Database migrated to schema version {version}")
+
+
+async def init_db():
+    """Initial setup for the database"""
+    global _db
+    if _db is not None:
+        return
+
+    # sqlite3 keeps prepared statements per connection, keyed by SQL text,
+    # so the constant queries below are compiled only once
+    _db = await aiosqlite.connect(DB_PATH, cached_statements=DB_CACHED_STATEMENTS)
+    for pragma in _PRAGMAS:
+        await _db.execute(pragma)
+
+    await _apply_migrations(_db)
+
+
+async def close_db():
+    """Close the shared connection"""
+    global _db
+    if _db is None:
+        return
+
+    db, _db = _db, None
+    await db.close()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def save_message_for_deletion(chat_id: int, message_id: int, delete_at: int, handler_name: str = 'del',
+                                    sent_at: int = None):
+    """Save a message for later deletion (delete_at and sent_at in epoch milliseconds)
+
+    Scheduling the same message again replaces its previous deadline and
+    drops any claim on it.
+    """
+    db = _get_db()
+    await db.execute(
+        """
+        INSERT INTO messages (chat_id, message_id, delete_at, handler_name, sent_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (chat_id, message_id) DO UPDATE SET
+            delete_at = excluded.delete_at,
+            handler_name = excluded.handler_name,
+            sent_at = excluded.sent_at,
+            claimed_by = NULL,
+            claimed_until = NULL
+        """,
+        (chat_id, message_id, delete_at, handler_name, sent_at),
+    )
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def get_expired_messages(current_time: int, limit: int = None):
+    """Retrieve messages expired at `current_time` (epoch ms), oldest first (at most `limit` rows)"""
+    async with _get_db().execute(
+        "SELECT id, chat_id, message_id FROM messages WHERE delete_at <= ? ORDER BY delete_at LIMIT ?",
+        (current_time, -1 if limit is None else limit)
+    ) as cursor:
+        return await cursor.fetchall()
+
+
+_CLAIM_SQL = """
+    UPDATE messages SET claimed_by = ?, claimed_until = ?
+    WHERE id IN (
+        SELECT id FROM messages
+        WHERE delete_at <= ? AND (claimed_until IS NULL OR claimed_until <= ?)
+        ORDER BY {order}
+        LIMIT ?
+    )
+    RETURNING id, chat_id, message_id, sent_at
+"""
+_CLAIM_BY_DEADLINE_SQL = _CLAIM_SQL.format(order="delete_at")
+_CLAIM_BY_CUTOFF_SQL = _CLAIM_SQL.format(order="COALESCE(sent_at, delete_at)")
+
+
+@metrics.timed("db_query_duration_seconds")
+async def claim_expired_messages(owner: str, current_time: int, lease_until: int, limit: int = None,
+                                 by_cutoff: bool = False):
+    """Claim messages expired at `current_time` for `owner` until `lease_until` (epoch ms)
+
+    Returns (id, chat_id, message_id, sent_at) rows, oldest deadline first,
+    or with `by_cutoff` oldest message first (the first to become
+    undeletable). Records claimed by another owner are skipped until their
+    lease runs out. Selecting and claiming is a single statement, so two bot
+    instances sharing the database never claim the same record.
+    """
+    db = _get_db()
+    async with db.execute(
+        _CLAIM_BY_CUTOFF_SQL if by_cutoff else _CLAIM_BY_DEADLINE_SQL,
+        (owner, lease_until, current_time, current_time, -1 if limit is None else limit)
+    ) as cursor:
+        rows = await cursor.fetchall()
+    await db.commit()
+    return rows
+
+
+@metrics.timed("db_query_duration_seconds")
+async def delete_claimed_messages(owner: str, message_record_ids: list[int]):
+    """Delete message records still claimed by `owner`
+
+    Records rescheduled or claimed by another owner meanwhile are kept.
+    """
+    if not message_record_ids:
+        return
+
+    db = _get_db()
+    await db.execute(
+        "DELETE FROM messages WHERE id IN (SELECT value FROM json_each(?)) AND claimed_by = ?",
+        (json.dumps(message_record_ids), owner)
+    )
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def release_claimed_messages(owner: str, message_record_ids: list[int]):
+    """Give up `owner`'s claim on message records so they can be swept again"""
+    if not message_record_ids:
+        return
+
+    db = _get_db()
+    await db.execute(
+        """
+        UPDATE messages SET claimed_by = NULL, claimed_until = NULL
+        WHERE id IN (SELECT value FROM json_each(?)) AND claimed_by = ?
+        """,
+        (json.dumps(message_record_ids), owner)
+    )
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def release_all_claims() -> int:
+    """Give up every claim on message records, returns how many were claimed"""
+    db = _get_db()
+    cursor = await db.execute(
+        "UPDATE messages SET claimed_by = NULL, claimed_until = NULL WHERE claimed_by IS NOT NULL"
+    )
+    await db.commit()
+    return cursor.rowcount
+
+
+@metrics.timed("db_query_duration_seconds")
+async def discard_undeletable_messages(sent_before: int, current_time: int) -> int:
+    """Delete records of due messages sent before `sent_before` (epoch ms), returns how many
+
+    Records claimed by a sweep are left to it.
+    """
+    db = _get_db()
+    cursor = await db.execute(
+        """
+        DELETE FROM messages
+        WHERE delete_at <= ? AND sent_at <= ? AND (claimed_until IS NULL OR claimed_until <= ?)
+        """,
+        (current_time, sent_before, current_time)
+    )
+    await db.commit()
+    return cursor.rowcount
+
+
+@metrics.timed("db_query_duration_seconds")
+async def get_upcoming_deadlines(after: int = None, limit: int = None) -> list[int]:
+    """Retrieve the nearest distinct deletion deadlines (epoch ms) after `after`"""
+    async with _get_db().execute(
+        "SELECT DISTINCT delete_at FROM messages WHERE delete_at > ? ORDER BY delete_at LIMIT ?",
+        (-1 if after is None else after, -1 if limit is None else limit)
+    ) as cursor:
+        return [row[0] for row in await cursor.fetchall()]
+
+
+@metrics.timed("db_query_duration_seconds")
+async def count_pending_messages(current_time: int) -> tuple[int, int]:
+    """Count messages scheduled for deletion, and those already due at `current_time` (epoch ms)"""
+    async with _get_db().execute(
+        "SELECT COUNT(*), COALESCE(SUM(delete_at <= ?), 0) FROM messages",
+        (current_time,)
+    ) as cursor:
+        pending, overdue = await cursor.fetchone()
+    return pending, overdue
+
+
+@metrics.timed("db_query_duration_seconds")
+async def delete_message_record(message_record_id: int):
+    """Delete a message record from the database"""
+    db = _get_db()
+    await db.execute("DELETE FROM messages WHERE id = ?", (message_record_id,))
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def delete_message_records(message_record_ids: list[int]):
+    """Delete several message records in a single transaction"""
+    if not message_record_ids:
+        return
+
+    # Pass the ids as one JSON array so the statement text (and its cached
+    # prepared statement) is the same whatever the batch size
+    db = _get_db()
+    await db.execute(
+        "DELETE FROM messages WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(message_record_ids),)
+    )
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def get_cached_file_id(cache_key: str) -> str | None:
+    """Retrieve the file_id stored for a converted image"""
+    async with _get_db().execute(
+        "SELECT file_id FROM conversion_cache WHERE cache_key = ?",
+        (cache_key,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else None
+
+
+@metrics.timed("db_query_duration_seconds")
+async def save_cached_file_id(cache_key: str, file_id: str):
+    """Store the file_id of a converted image"""
+    db = _get_db()
+    await db.execute(
+        "INSERT OR REPLACE INTO conversion_cache (cache_key, file_id) VALUES (?, ?)",
+        (cache_key, file_id)
+    )
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def delete_cached_file_id(cache_key: str):
+    """Forget the file_id of a converted image"""
+    db = _get_db()
+    await db.execute("DELETE FROM conversion_cache WHERE cache_key = ?", (cache_key,))
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def get_cached_translation(cache_key: str, not_before: int) -> tuple[str, str] | None:
+    """Retrieve a cached (translated_text, source_language) stored at or after `not_before` (epoch ms)"""
+    async with _get_db().execute(
+        "SELECT translated_text, source_language FROM translation_cache WHERE cache_key = ? AND created_at >= ?",
+        (cache_key, not_before)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return tuple(row) if row else None
+
+
+@metrics.timed("db_query_duration_seconds")
+async def save_cached_translation(cache_key: str, translated_text: str, source_language: str, created_at: int):
+    """Store a translation in the persistent cache"""
+    db = _get_db()
+    await db.execute(
+        "INSERT OR REPLACE INTO translation_cache (cache_key, translated_text, source_language, created_at) "
+        "VALUES (?, ?, ?, ?)",
+        (cache_key, translated_text, source_language, created_at)
+    )
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def prune_translation_cache(not_before: int):
+    """Delete cached translations stored before `not_before` (epoch ms)"""
+    db = _get_db()
+    await db.execute("DELETE FROM translation_cache WHERE created_at < ?", (not_before,))
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def get_chat_language(chat_id: int) -> str | None:
+    """Retrieve the UI language chosen for a chat"""
+    async with _get_db().execute(
+        "SELECT language FROM chat_settings WHERE chat_id = ?",
+        (chat_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else None
+
+
+@metrics.timed("db_query_duration_seconds")
+async def save_chat_language(chat_id: int, language: str):
+    """Store the UI language chosen for a chat"""
+    db = _get_db()
+    await db.execute(
+        """
+        INSERT INTO chat_settings (chat_id, language) VALUES (?, ?)
+        ON CONFLICT (chat_id) DO UPDATE SET language = excluded.language
+        """,
+        (chat_id, language)
+    )
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def get_allowed_groups() -> list[tuple[int, bool]]:
+    """Retrieve the allowed groups as (chat_id, del_admins_only)"""
+    async with _get_db().execute("SELECT chat_id, del_admins_only FROM allowed_groups") as cursor:
+        return [(chat_id, bool(del_admins_only)) for chat_id, del_admins_only in await cursor.fetchall()]
+
+
+@metrics.timed("db_query_duration_seconds")
+async def add_allowed_groups(chat_ids: list[int]):
+    """Allow configured groups, except those disallowed at runtime, keeping the rules of those already allowed"""
+    if not chat_ids:
+        return
+
+    db = _get_db()
+    await db.executemany(
+        """
+        INSERT OR IGNORE INTO allowed_groups (chat_id)
+        SELECT ? WHERE NOT EXISTS (SELECT 1 FROM disallowed_groups WHERE chat_id = ?)
+        """,
+        [(chat_id, chat_id) for chat_id in chat_ids]
+    )
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def save_allowed_group(chat_id: int):
+    """Allow a group, even one disallowed before"""
+    db = _get_db()
+    await db.execute("DELETE FROM disallowed_groups WHERE chat_id = ?", (chat_id,))
+    await db.execute("INSERT OR IGNORE INTO allowed_groups (chat_id) VALUES (?)", (chat_id,))
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def delete_allowed_group(chat_id: int):
+    """Disallow a group, for good: it is no longer allowed by the configured list either"""
+    db = _get_db()
+    await db.execute("DELETE FROM allowed_groups WHERE chat_id = ?", (chat_id,))
+    await db.execute("INSERT OR IGNORE INTO disallowed_groups (chat_id) VALUES (?)", (chat_id,))
+    await db.commit()
+
+
+@metrics.timed("db_query_duration_seconds")
+async def set_del_admins_only(chat_id: int, enabled: bool):
+    """Restrict /del in a group to its admins, or lift the restriction"""
+    db = _get_db()
+    await db.execute(
+        "UPDATE allowed_groups SET del_admins_only = ? WHERE chat_id = ?",
+        (int(enabled), chat_id)
+    )
+    await db.commit()
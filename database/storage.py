@@ -0,0 +1,97 @@
+from abc import ABC, abstractmethod
+from config import STORAGE_BACKEND
+from database.db_manager import (
+    save_message_for_deletion, get_upcoming_deadlines, count_pending_messages, claim_expired_messages,
+    delete_claimed_messages, release_claimed_messages, release_all_claims, discard_undeletable_messages
+)
+
+
+class DeletionStorage(ABC):
+    """Storage of scheduled deletions, shared by every bot instance sweeping them.
+
+    Sweeps never read due records directly: they claim them for a while
+    (a lease), delete the messages, then complete or release the claim. A
+    claim that is neither completed nor released (the instance crashed)
+    expires, and another instance picks the records up.
+    """
+
+    @abstractmethod
+    async def schedule(self, chat_id: int, message_id: int, delete_at: int, handler_name: str, sent_at: int = None):
+        """Schedule a message sent at `sent_at` for deletion at `delete_at` (epoch ms), replacing any earlier deadline"""
+        pass
+
+    @abstractmethod
+    async def upcoming_deadlines(self, after: int = None, limit: int = None) -> list[int]:
+        """Nearest distinct deadlines (epoch ms) after `after`"""
+        pass
+
+    @abstractmethod
+    async def count_pending(self, current_time: int) -> tuple[int, int]:
+        """Number of scheduled messages, and of those already due at `current_time`"""
+        pass
+
+    @abstractmethod
+    async def claim_due(self, owner: str, current_time: int, lease_until: int, limit: int,
+                        by_cutoff: bool = False) -> list[tuple]:
+        """Atomically claim up to `limit` due, unclaimed records as (id, chat_id, message_id, sent_at)
+
+        Records come oldest deadline first, or with `by_cutoff` oldest message first.
+        """
+        pass
+
+    @abstractmethod
+    async def complete(self, owner: str, record_ids: list[int]):
+        """Drop records `owner` has handled"""
+        pass
+
+    @abstractmethod
+    async def release(self, owner: str, record_ids: list[int]):
+        """Hand records back unhandled, to be claimed again"""
+        pass
+
+    @abstractmethod
+    async def release_all(self) -> int:
+        """Hand back every claimed record, returns how many; only safe while no other instance sweeps"""
+        pass
+
+    @abstractmethod
+    async def discard_undeletable(self, sent_before: int, current_time: int) -> int:
+        """Drop unclaimed due records of messages sent before `sent_before`, returns how many"""
+        pass
+
+
+class SQLiteDeletionStorage(DeletionStorage):
+    """Deletions kept in the bot's SQLite database (the messages table)"""
+
+    async def schedule(self, chat_id, message_id, delete_at, handler_name, sent_at=None):
+        await save_message_for_deletion(chat_id, message_id, delete_at, handler_name, sent_at)
+
+    async def upcoming_deadlines(self, after=None, limit=None):
+        return await get_upcoming_deadlines(after, limit)
+
+    async def count_pending(self, current_time):
+        return await count_pending_messages(current_time)
+
+    async def claim_due(self, owner, current_time, lease_until, limit, by_cutoff=False):
+        return await claim_expired_messages(owner, current_time, lease_until, limit, by_cutoff)
+
+    async def complete(self, owner, record_ids):
+        await delete_claimed_messages(owner, record_ids)
+
+    async def release(self, owner, record_ids):
+        await release_claimed_messages(owner, record_ids)
+
+    async def release_all(self):
+        return await release_all_claims()
+
+    async def discard_undeletable(self, sent_before, current_time):
+        return await discard_undeletable_messages(sent_before, current_time)
+
+
+# Available storage backends, selected with STORAGE_BACKEND
+STORAGE_BACKENDS = {
+    "sqlite": SQLiteDeletionStorage,
+}
+
+# Global deletion storage
+deletion_storage = STORAGE_BACKENDS[STORAGE_BACKEND]()
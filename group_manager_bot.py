@@ -1,225 +1,492 @@
-import asyncio
-import logging
-import signal
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
-from config import BOT_TOKEN, DELETE_AFTER_HOURS, ADMIN_USER_ID, ALLOWED_GROUPS, RESTRICT_TO_ALLOWED_GROUPS, LANGUAGE
-from database.db_manager import init_db
-from handlers.del_message import DelMessageHandler, check_and_delete_expired_messages
-from handlers.to_jpg import ToJpgHandler
-from handlers.translate import TranslateHandler
-from translations import init_translator, t
-
-# Configure logging
-logging.basicConfig(
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
-
-
-class TelegramBot:
-    def __init__(self):
-        self.app = None
-        self.handlers = []
-        self.should_stop = False
-        self._register_handlers()
-
-    def _register_handlers(self):
-        """Register all handlers"""
-        self.handlers = [
-            DelMessageHandler(),
-            ToJpgHandler(),
-            TranslateHandler(),
-            # Add other handlers here
-        ]
-
-    def _is_group_allowed(self, chat_id):
-        """Check if the group is allowed"""
-        if not RESTRICT_TO_ALLOWED_GROUPS:
-            return True
-
-        # If private chat (positive ID), always allowed for admin
-        if chat_id > 0:
-            return True
-
-        # For groups, check the allowed list
-        return chat_id in ALLOWED_GROUPS
-
-    async def _check_permissions(self, update, context):
-        """Check access permissions"""
-        chat_id = update.effective_chat.id
-        user_id = update.effective_user.id
-
-        # In private chat, only admin is allowed
-        if chat_id > 0:
-            if user_id != ADMIN_USER_ID:
-                await update.message.reply_text(
-                    t("permissions.not_authorized_user")
-                )
-                return False
-
-        # In groups, check the allowed groups list
-        elif not self._is_group_allowed(chat_id):
-            await update.message.reply_text(
-                t("permissions.not_authorized_group", chat_id=chat_id)
-            )
-            logging.warning(f"Unauthorized request from group {chat_id} by user {user_id}")
-            return False
-
-        return True
-
-    async def setup(self):
-        """Setup the bot"""
-        await init_db()
-
-        self.app = ApplicationBuilder().token(BOT_TOKEN).build()
-
-        # Add start command
-        self.app.add_handler(CommandHandler("start", self._start_command))
-
-        # Add command to show group ID
-        self.app.add_handler(CommandHandler("groupid", self._groupid_command))
-
-        # Add handlers
-        for handler in self.handlers:
-            command_handler = CommandHandler(
-                handler.get_command_name(),
-                self._wrap_handler_with_permission_check(handler.handle)
-            )
-            self.app.add_handler(command_handler)
-            logging.info(f"Handler '{handler.name}' registered for /{handler.get_command_name()}")
-
-        # Setup periodic jobs
-        self._setup_jobs()
-
-    def _wrap_handler_with_permission_check(self, original_handler):
-        """Wrap handlers with permission check"""
-
-        async def wrapped_handler(update, context):
-            # Check permissions
-            if not await self._check_permissions(update, context):
-                return
-
-            # Execute the original handler
-            return await original_handler(update, context)
-
-        return wrapped_handler
-
-    def _setup_jobs(self):
-        """Setup periodic jobs"""
-        # For delete message handler - if time is less than 1 minute, check every 10 seconds
-        check_interval = 10 if DELETE_AFTER_HOURS < 0.0167 else 60
-        self.app.job_queue.run_repeating(
-            check_and_delete_expired_messages,
-            interval=check_interval,
-            first=10
-        )
-
-    async def _start_command(self, update, context):
-        """Start command"""
-        # Check permissions
-        if not await self._check_permissions(update, context):
-            return
-
-        commands = []
-        for handler in self.handlers:
-            commands.append(f"/{handler.get_command_name()} - {handler.name}")
-
-        command_list = "\n".join(commands)
-
-        chat_type = t("status.group") if update.effective_chat.id < 0 else t("status.private_chat")
-        chat_id = update.effective_chat.id
-
-        message = (
-            f"{t('bot.greeting')}\n\n"
-            f"{t('bot.current_environment', chat_type=chat_type)}\n"
-            f"{t('bot.chat_id', chat_id=chat_id)}\n\n"
-            f"{t('bot.available_commands')}\n{command_list}\n\n"
-            f"{t('bot.usage_hint')}"
-        )
-
-        await update.message.reply_text(message)
-
-    async def _groupid_command(self, update, context):
-        """Show group or chat ID"""
-        chat_id = update.effective_chat.id
-        user_id = update.effective_user.id
-
-        # Only admin can see this command
-        if user_id != ADMIN_USER_ID:
-            await update.message.reply_text(t("permissions.not_authorized_command"))
-            return
-
-        chat_type = t("status.group") if chat_id < 0 else t("status.private_chat")
-        is_allowed = t("status.allowed") if self._is_group_allowed(chat_id) else t("status.not_allowed")
-
-        message = (
-            f"{t('group_info.chat_information')}\n\n"
-            f"{t('group_info.type', chat_type=chat_type)}\n"
-            f"{t('group_info.id', chat_id=chat_id)}\n"
-            f"{t('group_info.status', status=is_allowed)}\n\n"
-            f"{t('group_info.add_hint')}"
-        )
-
-        await update.message.reply_text(message)
-
-    async def run(self):
-        """Run the bot"""
-        await self.setup()
-
-        logging.info(t("bot.ready"))
-
-        restriction_status = t("status.enabled") if RESTRICT_TO_ALLOWED_GROUPS else t("status.disabled")
-        logging.info(t("bot.group_restrictions", status=restriction_status))
-
-        if RESTRICT_TO_ALLOWED_GROUPS and ALLOWED_GROUPS:
-            logging.info(t("bot.allowed_groups", groups=ALLOWED_GROUPS))
-
-        # Initialize the app
-        await self.app.initialize()
-        await self.app.start()
-        await self.app.updater.start_polling()
-
-        # Wait until we should stop
-        while not self.should_stop:
-            await asyncio.sleep(1)
-
-        # Clean shutdown
-        logging.info(t("bot.stopping"))
-        await self.app.updater.stop()
-        await self.app.stop()
-        await self.app.shutdown()
-        logging.info(t("bot.stopped"))
-
-    def stop(self):
-        """Stop the bot"""
-        self.should_stop = True
-
-
-def signal_handler(signum, frame, bot):
-    """Handle stop signals"""
-    logging.info(t("errors.received_signal", signal=signum))
-    bot.stop()
-
-
-async def main():
-    # Initialize translator - only once at startup
-    init_translator(LANGUAGE)
-
-    bot = TelegramBot()
-
-    # Setup signal handlers
-    signal.signal(signal.SIGINT, lambda s, f: signal_handler(s, f, bot))
-    signal.signal(signal.SIGTERM, lambda s, f: signal_handler(s, f, bot))
-
-    try:
-        await bot.run()
-    except KeyboardInterrupt:
-        logging.info(t("errors.keyboard_interrupt"))
-    except Exception as e:
-        logging.error(t("errors.unexpected_error", error=e))
-    finally:
-        logging.info(t("errors.exiting"))
-
-
-if __name__ == "__main__":
+import asyncio
+import logging
+import secrets
+import signal
+from datetime import datetime, timezone
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ChatMemberHandler, CommandHandler, MessageHandler, filters
+from config import (
+    BOT_TOKEN, BOT_API_URL, ADMIN_USER_ID, ALLOWED_GROUPS, RESTRICT_TO_ALLOWED_GROUPS, LANGUAGE, CONCURRENT_UPDATES,
+    COMMAND_CONCURRENCY, BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN,
+    RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_GROUP_PER_MINUTE, RATE_LIMIT_PRIVATE_PER_SECOND, RATE_LIMIT_MAX_RETRIES,
+    METRICS_PORT, METRICS_LISTEN, DELETION_RECOVERY, SHARED_DATABASE, ACCESS_RELOAD_SECONDS
+)
+from database.db_manager import init_db, close_db
+from database.storage import deletion_storage
+from handlers.del_message import DelMessageHandler, delete_expired_messages, recover_overdue_messages
+from handlers.language import LanguageHandler
+from handlers.to_jpg import ToJpgHandler
+from handlers.translate import TranslateHandler
+from translations import init_translator, check_missing_keys, chat_languages, use_language, reset_language, t
+from utils.access_control import access_control
+from utils.conversion_cache import conversion_cache
+from utils.deletion_scheduler import deletion_scheduler
+from utils.helpers import to_epoch_ms
+from utils.image_converter import conversion_pool
+from utils.metrics import metrics, MetricsServer
+from utils.rate_limiter import TelegramRateLimiter
+from utils.translation_cache import translation_cache
+from utils.update_processor import ChatOrderedUpdateProcessor
+
+# Configure logging
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+class TelegramBot:
+    def __init__(self):
+        self.app = None
+        self.handlers = []
+        self.rate_limiter = None
+        self.update_processor = None
+        self.metrics_server = None
+        self._stop_event = asyncio.Event()
+        self._register_handlers()
+
+    def _register_handlers(self):
+        """Register all handlers"""
+        self.handlers = [
+            DelMessageHandler(),
+            ToJpgHandler(),
+            TranslateHandler(),
+            LanguageHandler(),
+            # Add other handlers here
+        ]
+
+    def _is_group_allowed(self, chat_id):
+        """Check if the group is allowed"""
+        if not RESTRICT_TO_ALLOWED_GROUPS:
+            return True
+
+        # If private chat (positive ID), always allowed for admin
+        if chat_id > 0:
+            return True
+
+        # For groups, check the allowed list
+        return access_control.is_group_allowed(chat_id)
+
+    async def _check_permissions(self, update, context):
+        """Check access permissions"""
+        chat_id = update.effective_chat.id
+        user_id = update.effective_user.id
+
+        # In private chat, only admin is allowed
+        if chat_id > 0:
+            if user_id != ADMIN_USER_ID:
+                await update.message.reply_text(
+                    t("permissions.not_authorized_user")
+                )
+                return False
+
+        # In groups, check the allowed groups list
+        elif not self._is_group_allowed(chat_id):
+            await update.message.reply_text(
+                t("permissions.not_authorized_group", chat_id=chat_id)
+            )
+            logging.warning(f"Unauthorized request from group {chat_id} by user {user_id}")
+            return False
+
+        return True
+
+    async def setup(self):
+        """Setup the bot"""
+        await init_db()
+        await access_control.load(ALLOWED_GROUPS)
+
+        self.rate_limiter = TelegramRateLimiter(
+            RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_GROUP_PER_MINUTE, RATE_LIMIT_PRIVATE_PER_SECOND,
+            RATE_LIMIT_MAX_RETRIES
+        )
+        builder = ApplicationBuilder().token(BOT_TOKEN).rate_limiter(self.rate_limiter)
+        if BOT_API_URL:
+            builder.base_url(f"{BOT_API_URL.rstrip('/')}/bot").base_file_url(f"{BOT_API_URL.rstrip('/')}/file/bot")
+        if CONCURRENT_UPDATES > 1:
+            self.update_processor = ChatOrderedUpdateProcessor(CONCURRENT_UPDATES, COMMAND_CONCURRENCY)
+            builder.concurrent_updates(self.update_processor)
+        self.app = builder.build()
+
+        # Add start command
+        self.app.add_handler(CommandHandler("start", self._localized(self._start_command)))
+
+        # Add command to show group ID
+        self.app.add_handler(CommandHandler("groupid", self._localized(self._groupid_command)))
+
+        # Add commands to manage the allowed groups at runtime
+        self.app.add_handler(CommandHandler("allow", self._localized(self._allow_command)))
+        self.app.add_handler(CommandHandler("disallow", self._localized(self._disallow_command)))
+        self.app.add_handler(CommandHandler("deladmins", self._localized(self._deladmins_command)))
+
+        # Add command to show the bot's metrics
+        self.app.add_handler(CommandHandler("stats", self._localized(self._stats_command)))
+
+        # Forget cached admin lookups when a member's status changes
+        self.app.add_handler(ChatMemberHandler(self._chat_member_updated, ChatMemberHandler.ANY_CHAT_MEMBER))
+
+        # Add handlers
+        for handler in self.handlers:
+            command_handler = CommandHandler(
+                handler.get_command_name(),
+                self._wrap_handler_with_permission_check(handler.get_command_name(), handler.handle)
+            )
+            self.app.add_handler(command_handler)
+            logging.info(f"Handler '{handler.name}' registered for /{handler.get_command_name()}")
+
+            # Passive handlers run in their own group so they never block commands
+            for extra_handler in handler.get_extra_handlers():
+                self.app.add_handler(extra_handler, group=1)
+
+        # Setup periodic jobs
+        await self._setup_jobs()
+
+        for handler in self.handlers:
+            await handler.on_startup(self.app)
+
+        metrics.add_collector(self._collect_metrics)
+
+    def _wrap_handler_with_permission_check(self, command, original_handler):
+        """Wrap handlers with permission check and latency metrics"""
+
+        async def wrapped_handler(update, context):
+            with metrics.time("bot_command_duration_seconds", command=command):
+                # Check permissions
+                if not await self._check_permissions(update, context):
+                    return
+
+                # Execute the original handler
+                try:
+                    return await original_handler(update, context)
+                except Exception:
+                    metrics.inc("bot_command_errors_total", command=command)
+                    raise
+
+        return self._localized(wrapped_handler)
+
+    def _localized(self, callback):
+        """Wrap a callback so its replies use the language chosen for the chat"""
+
+        async def localized_callback(update, context):
+            language = None
+            if update.effective_chat:
+                language = await chat_languages.get(update.effective_chat.id)
+
+            token = use_language(language)
+            try:
+                return await callback(update, context)
+            finally:
+                reset_language(token)
+
+        return localized_callback
+
+    async def _collect_metrics(self):
+        """Refresh the metrics that are read on demand: pending deletions, queues and caches"""
+        pending, overdue = await deletion_storage.count_pending(to_epoch_ms(datetime.now(timezone.utc)))
+        metrics.set("deletions_pending", pending)
+        metrics.set("deletions_overdue", overdue)
+
+        metrics.set("queue_depth", conversion_pool.queued, queue="conversion")
+        metrics.set("queue_depth", self.rate_limiter.waiting, queue="telegram_api")
+        if self.update_processor:
+            metrics.set("queue_depth", self.update_processor.waiting, queue="updates")
+
+        for result in ("hits", "disk_hits", "misses"):
+            metrics.set("cache_requests_total", conversion_cache.stats[result], cache="conversion", result=result)
+        for result in ("memory_hits", "db_hits", "coalesced", "misses"):
+            metrics.set("cache_requests_total", translation_cache.stats[result], cache="translation", result=result)
+
+    async def _setup_jobs(self):
+        """Setup scheduled jobs"""
+        # A single instance re-reads no deadlines, so records claimed by a previous
+        # run that stopped mid-sweep are handed back now instead of waiting out the lease
+        if not SHARED_DATABASE:
+            released = await deletion_storage.release_all()
+            if released:
+                logging.info(f"Released {released} deletion records claimed by a previous run")
+
+        # Expired messages are swept exactly at their deadline instead of by polling;
+        # the backlog left by downtime is drained first, in recovery mode
+        await deletion_scheduler.start(
+            self.app.job_queue, delete_expired_messages,
+            recover_overdue_messages if DELETION_RECOVERY else None
+        )
+
+        # Other instances sharing the database may allow or disallow groups
+        if ACCESS_RELOAD_SECONDS:
+            self.app.job_queue.run_repeating(
+                self._reload_access_control, interval=ACCESS_RELOAD_SECONDS, name="reload_access_control"
+            )
+
+    async def _reload_access_control(self, context):
+        """Pick up the allowed groups changed by other bot instances"""
+        await access_control.reload()
+
+    async def _start_command(self, update, context):
+        """Start command"""
+        # Check permissions
+        if not await self._check_permissions(update, context):
+            return
+
+        commands = []
+        for handler in self.handlers:
+            commands.append(f"/{handler.get_command_name()} - {handler.name}")
+
+        command_list = "\n".join(commands)
+
+        chat_type = t("status.group") if update.effective_chat.id < 0 else t("status.private_chat")
+        chat_id = update.effective_chat.id
+
+        message = (
+            f"{t('bot.greeting')}\n\n"
+            f"{t('bot.current_environment', chat_type=chat_type)}\n"
+            f"{t('bot.chat_id', chat_id=chat_id)}\n\n"
+            f"{t('bot.available_commands')}\n{command_list}\n\n"
+            f"{t('bot.usage_hint')}"
+        )
+
+        await update.message.reply_text(message)
+
+    async def _groupid_command(self, update, context):
+        """Show group or chat ID"""
+        chat_id = update.effective_chat.id
+        user_id = update.effective_user.id
+
+        # Only admin can see this command
+        if user_id != ADMIN_USER_ID:
+            await update.message.reply_text(t("permissions.not_authorized_command"))
+            return
+
+        chat_type = t("status.group") if chat_id < 0 else t("status.private_chat")
+        is_allowed = t("status.allowed") if self._is_group_allowed(chat_id) else t("status.not_allowed")
+
+        message = (
+            f"{t('group_info.chat_information')}\n\n"
+            f"{t('group_info.type', chat_type=chat_type)}\n"
+            f"{t('group_info.id', chat_id=chat_id)}\n"
+            f"{t('group_info.status', status=is_allowed)}\n\n"
+            f"{t('group_info.add_hint', chat_id=chat_id)}"
+        )
+
+        await update.message.reply_text(message)
+
+    def _get_target_chat_id(self, update, context):
+        """Chat ID given as the command argument, or the current chat"""
+        if context.args:
+            return int(context.args[0])
+        return update.effective_chat.id
+
+    async def _allow_command(self, update, context):
+        """Add a group to the allowed list"""
+        if update.effective_user.id != ADMIN_USER_ID:
+            await update.message.reply_text(t("permissions.not_authorized_command"))
+            return
+
+        try:
+            chat_id = self._get_target_chat_id(update, context)
+        except ValueError:
+            await update.message.reply_text(t("access.invalid_chat_id", chat_id=context.args[0]))
+            return
+
+        await access_control.allow_group(chat_id)
+        logging.info(f"Group {chat_id} allowed by {update.effective_user.id}")
+        await update.message.reply_text(t("access.group_allowed", chat_id=chat_id))
+
+    async def _disallow_command(self, update, context):
+        """Remove a group from the allowed list"""
+        if update.effective_user.id != ADMIN_USER_ID:
+            await update.message.reply_text(t("permissions.not_authorized_command"))
+            return
+
+        try:
+            chat_id = self._get_target_chat_id(update, context)
+        except ValueError:
+            await update.message.reply_text(t("access.invalid_chat_id", chat_id=context.args[0]))
+            return
+
+        await access_control.disallow_group(chat_id)
+        logging.info(f"Group {chat_id} disallowed by {update.effective_user.id}")
+        await update.message.reply_text(t("access.group_disallowed", chat_id=chat_id))
+
+    async def _deladmins_command(self, update, context):
+        """Restrict /del in this group to its admins (on) or allow it for everyone (off)"""
+        chat_id = update.effective_chat.id
+        if update.effective_user.id != ADMIN_USER_ID:
+            await update.message.reply_text(t("permissions.not_authorized_command"))
+            return
+
+        if chat_id > 0 or not self._is_group_allowed(chat_id) or not context.args \
+                or context.args[0].lower() not in ("on", "off"):
+            await update.message.reply_text(t("access.deladmins_usage"))
+            return
+
+        enabled = context.args[0].lower() == "on"
+        await access_control.set_del_admins_only(chat_id, enabled)
+        await update.message.reply_text(
+            t("access.del_admins_only_enabled" if enabled else "access.del_admins_only_disabled")
+        )
+
+    async def _stats_command(self, update, context):
+        """Show latencies, deletions, Bot API errors, caches and queues"""
+        if update.effective_user.id != ADMIN_USER_ID:
+            await update.message.reply_text(t("permissions.not_authorized_command"))
+            return
+
+        await metrics.collect()
+        uptime = int(metrics.value("uptime_seconds"))
+        lines = [
+            t("stats.title"),
+            t("stats.uptime", hours=uptime // 3600, minutes=uptime // 60 % 60),
+            "",
+            t("stats.commands"),
+        ]
+
+        for handler in self.handlers:
+            command = handler.get_command_name()
+            histogram = metrics.histogram("bot_command_duration_seconds", command=command)
+            if histogram.count:
+                lines.append(t(
+                    "stats.command", command=command, count=histogram.count,
+                    average=f"{histogram.average:.2f}", p95=histogram.quantile(0.95),
+                    errors=int(metrics.value("bot_command_errors_total", command=command))
+                ))
+
+        stages = [
+            f"{stage} {metrics.histogram('tojpg_stage_duration_seconds', stage=stage).average:.2f}s"
+            for stage in ("download", "convert", "upload")
+        ]
+        translation = metrics.histogram("translation_upstream_duration_seconds")
+        lines += [
+            t("stats.tojpg_stages", stages=", ".join(stages)),
+            t("stats.translation", count=translation.count, average=f"{translation.average:.2f}",
+              errors=int(metrics.value("translation_errors_total"))),
+            "",
+            t("stats.deletions", pending=metrics.value("deletions_pending"),
+              overdue=metrics.value("deletions_overdue"),
+              deleted=int(metrics.value("deleted_messages_total")),
+              failed=int(metrics.value("deletion_errors_total"))),
+            t("stats.telegram_api", count=metrics.total("telegram_api_request_duration_seconds"),
+              retries=int(metrics.total("telegram_api_retries_total")),
+              errors=int(metrics.total("telegram_api_errors_total"))),
+        ]
+
+        for cache in ("conversion", "translation"):
+            total = metrics.total("cache_requests_total", cache=cache)
+            hits = total - metrics.value("cache_requests_total", cache=cache, result="misses")
+            lines.append(t("stats.cache", cache=cache, hits=hits, total=total,
+                           hit_rate=round(hits * 100 / total) if total else 0))
+
+        lines.append(t(
+            "stats.queues", conversion=int(metrics.value("queue_depth", queue="conversion")),
+            telegram_api=int(metrics.value("queue_depth", queue="telegram_api")),
+            updates=int(metrics.value("queue_depth", queue="updates"))
+        ))
+
+        await update.message.reply_text("\n".join(lines))
+
+    async def _chat_member_updated(self, update, context):
+        """Drop the cached admin status of a member whose status changed"""
+        member_update = update.chat_member or update.my_chat_member
+        access_control.invalidate_admins(member_update.chat.id, member_update.new_chat_member.user.id)
+
+    async def run(self):
+        """Run the bot"""
+        await self.setup()
+
+        logging.info(t("bot.ready"))
+
+        restriction_status = t("status.enabled") if RESTRICT_TO_ALLOWED_GROUPS else t("status.disabled")
+        logging.info(t("bot.group_restrictions", status=restriction_status))
+
+        if RESTRICT_TO_ALLOWED_GROUPS and access_control.allowed_groups:
+            logging.info(t("bot.allowed_groups", groups=access_control.allowed_groups))
+
+        # Initialize the app
+        await self.app.initialize()
+        await self.app.start()
+        await self._start_receiving_updates()
+
+        if METRICS_PORT:
+            self.metrics_server = MetricsServer(metrics, METRICS_LISTEN, METRICS_PORT)
+            await self.metrics_server.start()
+            logging.info(t("bot.metrics_listening", address=f"{METRICS_LISTEN}:{METRICS_PORT}/metrics"))
+
+        # Wait until a stop signal arrives
+        await self._stop_event.wait()
+        await self.shutdown()
+
+    async def shutdown(self):
+        """Stop receiving updates and release every resource"""
+        logging.info(t("bot.stopping"))
+        deletion_scheduler.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.app.updater.running:
+            await self.app.updater.stop()
+        await self.app.stop()
+        await self.app.shutdown()
+        for handler in self.handlers:
+            await handler.on_shutdown()
+        conversion_pool.shutdown()
+        await close_db()
+        logging.info(t("bot.stopped"))
+
+    async def _start_receiving_updates(self):
+        """Start long polling, or the webhook server that feeds updates straight into the queue"""
+        if BOT_MODE != "webhook":
+            await self.app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            return
+
+        if not WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL must be set when BOT_MODE is webhook")
+
+        await self.app.updater.start_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            # Requests without this token in their header are rejected
+            secret_token=WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32),
+            # chat_member updates are only sent when asked for
+            allowed_updates=Update.ALL_TYPES
+        )
+        logging.info(t("bot.webhook_listening", address=f"{WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}"))
+
+    def stop(self):
+        """Stop the bot"""
+        self._stop_event.set()
+
+
+def signal_handler(signum, bot):
+    """Handle stop signals"""
+    logging.info(t("errors.received_signal", signal=signum))
+    bot.stop()
+
+
+async def main():
+    # Initialize translator - only once at startup
+    init_translator(LANGUAGE)
+    check_missing_keys()
+
+    bot = TelegramBot()
+
+    # Setup signal handlers, run on the event loop so they can wake it up
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, signal_handler, signum, bot)
+        except NotImplementedError:
+            # Windows has no loop signal handlers
+            signal.signal(signum, lambda s, f: loop.call_soon_threadsafe(signal_handler, s, bot))
+
+    try:
+        await bot.run()
+    except KeyboardInterrupt:
+        logging.info(t("errors.keyboard_interrupt"))
+    except Exception as e:
+        logging.error(t("errors.unexpected_error", error=e))
+    finally:
+        logging.info(t("errors.exiting"))
+
+
+if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,149 +1,300 @@
-import asyncio
-import logging
-import re
-from datetime import datetime, timedelta, timezone
-from telegram import Update
-from telegram.ext import ContextTypes
-from .base_handler import BaseHandler
-from config import DELETE_AFTER_HOURS
-from database.db_manager import save_message_for_deletion, get_expired_messages, delete_message_record
-from translations import t
-
-
-class DelMessageHandler(BaseHandler):
-    def __init__(self):
-        super().__init__(t("del_message.handler_name"))
-
-    def get_command_name(self) -> str:
-        return "del"
-
-    def _extract_hours_from_text(self, message_text: str) -> float:
-        """Extract hours from message text based on different units (d=day, h=hour, m=minute)"""
-        # Split text into parts
-        parts = message_text.strip().split()
-
-        # If only "/del", return default from config
-        if len(parts) == 1:
-            return DELETE_AFTER_HOURS
-
-        # If second parameter exists
-        if len(parts) >= 2:
-            time_param = parts[1]
-
-            # Different patterns for time units
-            patterns = [
-                (r'^(\d*\.?\d+)d$', 24),  # day - multiply by 24
-                (r'^(\d*\.?\d+)h$', 1),   # hour - multiply by 1
-                (r'^(\d*\.?\d+)m$', 1 / 60),  # minute - divide by 60
-            ]
-
-            for pattern, multiplier in patterns:
-                match = re.match(pattern, time_param)
-                if match:
-                    try:
-                        value = float(match.group(1))
-                        hours = value * multiplier
-
-                        # Security limits - max 10 days
-                        if 0 < hours <= 240:  # max 10 days (10 * 24 = 240 hours)
-                            return hours
-                        else:
-                            return DELETE_AFTER_HOURS
-                    except ValueError:
-                        continue
-
-        # If no pattern matched, return default from config
-        return DELETE_AFTER_HOURS
-
-    async def validate_input(self, update: Update) -> tuple[bool, float]:
-        """Validate input and return validity status + hours"""
-        if not update.message.reply_to_message:
-            await self.send_error_message(
-                update,
-                t("del_message.reply_required")
-            )
-            return False, 0
-
-        # Extract hours from message text
-        hours = self._extract_hours_from_text(update.message.text)
-
-        return True, hours
-
-    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        is_valid, hours = await self.validate_input(update)
-        if not is_valid:
-            return
-
-        chat_id = update.message.chat_id
-        message_id = update.message.reply_to_message.message_id
-        delete_at = datetime.now(timezone.utc) + timedelta(hours=hours)
-
-        # Save in database
-        await save_message_for_deletion(chat_id, message_id, delete_at.isoformat(), f'del_after_{hours}h')
-
-        # Delete the command message
-        try:
-            await update.message.delete()
-        except Exception as e:
-            logging.error(t("del_message.command_delete_error", error=e))
-
-        # Send confirmation message
-        await self._send_confirmation(context, chat_id, message_id, hours)
-
-    async def _send_confirmation(self, context, chat_id: int, message_id: int, hours: float):
-        time_text = self._format_time_text(hours)
-        try:
-            notification = await context.bot.send_message(
-                chat_id=chat_id,
-                text=t("del_message.scheduled_confirmation", time_text=time_text),
-                reply_to_message_id=message_id
-            )
-
-            await asyncio.sleep(10)
-            await notification.delete()
-        except Exception as e:
-            logging.error(t("del_message.notification_error", error=e))
-
-    def _format_time_text(self, hours: float) -> str:
-        """Format time text based on hours value"""
-        if hours >= 24:
-            days = int(hours // 24)
-            remaining_hours = hours % 24
-            if remaining_hours > 0:
-                return t("del_message.time_format.days_hours",
-                        days=days, hours=f"{remaining_hours:.1f}")
-            else:
-                return t("del_message.time_format.days", days=days)
-        elif hours >= 1:
-            return t("del_message.time_format.hours", hours=f"{hours:.1f}")
-        elif hours >= 1 / 60:  # more than one minute
-            minutes = int(hours * 60)
-            return t("del_message.time_format.minutes", minutes=minutes)
-        else:
-            seconds = int(hours * 3600)
-            return t("del_message.time_format.seconds", seconds=seconds)
-
-
-# Job function to delete expired messages
-async def check_and_delete_expired_messages(context: ContextTypes.DEFAULT_TYPE):
-    """Check and delete expired messages"""
-    app = context.application
-    now = datetime.now(timezone.utc).isoformat()
-
-    try:
-        expired_messages = await get_expired_messages(now)
-
-        for id_, chat_id, message_id in expired_messages:
-            try:
-                await app.bot.delete_message(chat_id=chat_id, message_id=message_id)
-                logging.info(t("del_message.deletion_success",
-                              message_id=message_id, chat_id=chat_id))
-            except Exception as e:
-                logging.error(t("del_message.deletion_error",
-                               message_id=message_id, error=e))
-
-            # Delete record from database
-            await delete_message_record(id_)
-
-    except Exception as e:
-        logging.error(t("del_message.check_error", error=e))
\ No newline at end of file
+import asyncio
+import logging
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from telegram import Update
+from telegram.error import RetryAfter
+from telegram.ext import ContextTypes
+from .base_handler import BaseHandler
+from config import (
+    ADMIN_USER_ID, DELETE_AFTER_HOURS, DELETION_WINDOW_HOURS, EXPIRY_SWEEP_PAGE_SIZE, INSTANCE_ID, SWEEP_LEASE_SECONDS
+)
+from database.storage import deletion_storage
+from translations import t
+from utils.access_control import access_control
+from utils.deletion_scheduler import deletion_scheduler
+from utils.ephemeral import delete_later
+from utils.helpers import to_epoch_ms
+from utils.metrics import metrics
+from utils.rate_limiter import PRIORITY_BACKGROUND
+
+
+class DelMessageHandler(BaseHandler):
+    def __init__(self):
+        super().__init__(t("del_message.handler_name"))
+
+    def get_command_name(self) -> str:
+        return "del"
+
+    def _extract_hours_from_text(self, message_text: str) -> float:
+        """Extract hours from message text based on different units (d=day, h=hour, m=minute)"""
+        # Split text into parts
+        parts = message_text.strip().split()
+
+        # If only "/del", return default from config
+        if len(parts) == 1:
+            return DELETE_AFTER_HOURS
+
+        # If second parameter exists
+        if len(parts) >= 2:
+            time_param = parts[1]
+
+            # Different patterns for time units
+            patterns = [
+                (r'^(\d*\.?\d+)d$', 24),  # day - multiply by 24
+                (r'^(\d*\.?\d+)h$', 1),   # hour - multiply by 1
+                (r'^(\d*\.?\d+)m$', 1 / 60),  # minute - divide by 60
+            ]
+
+            for pattern, multiplier in patterns:
+                match = re.match(pattern, time_param)
+                if match:
+                    try:
+                        value = float(match.group(1))
+                        hours = value * multiplier
+
+                        # Delays past Telegram's deletion window are refused in validate_input
+                        if hours > 0:
+                            return hours
+                        else:
+                            return DELETE_AFTER_HOURS
+                    except ValueError:
+                        continue
+
+        # If no pattern matched, return default from config
+        return DELETE_AFTER_HOURS
+
+    async def validate_input(self, update: Update) -> tuple[bool, float]:
+        """Validate input and return validity status + hours"""
+        if not update.message.reply_to_message:
+            await self.send_error_message(
+                update,
+                t("del_message.reply_required")
+            )
+            return False, 0
+
+        # Some groups only let their admins schedule deletions
+        chat_id = update.effective_chat.id
+        user_id = update.effective_user.id
+        if access_control.is_del_admins_only(chat_id) and user_id != ADMIN_USER_ID \
+                and not await access_control.is_chat_admin(update.get_bot(), chat_id, user_id):
+            await self.send_error_message(
+                update,
+                t("del_message.admins_only")
+            )
+            return False, 0
+
+        # Extract hours from message text
+        hours = self._extract_hours_from_text(update.message.text)
+
+        # Telegram lets bots delete a message only within DELETION_WINDOW_HOURS
+        # of it being sent; keep a minute's margin for the sweep
+        message_age = datetime.now(timezone.utc) - update.message.reply_to_message.date
+        max_hours = DELETION_WINDOW_HOURS - message_age.total_seconds() / 3600 - 1 / 60
+        if hours > max_hours:
+            if max_hours < 1 / 60:
+                message = t("del_message.too_old", window=DELETION_WINDOW_HOURS)
+            else:
+                message = t("del_message.beyond_window", window=DELETION_WINDOW_HOURS,
+                            time_text=self._format_time_text(max_hours))
+            await self.send_error_message(update, message)
+            return False, 0
+
+        return True, hours
+
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        is_valid, hours = await self.validate_input(update)
+        if not is_valid:
+            return
+
+        chat_id = update.message.chat_id
+        message_id = update.message.reply_to_message.message_id
+        delete_at = datetime.now(timezone.utc) + timedelta(hours=hours)
+
+        # Save in database
+        delete_at_ms = to_epoch_ms(delete_at)
+        sent_at_ms = to_epoch_ms(update.message.reply_to_message.date)
+        await deletion_storage.schedule(chat_id, message_id, delete_at_ms, f'del_{round(hours * 3600)}s', sent_at_ms)
+        deletion_scheduler.notify(delete_at_ms)
+
+        # Delete the command message
+        try:
+            await update.message.delete()
+        except Exception as e:
+            logging.error(t("del_message.command_delete_error", error=e))
+
+        # Send confirmation message
+        await self._send_confirmation(context, chat_id, message_id, hours)
+
+    async def _send_confirmation(self, context, chat_id: int, message_id: int, hours: float):
+        time_text = self._format_time_text(hours)
+        try:
+            notification = await context.bot.send_message(
+                chat_id=chat_id,
+                text=t("del_message.scheduled_confirmation", time_text=time_text),
+                reply_to_message_id=message_id
+            )
+
+            # Removed by the deletion sweep after a few seconds
+            await delete_later(notification)
+        except Exception as e:
+            logging.error(t("del_message.notification_error", error=e))
+
+    def _format_time_text(self, hours: float) -> str:
+        """Format time text based on hours value"""
+        if hours >= 24:
+            days = int(hours // 24)
+            remaining_hours = hours % 24
+            if remaining_hours > 0:
+                return t("del_message.time_format.days_hours",
+                        days=days, hours=f"{remaining_hours:.1f}")
+            else:
+                return t("del_message.time_format.days", days=days)
+        elif hours >= 1:
+            return t("del_message.time_format.hours", hours=f"{hours:.1f}")
+        elif hours >= 1 / 60:  # more than one minute
+            minutes = int(hours * 60)
+            return t("del_message.time_format.minutes", minutes=minutes)
+        else:
+            seconds = int(hours * 3600)
+            return t("del_message.time_format.seconds", seconds=seconds)
+
+
+# Telegram accepts at most 100 message ids per deleteMessages call
+DELETE_MESSAGES_BATCH_SIZE = 100
+
+
+async def _delete_chat_messages(bot, chat_id, message_ids, summary):
+    """Delete one chat's messages in batches
+
+    Returns the RetryAfter delay and the message ids left undeleted if the
+    chat stays flood-limited, (0, []) otherwise.
+    """
+    for start in range(0, len(message_ids), DELETE_MESSAGES_BATCH_SIZE):
+        batch = message_ids[start:start + DELETE_MESSAGES_BATCH_SIZE]
+        try:
+            # Background work: interactive replies go first
+            await bot.delete_messages(
+                chat_id=chat_id,
+                message_ids=batch,
+                rate_limit_args={"priority": PRIORITY_BACKGROUND}
+            )
+            summary["deleted"] += len(batch)
+            metrics.inc("deleted_messages_total", len(batch))
+            logging.info(t("del_message.deletion_success",
+                          count=len(batch), chat_id=chat_id))
+        except RetryAfter as e:
+            logging.warning(t("del_message.deletion_error",
+                             count=len(batch), chat_id=chat_id, error=e))
+            return e.retry_after, message_ids[start:]
+        except Exception as e:
+            summary["failed"] += len(batch)
+            metrics.inc("deletion_errors_total", len(batch))
+            logging.error(t("del_message.deletion_error",
+                           count=len(batch), chat_id=chat_id, error=e))
+    return 0, []
+
+
+async def delete_expired_messages(bot, page_size: int = EXPIRY_SWEEP_PAGE_SIZE, by_cutoff: bool = False,
+                                  summary: Counter = None) -> Counter:
+    """Delete every expired message, one claimed page of records at a time
+
+    Only records this instance claimed are handled, so bot instances sharing
+    the database never delete the same messages. Chats of a page are handled
+    in parallel, paced by the rate limiter. Messages older than Telegram's
+    deletion window can no longer be deleted: their records are dropped
+    without an API call. Chats that stay flood-limited get their records
+    back, and the sweep is scheduled again for when Telegram lets us retry.
+
+    Returns the counts of deleted, undeletable, failed and deferred messages,
+    added to `summary` if given.
+    """
+    summary = Counter() if summary is None else summary
+    now = to_epoch_ms(datetime.now(timezone.utc))
+    sent_before = now - DELETION_WINDOW_HOURS * 3600 * 1000
+
+    while True:
+        lease_until = to_epoch_ms(datetime.now(timezone.utc)) + SWEEP_LEASE_SECONDS * 1000
+        expired_messages = await deletion_storage.claim_due(INSTANCE_ID, now, lease_until, page_size, by_cutoff)
+        if not expired_messages:
+            break
+
+        # Group message ids by chat so each chat gets batched deleteMessages calls
+        messages_by_chat = defaultdict(dict)
+        undeletable = 0
+        for id_, chat_id, message_id, sent_at in expired_messages:
+            if sent_at is not None and sent_at <= sent_before:
+                undeletable += 1
+            else:
+                messages_by_chat[chat_id][message_id] = id_
+
+        if undeletable:
+            summary["undeletable"] += undeletable
+            metrics.inc("deletions_skipped_total", undeletable)
+
+        results = await asyncio.gather(*(
+            _delete_chat_messages(bot, chat_id, list(records), summary)
+            for chat_id, records in messages_by_chat.items()
+        ))
+
+        deferred = []
+        retry_after = 0
+        for records, (chat_retry_after, remaining) in zip(messages_by_chat.values(), results):
+            deferred.extend(records[message_id] for message_id in remaining)
+            retry_after = max(retry_after, chat_retry_after)
+
+        # Delete the page of records from database, and give back those still to retry
+        deferred_ids = set(deferred)
+        await deletion_storage.complete(
+            INSTANCE_ID, [record[0] for record in expired_messages if record[0] not in deferred_ids]
+        )
+
+        if deferred:
+            summary["deferred"] += len(deferred)
+            await deletion_storage.release(INSTANCE_ID, deferred)
+            # The deferred records would come back first in the next page
+            deletion_scheduler.notify(to_epoch_ms(datetime.now(timezone.utc)) + retry_after * 1000)
+            break
+
+        if len(expired_messages) < page_size:
+            break
+
+    return summary
+
+
+async def recover_overdue_messages(bot) -> Counter:
+    """First sweep after startup: drain the deletions that fell due while the bot was down
+
+    Records of messages already past Telegram's deletion window are dropped
+    up front, without an API call. The rest are claimed oldest message
+    first, i.e. closest to becoming undeletable, and deleted with chats in
+    parallel as fast as the rate limiter allows. A summary is logged and
+    sent to the bot admin.
+    """
+    started = time.monotonic()
+    now = to_epoch_ms(datetime.now(timezone.utc))
+    _, overdue = await deletion_storage.count_pending(now)
+    if not overdue:
+        return await delete_expired_messages(bot)
+
+    logging.info(t("del_message.recovery_started", count=overdue))
+    summary = Counter(overdue=overdue)
+    undeletable = await deletion_storage.discard_undeletable(now - DELETION_WINDOW_HOURS * 3600 * 1000, now)
+    summary["undeletable"] += undeletable
+    metrics.inc("deletions_skipped_total", undeletable)
+
+    await delete_expired_messages(bot, by_cutoff=True, summary=summary)
+
+    report = t("del_message.recovery_summary",
+               overdue=overdue, deleted=summary["deleted"], undeletable=summary["undeletable"],
+               failed=summary["failed"], deferred=summary["deferred"],
+               seconds=round(time.monotonic() - started, 1))
+    logging.info(report)
+    if ADMIN_USER_ID:
+        try:
+            await bot.send_message(chat_id=ADMIN_USER_ID, text=report)
+        except Exception as e:
+            logging.error(t("del_message.recovery_report_error", error=e))
+    return summary
@@ -0,0 +1,59 @@
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes
+from .base_handler import BaseHandler
+from config import ADMIN_USER_ID
+from translations import t, available_languages, chat_languages, default_language, use_language
+from utils.access_control import access_control
+
+
+class LanguageHandler(BaseHandler):
+    def __init__(self):
+        super().__init__(t("language.handler_name"))
+
+    def get_command_name(self) -> str:
+        return "language"
+
+    async def _can_change_language(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """Only the bot admin and the group's administrators may change its language"""
+        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+        if user_id == ADMIN_USER_ID or chat_id > 0:
+            return True
+
+        return await access_control.is_chat_admin(context.bot, chat_id, user_id)
+
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show or change the bot language of this chat"""
+        try:
+            chat_id = update.effective_chat.id
+            languages = available_languages()
+
+            # Without an argument, show the current language
+            if not context.args:
+                current_language = await chat_languages.get(chat_id) or default_language()
+                await update.message.reply_text(
+                    t("language.current", language=current_language, languages=", ".join(languages))
+                )
+                return
+
+            language = context.args[0].lower()
+            if language not in languages:
+                await update.message.reply_text(
+                    t("language.unsupported", language=language, languages=", ".join(languages))
+                )
+                return
+
+            if not await self._can_change_language(update, context):
+                await update.message.reply_text(t("permissions.not_authorized_command"))
+                return
+
+            await chat_languages.set(chat_id, language)
+
+            # Confirm in the newly selected language
+            use_language(language)
+            await update.message.reply_text(t("language.changed", language=language))
+
+        except Exception as e:
+            logging.error(f"Error in language handler: {e}")
+            await update.message.reply_text(t("language.error", error=str(e)))
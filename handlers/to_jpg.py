@@ -1,204 +1,457 @@
-import io
-import os
-import tempfile
-import shutil
-from PIL import Image
-from telegram import Update
-from telegram.ext import ContextTypes
-from .base_handler import BaseHandler
-from config import SUPPORTED_IMAGE_FORMATS
-from translations import t
-
-# For HEIC support
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-    HEIC_SUPPORTED = True
-except ImportError:
-    HEIC_SUPPORTED = False
-
-
-class ToJpgHandler(BaseHandler):
-    def __init__(self):
-        super().__init__(t("to_jpg.handler_name"))
-
-    def get_command_name(self) -> str:
-        return "tojpg"
-
-    async def validate_input(self, update: Update) -> bool:
-        if not update.message.reply_to_message:
-            await self.send_error_message(
-                update,
-                t("to_jpg.reply_required")
-            )
-            return False
-
-        reply_msg = update.message.reply_to_message
-
-        # Check for document or photo existence
-        if not reply_msg.document and not reply_msg.photo:
-            await self.send_error_message(
-                update,
-                t("to_jpg.no_image")
-            )
-            return False
-
-        # If it's a document, check if it's an image
-        if reply_msg.document and not self._is_image_document(reply_msg.document):
-            await self.send_error_message(
-                update,
-                t("to_jpg.not_image_document")
-            )
-            return False
-
-        return True
-
-    def _create_temp_directory(self, message_id: int) -> str:
-        """Create temporary directory for the message"""
-        temp_dir = tempfile.mkdtemp(prefix=f"tojpg_{message_id}_")
-        return temp_dir
-
-    def _cleanup_temp_directory(self, temp_dir: str):
-        """Delete temporary directory"""
-        try:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-        except Exception as e:
-            print(t("to_jpg.temp_cleanup_error", temp_dir=temp_dir, error=e))
-
-    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if not await self.validate_input(update):
-            return
-
-        # Delete command message
-        try:
-            await update.message.delete()
-        except:
-            pass
-
-        # Check for photo parameter in command text
-        command_text = update.message.text or ""
-        send_as_photo = "photo" in command_text.lower()
-
-        reply_msg = update.message.reply_to_message
-
-        # Process file
-        temp_dir = self._create_temp_directory(reply_msg.message_id)
-        try:
-            status_message = await reply_msg.reply_text(t("to_jpg.converting"))
-            try:
-                await self._convert_single_message(reply_msg, context, send_as_photo, status_message, temp_dir)
-            finally:
-                try:
-                    await status_message.delete()
-                except:
-                    pass
-        finally:
-            self._cleanup_temp_directory(temp_dir)
-
-    def _is_image_document(self, document) -> bool:
-        if not document.file_name:
-            return False
-
-        file_ext = os.path.splitext(document.file_name.lower())[1]
-        supported_formats = [fmt.lower() for fmt in SUPPORTED_IMAGE_FORMATS]
-
-        # Add HEIC support
-        if HEIC_SUPPORTED:
-            supported_formats.extend(['.heic', '.heif'])
-
-        return file_ext.lower() in supported_formats
-
-    async def _convert_single_message(self, message, context, send_as_photo=False, status_message=None, temp_dir=None):
-        """Convert a single message (document or photo)"""
-        try:
-            # Detect file type
-            if message.document:
-                file = await context.bot.get_file(message.document.file_id)
-                original_name = message.document.file_name
-            else:  # photo
-                file = await context.bot.get_file(message.photo[-1].file_id)  # largest size
-                original_name = f"photo_{message.message_id}.jpg"
-
-            image_bytes = await file.download_as_bytearray()
-
-            # Save temporary original file (for HEIC)
-            temp_original_path = os.path.join(temp_dir, original_name)
-            with open(temp_original_path, 'wb') as f:
-                f.write(image_bytes)
-
-            jpg_bytes = await self._convert_to_jpg(image_bytes, temp_original_path)
-
-            # New filename
-            new_name = os.path.splitext(original_name)[0] + ".jpg"
-
-            # Update status for upload
-            if status_message:
-                await status_message.edit_text(t("to_jpg.uploading"))
-
-            if send_as_photo:
-                await message.reply_photo(
-                    photo=io.BytesIO(jpg_bytes)
-                )
-            else:
-                await message.reply_document(
-                    document=io.BytesIO(jpg_bytes),
-                    filename=new_name
-                )
-
-            # Delete status message
-            if status_message:
-                try:
-                    await status_message.delete()
-                except:
-                    pass
-
-        except Exception as e:
-            error_message = t("to_jpg.conversion_error", error=str(e))
-            if status_message:
-                try:
-                    await status_message.edit_text(error_message)
-                except:
-                    await message.reply_text(error_message)
-            else:
-                await message.reply_text(error_message)
-
-    async def _convert_to_jpg(self, image_bytes: bytearray, temp_file_path: str = None) -> bytes:
-        """Convert image bytes to JPG with optimal quality"""
-        try:
-            # For HEIC files, use file path
-            if temp_file_path and temp_file_path.lower().endswith(('.heic', '.heif')):
-                if not HEIC_SUPPORTED:
-                    raise Exception(t("to_jpg.heic_not_supported"))
-                image = Image.open(temp_file_path)
-            else:
-                # Open image from bytes
-                image = Image.open(io.BytesIO(image_bytes))
-
-            # Convert to RGB if needed
-            if image.mode in ('RGBA', 'LA', 'P'):
-                # Create white background
-                rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-
-                if image.mode == 'P':
-                    # Convert palette to RGBA
-                    image = image.convert('RGBA')
-
-                # If it has alpha channel, use it as mask
-                if image.mode in ('RGBA', 'LA'):
-                    rgb_image.paste(image, mask=image.split()[-1])
-                else:
-                    rgb_image.paste(image)
-
-                image = rgb_image
-            elif image.mode not in ('RGB', 'L'):
-                # Convert other formats to RGB
-                image = image.convert('RGB')
-
-            # Save as JPG with balanced quality (less than 95)
-            output = io.BytesIO()
-            image.save(output, format='JPEG', quality=90, optimize=True)
-            return output.getvalue()
-
-        except Exception as e:
-            raise Exception(t("to_jpg.image_conversion_error", error=str(e)))
\ No newline at end of file
+import asyncio
+import io
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from telegram import InputMediaDocument, InputMediaPhoto, Update
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes, MessageHandler, filters
+from .base_handler import BaseHandler
+from config import (
+    SUPPORTED_IMAGE_FORMATS, TOJPG_SPOOL_THRESHOLD_MB, TOJPG_ALBUM_CONCURRENCY, TOJPG_ALBUM_CACHE_SIZE,
+    TOJPG_DEFAULT_PROFILE, TOJPG_GROUP_PROFILES, TOJPG_MAX_FILE_MB
+)
+from translations import t
+from utils.conversion_cache import conversion_cache
+from utils.helpers import format_file_size
+from utils.image_converter import (
+    HEIC_SUPPORTED, ConversionQueueFullError, ImageTooLargeError, can_pass_through, conversion_pool, convert_to_jpg, encoding_settings,
+    parse_encoding_option, sniff_image_format
+)
+from utils.metrics import metrics
+
+# Telegram accepts at most 10 items per sendMediaGroup call
+MEDIA_GROUP_MAX_SIZE = 10
+
+
+class ToJpgHandler(BaseHandler):
+    def __init__(self):
+        super().__init__(t("to_jpg.handler_name"))
+        # Recently seen album messages, keyed by (chat_id, media_group_id)
+        self._albums = OrderedDict()
+
+    def get_command_name(self) -> str:
+        return "tojpg"
+
+    async def validate_input(self, update: Update) -> bool:
+        if not update.message.reply_to_message:
+            await self.send_error_message(
+                update,
+                t("to_jpg.reply_required")
+            )
+            return False
+
+        reply_msg = update.message.reply_to_message
+
+        # Check for document or photo existence
+        if not reply_msg.document and not reply_msg.photo:
+            await self.send_error_message(
+                update,
+                t("to_jpg.no_image")
+            )
+            return False
+
+        # If it's a document, check if it's an image
+        if reply_msg.document and not self._is_image_document(reply_msg.document):
+            await self.send_error_message(
+                update,
+                t("to_jpg.not_image_document")
+            )
+            return False
+
+        return True
+
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not await self.validate_input(update):
+            return
+
+        # Delete command message
+        try:
+            await update.message.delete()
+        except:
+            pass
+
+        # Check for photo parameter and encoding profile in command text
+        command_text = update.message.text or ""
+        send_as_photo = "photo" in command_text.lower()
+        encoding = self._get_encoding(command_text, update.message.chat_id)
+
+        reply_msg = update.message.reply_to_message
+        album_messages = self._get_album_messages(reply_msg)
+
+        # Process file, or the whole album the message belongs to
+        status_message = await reply_msg.reply_text(t("to_jpg.converting"))
+        try:
+            if len(album_messages) > 1:
+                await self._convert_album(reply_msg, album_messages, context, send_as_photo, encoding, status_message)
+            else:
+                await self._convert_single_message(reply_msg, context, send_as_photo, encoding, status_message)
+        finally:
+            try:
+                await status_message.delete()
+            except:
+                pass
+
+    def get_extra_handlers(self) -> list:
+        # Telegram delivers an album as separate messages and bots cannot fetch
+        # them later, so remember them as they arrive
+        return [
+            MessageHandler(
+                filters.ChatType.GROUPS & (filters.PHOTO | filters.Document.ALL),
+                self._remember_album_message
+            )
+        ]
+
+    async def _remember_album_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Keep recent album messages so /tojpg can convert a whole media group"""
+        message = update.effective_message
+        if not message or not message.media_group_id:
+            return
+
+        key = (message.chat_id, message.media_group_id)
+        album = self._albums.pop(key, {})
+        album[message.message_id] = message
+        self._albums[key] = album
+
+        # Forget the least recently seen albums
+        while len(self._albums) > TOJPG_ALBUM_CACHE_SIZE:
+            self._albums.popitem(last=False)
+
+    def _get_album_messages(self, message) -> list:
+        """Image messages of the album `message` belongs to, in album order"""
+        if not message.media_group_id:
+            return [message]
+
+        album = dict(self._albums.get((message.chat_id, message.media_group_id), {}))
+        album[message.message_id] = message
+        return [
+            album_message for _, album_message in sorted(album.items())
+            if album_message.photo or (album_message.document and self._is_image_document(album_message.document))
+        ]
+
+    def _get_encoding(self, command_text: str, chat_id: int) -> tuple[str, int | None]:
+        """Encoding (profile, target_size) from the command, else the group's or the default one"""
+        for part in command_text.split()[1:]:
+            encoding = parse_encoding_option(part)
+            if encoding:
+                return encoding
+
+        return (
+            parse_encoding_option(TOJPG_GROUP_PROFILES.get(chat_id, TOJPG_DEFAULT_PROFILE))
+            or ("balanced", None)
+        )
+
+    def _is_image_document(self, document) -> bool:
+        # The real format is sniffed after download; this only filters obvious non-images
+        if document.mime_type and document.mime_type.startswith("image/"):
+            return True
+
+        if not document.file_name:
+            return False
+
+        file_ext = os.path.splitext(document.file_name.lower())[1]
+        supported_formats = [fmt.lower() for fmt in SUPPORTED_IMAGE_FORMATS]
+
+        # Add HEIC support
+        if HEIC_SUPPORTED:
+            supported_formats.extend(['.heic', '.heif'])
+
+        return file_ext.lower() in supported_formats
+
+    async def _download(self, file) -> bytes | str:
+        """Download a file into a single in-memory buffer, or to disk if it is large
+
+        Returns the image bytes, or the path of the temporary file holding them.
+        """
+        if file.file_size and file.file_size > TOJPG_SPOOL_THRESHOLD_MB * 1024 * 1024:
+            # Large files are streamed to disk and opened by path in the worker,
+            # so they are never copied through the process pool pipe
+            fd, temp_path = tempfile.mkstemp(prefix="tojpg_")
+            os.close(fd)
+            try:
+                await file.download_to_drive(temp_path)
+            except Exception:
+                self._cleanup_temp_file(temp_path)
+                raise
+            return temp_path
+
+        # getvalue() hands over the downloaded buffer without copying it again
+        buffer = io.BytesIO()
+        await file.download_to_memory(out=buffer)
+        return buffer.getvalue()
+
+    def _cleanup_temp_file(self, temp_path: str):
+        """Delete temporary file"""
+        try:
+            os.remove(temp_path)
+        except Exception as e:
+            print(t("to_jpg.temp_cleanup_error", path=temp_path, error=e))
+
+    def _check_file_size(self, file_size: int):
+        """Refuse files above the download budget"""
+        limit = TOJPG_MAX_FILE_MB * 1024 * 1024
+        if file_size and file_size > limit:
+            raise Exception(t("to_jpg.file_too_large",
+                              size=format_file_size(file_size), limit=format_file_size(limit)))
+
+    def _get_media(self, message):
+        """Return the file to convert and its original name"""
+        if message.document:
+            return message.document, message.document.file_name
+        # photo: largest size
+        return message.photo[-1], f"photo_{message.message_id}.jpg"
+
+    async def _download_and_convert(self, context, media, encoding: tuple, status_message=None) -> bytes:
+        """Download a file and convert it to JPG, skipping the encoder when it already is one"""
+        # Enforce the byte budget from Telegram's metadata before downloading anything
+        self._check_file_size(media.file_size)
+        file = await context.bot.get_file(media.file_id)
+        self._check_file_size(file.file_size)
+        with metrics.time("tojpg_stage_duration_seconds", stage="download"):
+            source = await self._download(file)
+        try:
+            # Trust the magic bytes, not the file name
+            image_format = sniff_image_format(source)
+            if image_format is None:
+                raise Exception(t("to_jpg.not_image_document"))
+            if image_format == 'heif' and not HEIC_SUPPORTED:
+                raise Exception(t("to_jpg.heic_not_supported"))
+
+            _, target_size = encoding
+            if can_pass_through(source, target_size):
+                if isinstance(source, str):
+                    return await asyncio.to_thread(Path(source).read_bytes)
+                return source
+
+            return await self._convert_to_jpg(source, encoding, status_message)
+        finally:
+            if isinstance(source, str):
+                self._cleanup_temp_file(source)
+
+    async def _convert_single_message(self, message, context, send_as_photo=False, encoding=("balanced", None),
+                                      status_message=None):
+        """Convert a single message (document or photo)"""
+        try:
+            # Detect file type
+            media, original_name = self._get_media(message)
+
+            # New filename
+            new_name = os.path.splitext(original_name)[0] + ".jpg"
+
+            # Telegram photos already are baseline JPEGs: re-send without downloading
+            _, target_size = encoding
+            if send_as_photo and message.photo and not (target_size and (media.file_size or 0) > target_size):
+                await message.reply_photo(photo=media.file_id)
+                return
+
+            # Same source already converted: re-send it without downloading or encoding
+            cache_key = conversion_cache.make_key(media.file_unique_id, send_as_photo, encoding_settings(*encoding))
+            if await self._send_cached(message, cache_key, send_as_photo, new_name):
+                return
+            conversion_cache.stats["misses"] += 1
+
+            jpg_bytes = await self._download_and_convert(context, media, encoding, status_message)
+
+            # Update status for upload
+            if status_message:
+                await status_message.edit_text(t("to_jpg.uploading"))
+
+            sent = await self._send_jpg(message, jpg_bytes, send_as_photo, new_name)
+            await conversion_cache.store(cache_key, self._sent_file_id(sent, send_as_photo), jpg_bytes)
+
+            # Delete status message
+            if status_message:
+                try:
+                    await status_message.delete()
+                except:
+                    pass
+
+        except Exception as e:
+            error_message = t("to_jpg.conversion_error", error=str(e))
+            if status_message:
+                try:
+                    await status_message.edit_text(error_message)
+                except:
+                    await message.reply_text(error_message)
+            else:
+                await message.reply_text(error_message)
+
+    async def _prepare_album_item(self, message, context, send_as_photo: bool, encoding: tuple,
+                                  use_file_id: bool = True) -> tuple:
+        """Get one album item as (cache_key, file_name, jpg, converted)
+
+        `jpg` is a cached Telegram file_id, cached bytes or freshly encoded bytes.
+        With use_file_id=False it always is bytes, as after Telegram rejected a file_id.
+        """
+        media, original_name = self._get_media(message)
+        new_name = os.path.splitext(original_name)[0] + ".jpg"
+        cache_key = conversion_cache.make_key(media.file_unique_id, send_as_photo, encoding_settings(*encoding))
+
+        # Telegram photos already are baseline JPEGs: re-send without downloading
+        _, target_size = encoding
+        if (use_file_id and send_as_photo and message.photo
+                and not (target_size and (media.file_size or 0) > target_size)):
+            return cache_key, new_name, media.file_id, False
+
+        if use_file_id:
+            file_id = await conversion_cache.get_file_id(cache_key)
+            if file_id:
+                conversion_cache.stats["hits"] += 1
+                return cache_key, new_name, file_id, False
+
+        jpg_bytes = await conversion_cache.get_bytes(cache_key)
+        if jpg_bytes:
+            conversion_cache.stats["disk_hits"] += 1
+            return cache_key, new_name, jpg_bytes, False
+
+        conversion_cache.stats["misses"] += 1
+        jpg_bytes = await self._download_and_convert(context, media, encoding)
+        return cache_key, new_name, jpg_bytes, True
+
+    async def _convert_album(self, reply_msg, messages: list, context, send_as_photo: bool, encoding: tuple,
+                             status_message):
+        """Convert every image of an album in parallel and send them back as media groups"""
+        total = len(messages)
+        done = 0
+        semaphore = asyncio.Semaphore(TOJPG_ALBUM_CONCURRENCY)
+
+        async def prepare(message):
+            nonlocal done
+            async with semaphore:
+                try:
+                    return await self._prepare_album_item(message, context, send_as_photo, encoding)
+                except Exception as e:
+                    return e
+                finally:
+                    done += 1
+                    try:
+                        await status_message.edit_text(t("to_jpg.album_progress", done=done, total=total))
+                    except:
+                        pass
+
+        results = await asyncio.gather(*(prepare(message) for message in messages))
+        items = [result for result in results if not isinstance(result, Exception)]
+        item_messages = [message for message, result in zip(messages, results) if not isinstance(result, Exception)]
+        errors = [result for result in results if isinstance(result, Exception)]
+
+        if items:
+            try:
+                await status_message.edit_text(t("to_jpg.uploading"))
+            except:
+                pass
+
+            # Albums hold at most 10 items; keep the message order of the source album
+            for start in range(0, len(items), MEDIA_GROUP_MAX_SIZE):
+                end = start + MEDIA_GROUP_MAX_SIZE
+                try:
+                    await self._send_album_chunk(
+                        reply_msg, items[start:end], item_messages[start:end], context, send_as_photo, encoding
+                    )
+                except Exception as e:
+                    errors.append(e)
+
+        if errors:
+            await reply_msg.reply_text(
+                t("to_jpg.album_errors", failed=len(errors), total=total, error=str(errors[0]))
+            )
+
+    async def _send_album_chunk(self, reply_msg, items: list, messages: list, context, send_as_photo: bool,
+                                encoding: tuple):
+        """Send up to 10 converted images as one media group and cache their file_ids"""
+        try:
+            sent_messages = await self._send_media_group(reply_msg, items, send_as_photo)
+        except BadRequest:
+            # A cached file_id may have been rejected: forget them and retry with bytes
+            if not any(isinstance(jpg, str) for _, _, jpg, _ in items):
+                raise
+            for index, (cache_key, _, jpg, _) in enumerate(items):
+                if isinstance(jpg, str):
+                    await conversion_cache.invalidate_file_id(cache_key)
+                    items[index] = await self._prepare_album_item(
+                        messages[index], context, send_as_photo, encoding, use_file_id=False
+                    )
+            sent_messages = await self._send_media_group(reply_msg, items, send_as_photo)
+
+        for (cache_key, _, jpg, converted), sent in zip(items, sent_messages):
+            await conversion_cache.store(
+                cache_key, self._sent_file_id(sent, send_as_photo), jpg if converted else None
+            )
+
+    async def _send_media_group(self, reply_msg, items: list, send_as_photo: bool) -> list:
+        """Reply with the items as a media group (a single item is sent on its own)"""
+        if len(items) == 1:
+            _, file_name, jpg, _ = items[0]
+            return [await self._send_jpg(reply_msg, jpg, send_as_photo, file_name)]
+
+        if send_as_photo:
+            media = [InputMediaPhoto(media=jpg) for _, _, jpg, _ in items]
+        else:
+            media = [InputMediaDocument(media=jpg, filename=file_name) for _, file_name, jpg, _ in items]
+        with metrics.time("tojpg_stage_duration_seconds", stage="upload"):
+            return await reply_msg.reply_media_group(media=media)
+
+    async def _send_jpg(self, message, jpg, send_as_photo: bool, file_name: str):
+        """Reply with a JPG given as bytes or as a Telegram file_id"""
+        # Bytes are uploaded as they are, without wrapping them in another buffer
+        with metrics.time("tojpg_stage_duration_seconds", stage="upload"):
+            if send_as_photo:
+                return await message.reply_photo(
+                    photo=jpg
+                )
+            return await message.reply_document(
+                document=jpg,
+                filename=file_name
+            )
+
+    def _sent_file_id(self, sent_message, send_as_photo: bool) -> str:
+        """file_id Telegram assigned to an uploaded JPG"""
+        if send_as_photo:
+            return sent_message.photo[-1].file_id
+        return sent_message.document.file_id
+
+    async def _send_cached(self, message, cache_key: str, send_as_photo: bool, file_name: str) -> bool:
+        """Answer from the conversion cache, returns False on a miss"""
+        file_id = await conversion_cache.get_file_id(cache_key)
+        if file_id:
+            try:
+                await self._send_jpg(message, file_id, send_as_photo, file_name)
+                conversion_cache.stats["hits"] += 1
+                return True
+            except BadRequest:
+                await conversion_cache.invalidate_file_id(cache_key)
+
+        # The file_id is unknown or was rejected, fall back to the encoded bytes on disk
+        jpg_bytes = await conversion_cache.get_bytes(cache_key)
+        if jpg_bytes:
+            sent = await self._send_jpg(message, jpg_bytes, send_as_photo, file_name)
+            await conversion_cache.store(cache_key, self._sent_file_id(sent, send_as_photo))
+            conversion_cache.stats["disk_hits"] += 1
+            return True
+
+        return False
+
+    async def _convert_to_jpg(self, source: bytes | str, encoding: tuple, status_message=None) -> bytes:
+        """Convert image bytes (or a temporary file path) to JPG in the conversion pool"""
+        # Tell the user where they are in the queue instead of waiting silently
+        position = conversion_pool.queue_position
+        if position and status_message:
+            await status_message.edit_text(t("to_jpg.queued", position=position))
+
+        try:
+            # Includes the wait for a free worker; decoding and encoding both run in the worker
+            with metrics.time("tojpg_stage_duration_seconds", stage="convert"):
+                return await conversion_pool.run(convert_to_jpg, source, *encoding)
+        except ConversionQueueFullError:
+            raise Exception(t("to_jpg.queue_full"))
+        except ImageTooLargeError as e:
+            raise Exception(t("to_jpg.too_many_pixels", megapixels=e.megapixels, limit=e.limit))
+        except MemoryError:
+            raise Exception(t("to_jpg.out_of_memory"))
+        except BrokenProcessPool:
+            raise Exception(t("to_jpg.worker_crashed"))
+        except asyncio.TimeoutError:
+            raise Exception(t("to_jpg.timeout", seconds=conversion_pool.timeout))
+        except Exception as e:
+            raise Exception(t("to_jpg.image_conversion_error", error=str(e)))
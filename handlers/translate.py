@@ -1,128 +1,202 @@
-import logging
-from googletrans import Translator, LANGUAGES
-from telegram import Update
-from telegram.ext import ContextTypes
-from config import DEFAULT_TRANSLATE_TO, TRANSLATE_FROM
-from translations import t
-
-
-class TranslateHandler:
-    def __init__(self):
-        self.name = t("translate.handler_name")
-
-    def get_command_name(self):
-        return "translate"
-
-    def _get_language_code(self, lang_input):
-        """Convert language input to valid language code"""
-        if not lang_input:
-            return None
-
-        lang_input = lang_input.lower().strip()
-
-        # If it's already a valid language code
-        if lang_input in LANGUAGES:
-            return lang_input
-
-        # Search in language names
-        for code, name in LANGUAGES.items():
-            if name.lower() == lang_input:
-                return code
-
-        return None
-
-    def _get_language_name(self, lang_code):
-        """Get language name from code"""
-        return LANGUAGES.get(lang_code, lang_code)
-
-    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle translate command"""
-        try:
-            # Check if command is a reply to a message
-            if not update.message.reply_to_message:
-                await update.message.reply_text(t("translate.reply_required"))
-                return
-
-            # Get the text to translate
-            target_message = update.message.reply_to_message
-
-            # Extract text from different message types
-            text_to_translate = None
-            if target_message.text:
-                text_to_translate = target_message.text
-            elif target_message.caption:
-                text_to_translate = target_message.caption
-            else:
-                await update.message.reply_text(t("translate.no_text"))
-                return
-
-            # Get target language from command arguments
-            target_language = DEFAULT_TRANSLATE_TO
-            if context.args:
-                provided_lang = context.args[0]
-                lang_code = self._get_language_code(provided_lang)
-                if lang_code:
-                    target_language = lang_code
-                else:
-                    available_langs = ", ".join(list(LANGUAGES.keys())[:20])  # Show first 20 languages
-                    await update.message.reply_text(
-                        t("translate.invalid_language",
-                          language=provided_lang,
-                          examples=available_langs)
-                    )
-                    return
-
-            # Send "translating..." message
-            status_message = await update.message.reply_text(t("translate.translating"))
-
-            # Perform translation and detection in single session
-            try:
-                async with Translator() as translator:
-                    # Detect source language if auto-detect is enabled
-                    source_language = TRANSLATE_FROM
-                    detected_lang = None
-                    confidence = 0
-
-                    if source_language == "auto":
-                        try:
-                            detected = await translator.detect(text_to_translate)
-                            detected_lang = detected.lang
-                            confidence = detected.confidence
-                            source_language = detected_lang
-                        except Exception as e:
-                            logging.error(f"Error detecting language: {e}")
-                            source_language = "auto"  # Let translate handle it
-
-                    # Check if source and target languages are the same
-                    if source_language == target_language:
-                        await status_message.edit_text(
-                            t("translate.same_language",
-                              language=self._get_language_name(target_language))
-                        )
-                        return
-
-                    # Perform translation
-                    translation = await translator.translate(
-                        text_to_translate,
-                        src=source_language,
-                        dest=target_language
-                    )
-
-                    # Prepare response
-                    source_lang_name = self._get_language_name(translation.src)
-                    target_lang_name = self._get_language_name(translation.dest)
-
-                    # Edit the status message with only the translated text
-                    await status_message.edit_text(translation.text)
-
-            except Exception as e:
-                logging.error(f"Translation error: {e}")
-                await status_message.edit_text(
-                    t("translate.translation_error", error=str(e))
-                )
-
-        except Exception as e:
-            logging.error(f"Error in translate handler: {e}")
-            await update.message.reply_text(
-                t("translate.general_error", error=str(e))
+import asyncio
+import logging
+from datetime import datetime, timezone
+from googletrans import Translator, LANGUAGES
+from telegram import Update
+from telegram.constants import MessageLimit, ParseMode
+from telegram.ext import ContextTypes
+from .base_handler import BaseHandler
+from config import (
+    DEFAULT_TRANSLATE_TO, TRANSLATE_FROM, LANGUAGE_DETECTION_MIN_CONFIDENCE, TRANSLATE_CHUNK_SIZE,
+    TRANSLATE_MAX_CONCURRENCY
+)
+from database.db_manager import prune_translation_cache
+from translations import t
+from utils.helpers import to_epoch_ms
+from utils.language_detector import language_detector
+from utils.metrics import metrics
+from utils.languages import language_index, POPULAR_LANGUAGES
+from utils.text_chunker import protect_entities, restore_entities, split_text, pack_chunks, strip_placeholders
+from utils.translation_cache import translation_cache
+
+
+class TranslateHandler(BaseHandler):
+    def __init__(self):
+        super().__init__(t("translate.handler_name"))
+        self._translator = None
+        # Caps concurrent upstream requests across all /translate commands
+        self._semaphore = asyncio.Semaphore(TRANSLATE_MAX_CONCURRENCY)
+
+    def get_command_name(self):
+        return "translate"
+
+    def _get_language_name(self, lang_code):
+        """Get language name from code"""
+        return LANGUAGES.get(lang_code, lang_code)
+
+    async def on_startup(self, application):
+        # One client for the whole bot lifetime, so connections are pooled and reused
+        self._translator = Translator()
+
+        # Drop persisted translations that have outlived the cache TTL
+        await prune_translation_cache(
+            to_epoch_ms(datetime.now(timezone.utc)) - int(translation_cache.ttl_seconds * 1000)
+        )
+
+    async def on_shutdown(self):
+        if self._translator is not None:
+            await self._translator.client.aclose()
+            self._translator = None
+
+    async def _translate(self, text, source_language, target_language):
+        """Translate text, returns (translated_text, source_language)
+
+        With auto-detection the detected language comes back with the
+        translation itself, so no separate detect request is made.
+        """
+        async with self._semaphore:
+            try:
+                with metrics.time("translation_upstream_duration_seconds"):
+                    translation = await self._translator.translate(
+                        text,
+                        src=source_language,
+                        dest=target_language
+                    )
+            except Exception:
+                metrics.inc("translation_errors_total")
+                raise
+        return translation.text, translation.src.lower()
+
+    async def _translate_chunk(self, chunk, source_language, target_language):
+        """Translate one chunk through the cache, returns (translated_text, source_language)"""
+        # Only placeholders, whitespace or punctuation: nothing to send upstream
+        if not any(char.isalpha() for char in strip_placeholders(chunk)):
+            return chunk, None
+
+        return await translation_cache.get_or_translate(
+            chunk,
+            source_language,
+            target_language,
+            lambda: self._translate(chunk, source_language, target_language)
+        )
+
+    async def _translate_message(self, text, entities, source_language, target_language):
+        """Translate a whole message, returns (HTML messages to send, detected source languages)"""
+        masked_text, replacements = protect_entities(text, entities)
+        chunks = split_text(masked_text, TRANSLATE_CHUNK_SIZE)
+
+        # Translators trim whitespace, so only the chunk cores are translated
+        cores = [chunk.strip() for chunk in chunks]
+        results = await asyncio.gather(
+            *(self._translate_chunk(core, source_language, target_language) for core in cores)
+        )
+
+        rendered = []
+        translated_from = set()
+        for chunk, core, (translated_text, chunk_language) in zip(chunks, cores, results):
+            if chunk_language:
+                translated_from.add(chunk_language)
+            leading = chunk[:len(chunk) - len(chunk.lstrip())]
+            trailing = chunk[len(chunk.rstrip()):] if core else ""
+            rendered.append((
+                leading + restore_entities(translated_text, core, replacements) + trailing,
+                leading + restore_entities(translated_text, core, replacements, markup=False) + trailing
+            ))
+
+        return pack_chunks(rendered, MessageLimit.MAX_TEXT_LENGTH), translated_from
+
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle translate command"""
+        try:
+            # Check if command is a reply to a message
+            if not update.message.reply_to_message:
+                await update.message.reply_text(t("translate.reply_required"))
+                return
+
+            # Get the text to translate
+            target_message = update.message.reply_to_message
+
+            # Extract text from different message types
+            text_to_translate = None
+            if target_message.text:
+                text_to_translate = target_message.text
+                entities = target_message.entities
+            elif target_message.caption:
+                text_to_translate = target_message.caption
+                entities = target_message.caption_entities
+            else:
+                await update.message.reply_text(t("translate.no_text"))
+                return
+
+            # Get target language from command arguments
+            target_language = DEFAULT_TRANSLATE_TO
+            if context.args:
+                provided_lang = " ".join(context.args)
+                lang_code, suggestions = language_index.resolve(provided_lang)
+                if lang_code:
+                    target_language = lang_code
+                else:
+                    examples = ", ".join(
+                        f"{code} ({self._get_language_name(code)})"
+                        for code in suggestions or POPULAR_LANGUAGES
+                    )
+                    await update.message.reply_text(
+                        t("translate.language_suggestions" if suggestions else "translate.invalid_language",
+                          language=provided_lang,
+                          examples=examples)
+                    )
+                    return
+
+            # Detect the language locally when we can, so text already in the
+            # target language never reaches the translation service
+            source_language = TRANSLATE_FROM
+            if source_language == "auto":
+                detected_language, confidence = language_detector.detect(text_to_translate)
+                if detected_language and confidence >= LANGUAGE_DETECTION_MIN_CONFIDENCE:
+                    if detected_language == target_language:
+                        await update.message.reply_text(
+                            t("translate.same_language",
+                              language=self._get_language_name(target_language))
+                        )
+                        return
+                    source_language = detected_language
+
+            # Send "translating..." message
+            status_message = await update.message.reply_text(t("translate.translating"))
+
+            # Translate the text chunk by chunk, keeping links, code and mentions as they are
+            try:
+                messages, translated_from = await self._translate_message(
+                    text_to_translate, entities, source_language, target_language
+                )
+
+                # Nothing but links, code or mentions in the message
+                if not translated_from:
+                    await status_message.edit_text(t("translate.no_text"))
+                    return
+
+                # Check if source and target languages are the same
+                if translated_from == {target_language}:
+                    await status_message.edit_text(
+                        t("translate.same_language",
+                          language=self._get_language_name(target_language))
+                    )
+                    return
+
+                # Edit the status message with the translated text, long
+                # translations continue in further replies
+                await status_message.edit_text(messages[0], parse_mode=ParseMode.HTML)
+                for message_text in messages[1:]:
+                    await update.message.reply_text(message_text, parse_mode=ParseMode.HTML)
+
+            except Exception as e:
+                logging.error(f"Translation error: {e}")
+                await status_message.edit_text(
+                    t("translate.translation_error", error=str(e))
+                )
+
+        except Exception as e:
+            logging.error(f"Error in translate handler: {e}")
+            await update.message.reply_text(
+                t("translate.general_error", error=str(e))
             )
\ No newline at end of file
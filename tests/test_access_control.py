@@ -0,0 +1,61 @@
+import asyncio
+import database.db_manager as db_manager
+from utils.access_control import AccessControl
+
+CONFIGURED_GROUP = -1001000000001
+OTHER_GROUP = -1001000000002
+
+
+def run_with_db(test, tmp_path, monkeypatch):
+    monkeypatch.setattr(db_manager, "DB_PATH", str(tmp_path / "bot.db"))
+
+    async def run():
+        await db_manager.init_db()
+        try:
+            return await test()
+        finally:
+            await db_manager.close_db()
+
+    return asyncio.run(run())
+
+
+def test_disallowed_configured_group_stays_disallowed_after_restart(tmp_path, monkeypatch):
+    async def test():
+        first_run = AccessControl(600)
+        await first_run.load([CONFIGURED_GROUP])
+        await first_run.disallow_group(CONFIGURED_GROUP)
+
+        after_disallow = AccessControl(600)
+        await after_disallow.load([CONFIGURED_GROUP, OTHER_GROUP])
+        allowed_after_restart = after_disallow.allowed_groups
+        await after_disallow.allow_group(CONFIGURED_GROUP)
+
+        after_allow = AccessControl(600)
+        await after_allow.load([CONFIGURED_GROUP])
+        return allowed_after_restart, after_allow
+
+    allowed_after_restart, after_allow = run_with_db(test, tmp_path, monkeypatch)
+
+    # Groups newly added to the configuration are still allowed on startup
+    assert allowed_after_restart == [OTHER_GROUP]
+    assert after_allow.allowed_groups == [OTHER_GROUP, CONFIGURED_GROUP]
+
+
+def test_reload_picks_up_changes_of_other_instances(tmp_path, monkeypatch):
+    async def test():
+        instance, other_instance = AccessControl(600), AccessControl(600)
+        await instance.load([CONFIGURED_GROUP])
+        await other_instance.load([CONFIGURED_GROUP])
+
+        await other_instance.allow_group(OTHER_GROUP)
+        await other_instance.set_del_admins_only(OTHER_GROUP, True)
+        await other_instance.disallow_group(CONFIGURED_GROUP)
+        before_reload = instance.allowed_groups
+        await instance.reload()
+        return before_reload, instance
+
+    before_reload, instance = run_with_db(test, tmp_path, monkeypatch)
+
+    assert before_reload == [CONFIGURED_GROUP]
+    assert instance.allowed_groups == [OTHER_GROUP]
+    assert instance.is_del_admins_only(OTHER_GROUP)
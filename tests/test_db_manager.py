@@ -0,0 +1,130 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import database.db_manager as db_manager
+from utils.metrics import metrics
+
+# Bot instances started side by side on one database
+INSTANCES = 4
+
+
+def run_instances(target, *args) -> list:
+    """Run target(index, barrier, results, *args) in INSTANCES processes, return what they put in results"""
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(INSTANCES)
+    results = context.Queue()
+    processes = [
+        context.Process(target=target, args=(index, barrier, results, *args))
+        for index in range(INSTANCES)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    return collected
+
+
+def start_instance(index, barrier, results, db_path):
+    async def run():
+        barrier.wait()
+        try:
+            await db_manager.init_db()
+        except Exception as e:
+            return repr(e)
+        finally:
+            await db_manager.close_db()
+
+    db_manager.DB_PATH = db_path
+    results.put(asyncio.run(run()))
+
+
+def claim_until_empty(index, barrier, results, db_path):
+    async def run():
+        await db_manager.init_db()
+        claimed = []
+        barrier.wait()
+        try:
+            while True:
+                rows = await db_manager.claim_expired_messages(f"instance-{index}", 2_000, 10_000, limit=25)
+                if not rows:
+                    return claimed
+                claimed.extend(row[0] for row in rows)
+                # Deleting the messages through the Bot API takes a while
+                await asyncio.sleep(0.01)
+                await db_manager.delete_claimed_messages(f"instance-{index}", [row[0] for row in rows])
+        finally:
+            await db_manager.close_db()
+
+    db_manager.DB_PATH = db_path
+    results.put(asyncio.run(run()))
+
+
+def test_concurrent_startup_migrates_once(tmp_path):
+    db_path = str(tmp_path / "bot.db")
+    with sqlite3.connect(db_path) as db:
+        # Schema version 1, with ISO-8601 deadlines
+        db.execute("CREATE TABLE schema_version (version INTEGER NOT NULL)")
+        db.execute("INSERT INTO schema_version (version) VALUES (1)")
+        db.execute("""
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                delete_at TEXT NOT NULL,
+                handler_name TEXT DEFAULT 'del_after_24'
+            )
+        """)
+        db.executemany(
+            "INSERT INTO messages (chat_id, message_id, delete_at) VALUES (?, ?, ?)",
+            [(-100, message_id, "2024-01-01T00:00:00+00:00") for message_id in range(1000)]
+        )
+
+    errors = run_instances(start_instance, db_path)
+
+    assert errors == [None] * INSTANCES
+
+    with sqlite3.connect(db_path) as db:
+        versions = [row[0] for row in db.execute("SELECT version FROM schema_version ORDER BY version")]
+        deadlines = db.execute("SELECT DISTINCT delete_at FROM messages").fetchall()
+    assert versions == list(range(1, len(db_manager.MIGRATIONS) + 1))
+    assert deadlines == [(1704067200000,)]
+
+
+def test_instances_never_claim_the_same_record(tmp_path):
+    db_path = str(tmp_path / "bot.db")
+
+    async def seed():
+        await db_manager.init_db()
+        for message_id in range(2000):
+            await db_manager.save_message_for_deletion(-100 - message_id % 7, message_id, 1_000)
+        await db_manager.close_db()
+
+    db_manager.DB_PATH = db_path
+    asyncio.run(seed())
+
+    claims = run_instances(claim_until_empty, db_path)
+
+    claimed = [record_id for instance_claims in claims for record_id in instance_claims]
+    assert len(claimed) == len(set(claimed)) == 2000
+    # Every instance got a share, or the test did not exercise any contention
+    assert all(claims)
+
+
+def test_each_query_is_timed_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_manager, "DB_PATH", str(tmp_path / "bot.db"))
+
+    async def run():
+        await db_manager.init_db()
+        try:
+            before = metrics.total("db_query_duration_seconds")
+            await db_manager.save_allowed_group(-100123)
+            return metrics.total("db_query_duration_seconds") - before, await db_manager.get_allowed_groups()
+        finally:
+            await db_manager.close_db()
+
+    samples, groups = asyncio.run(run())
+    # get_allowed_groups ran after the count was taken
+    assert samples == 1
+    assert groups == [(-100123, False)]
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timezone
+from telegram.ext import ApplicationBuilder
+import utils.deletion_scheduler as deletion_scheduler_module
+from utils.deletion_scheduler import DeletionScheduler
+from utils.helpers import to_epoch_ms
+
+
+def now_ms() -> int:
+    return to_epoch_ms(datetime.now(timezone.utc))
+
+
+async def make_scheduler():
+    """A scheduler on a real (offline) job queue, recording its sweeps"""
+    application = ApplicationBuilder().token("123456:test").build()
+    await application.job_queue.start()
+
+    sweeps = []
+
+    async def sweep(bot):
+        sweeps.append(now_ms())
+
+    scheduler = DeletionScheduler()
+    scheduler._job_queue = application.job_queue
+    scheduler._sweep = sweep
+    # The job queue only holds a weak reference to the application
+    scheduler.application = application
+    return scheduler, application.job_queue, sweeps
+
+
+def test_overdue_deadline_is_swept_right_away():
+    async def run():
+        scheduler, job_queue, sweeps = await make_scheduler()
+        try:
+            # Deadline from before a restart: a job dated in the past would count as missed
+            scheduler.notify(now_ms() - 60_000)
+            await asyncio.sleep(0.3)
+        finally:
+            await job_queue.stop()
+        return sweeps
+
+    assert len(asyncio.run(run())) == 1
+
+
+def test_earlier_deadline_replaces_a_job_already_taken_to_run():
+    async def run():
+        scheduler, job_queue, sweeps = await make_scheduler()
+        try:
+            scheduler.notify(now_ms() + 60_000)
+            # The job queue has removed the job to run it, but _run has not started yet
+            scheduler._job.job.remove()
+
+            scheduler.notify(now_ms())
+            await asyncio.sleep(0.3)
+        finally:
+            await job_queue.stop()
+        return sweeps
+
+    assert len(asyncio.run(run())) == 1
+
+
+class FakeStorage:
+    """Deletion storage holding only deadlines"""
+
+    def __init__(self, deadlines: list):
+        self.deadlines = sorted(deadlines)
+
+    async def count_pending(self, current_time):
+        return len(self.deadlines), sum(deadline <= current_time for deadline in self.deadlines)
+
+    async def upcoming_deadlines(self, after=None, limit=None):
+        deadlines = [deadline for deadline in self.deadlines if after is None or deadline > after]
+        return deadlines[:limit]
+
+
+def run_first_sweep(monkeypatch, deadlines: list) -> list:
+    """Start a scheduler with a recovery sweep, return which sweeps ran"""
+    monkeypatch.setattr(deletion_scheduler_module, "deletion_storage", FakeStorage(deadlines))
+
+    async def run():
+        application = ApplicationBuilder().token("123456:test").build()
+        await application.job_queue.start()
+        ran = []
+
+        async def sweep(bot):
+            ran.append("sweep")
+
+        async def recovery(bot):
+            ran.append("recovery")
+
+        scheduler = DeletionScheduler()
+        try:
+            await scheduler.start(application.job_queue, sweep, recovery)
+            await asyncio.sleep(0.5)
+        finally:
+            scheduler.stop()
+            await application.job_queue.stop()
+        return ran
+
+    return asyncio.run(run())
+
+
+def test_recovery_sweep_after_downtime(monkeypatch):
+    assert run_first_sweep(monkeypatch, [now_ms() - 60_000]) == ["recovery"]
+
+
+def test_no_recovery_sweep_without_overdue_messages(monkeypatch):
+    # Falls due after startup: a regular sweep, with nothing to recover
+    assert run_first_sweep(monkeypatch, [now_ms() + 200]) == ["sweep"]
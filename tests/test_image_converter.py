@@ -0,0 +1,169 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import time
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from config import TOJPG_MAX_MEGAPIXELS
+from utils.image_converter import (
+    ConversionPool, ConversionQueueFullError, ImageTooLargeError, convert_to_jpg, init_worker
+)
+
+WORKERS = 2
+MAX_QUEUE = 6
+
+
+def make_png(size: int = 1024) -> bytes:
+    image = Image.effect_mandelbrot((size, size * 3 // 4), (-2, -1.2, 1, 1.2), 100).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def make_oversized(image_format: str) -> bytes:
+    """Grayscale image a fifth over the pixel budget, small once compressed"""
+    width = int((TOJPG_MAX_MEGAPIXELS * 1.2 * 1_000_000 * 4 / 3) ** 0.5)
+    image = Image.linear_gradient("L").resize((width, width * 3 // 4))
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def status_mb(field: str) -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def measure_conversion(source: bytes):
+    """Convert in this worker, returns (JPG or the error, peak RSS the conversion added in MB)"""
+    # Forget the peak reached before, e.g. while receiving the source
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before = status_mb("VmRSS")
+    try:
+        result = convert_to_jpg(source)
+    except Exception as e:
+        result = e
+    return result, status_mb("VmHWM") - before
+
+
+def convert_in_fresh_worker(source: bytes):
+    """measure_conversion() in a new worker set up like the conversion pool's"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context, initializer=init_worker) as executor:
+        return executor.submit(measure_conversion, source).result(timeout=60)
+
+
+def crash_worker():
+    """Die the way a worker killed by the kernel does, without an exception"""
+    time.sleep(0.2)
+    os._exit(1)
+
+
+async def measure_loop_lag(stop: asyncio.Event) -> float:
+    """Worst delay of a 10 ms timer on the event loop until `stop` is set"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - started - 0.01)
+    return worst
+
+
+def run_with_pool(test):
+    async def run():
+        pool = ConversionPool(WORKERS, MAX_QUEUE, timeout=60)
+        try:
+            return await test(pool)
+        finally:
+            pool.shutdown()
+
+    return asyncio.run(run())
+
+
+def test_pool_under_load():
+    source = make_png()
+
+    async def test(pool):
+        stop = asyncio.Event()
+        lag = asyncio.create_task(measure_loop_lag(stop))
+        # A full pool and queue, plus jobs that must be turned away
+        jobs = [asyncio.create_task(pool.run(convert_to_jpg, source)) for _ in range(WORKERS + MAX_QUEUE + 3)]
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        stop.set()
+        return results, await lag, pool.queued
+
+    results, lag, queued = run_with_pool(test)
+
+    converted = [result for result in results if isinstance(result, bytes)]
+    rejected = [result for result in results if isinstance(result, ConversionQueueFullError)]
+    assert len(converted) == WORKERS + MAX_QUEUE
+    assert len(rejected) == 3
+    assert all(jpg.startswith(b"\xff\xd8") for jpg in converted)
+    assert queued == 0
+    # Decoding and encoding never run on the event loop
+    assert lag < 0.1
+
+
+def test_worker_crash_fails_only_the_crashing_job():
+    source = make_png(256)
+
+    async def test(pool):
+        # Start the workers, so the crash hits jobs that are really in flight
+        await pool.run(convert_to_jpg, source)
+
+        crash = asyncio.create_task(pool.run(crash_worker))
+        others = [asyncio.create_task(pool.run(convert_to_jpg, source)) for _ in range(WORKERS + 2)]
+        crash_result, *other_results = await asyncio.gather(crash, *others, return_exceptions=True)
+        # The pool keeps working afterwards
+        after = await pool.run(convert_to_jpg, source)
+        return crash_result, other_results, after
+
+    crash_result, other_results, after = run_with_pool(test)
+
+    assert isinstance(crash_result, BrokenProcessPool)
+    assert all(isinstance(result, bytes) for result in other_results)
+    assert after.startswith(b"\xff\xd8")
+
+
+def test_job_after_a_crash_is_not_refused():
+    async def test(pool):
+        with pytest.raises(BrokenProcessPool):
+            await pool.run(crash_worker)
+        return await pool.run(convert_to_jpg, make_png(64))
+
+    assert run_with_pool(test).startswith(b"\xff\xd8")
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/clear_refs"), reason="peak RSS is measured through Linux /proc")
+@pytest.mark.parametrize("image_format", ["PNG", "TIFF"])
+def test_oversized_image_is_refused_before_decoding(image_format):
+    source = make_oversized(image_format)
+
+    result, peak_mb = convert_in_fresh_worker(source)
+
+    assert isinstance(result, ImageTooLargeError)
+    assert result.megapixels > result.limit == TOJPG_MAX_MEGAPIXELS
+    # Decoding would take a byte per pixel, converting to RGB three more
+    assert peak_mb < TOJPG_MAX_MEGAPIXELS * 0.2
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/clear_refs"), reason="peak RSS is measured through Linux /proc")
+def test_oversized_jpeg_is_downscaled_while_decoding():
+    source = make_oversized("JPEG")
+    width, height = Image.open(io.BytesIO(source)).size
+
+    jpg, peak_mb = convert_in_fresh_worker(source)
+
+    output = Image.open(io.BytesIO(jpg))
+    assert output.width * output.height <= TOJPG_MAX_MEGAPIXELS * 1_000_000
+    assert output.width / output.height == pytest.approx(width / height, rel=0.01)
+    # Decoded at half size in draft mode: decoding and encoding take less
+    # than decoding alone would at full size (a byte per pixel)
+    assert peak_mb < width * height / 1_000_000
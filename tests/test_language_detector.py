@@ -0,0 +1,16 @@
+from utils.language_detector import NEAR_NEIGHBOURS, language_detector
+
+
+def test_profiled_language_is_detected():
+    language, confidence = language_detector.detect("The meeting has been moved to Thursday afternoon, see you there")
+
+    assert language == "en"
+    assert confidence >= 0.9
+
+
+def test_text_in_a_near_neighbour_is_left_to_the_service():
+    # Malay, which fits the Indonesian profile as well as Indonesian does
+    malay = "Saya tidak dapat datang ke mesyuarat esok kerana kereta saya rosak"
+
+    assert language_detector.detect(malay) == (None, 0.0)
+    assert not NEAR_NEIGHBOURS.keys() & language_detector.languages
@@ -0,0 +1,136 @@
+import asyncio
+from telegram.ext import ApplicationBuilder
+from benchmarks.fake_bot_api import FakeBotApi
+from utils.metrics import metrics
+from utils.rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, TelegramRateLimiter
+
+GROUP_ID = -1001000000001
+OTHER_GROUP_ID = -1001000000002
+PRIVATE_CHAT_ID = 42
+
+
+def run_with_bot(test, global_per_second=1000, group_per_minute=1000, private_per_second=1000):
+    """Run test(bot, api) with a rate-limited bot talking to a local fake Bot API"""
+    async def run():
+        api = FakeBotApi()
+        await api.start()
+        limiter = TelegramRateLimiter(global_per_second, group_per_minute, private_per_second, max_retries=3)
+        application = (
+            ApplicationBuilder().token("123456:test").base_url(f"{api.url}/bot").rate_limiter(limiter).build()
+        )
+        await application.initialize()
+        try:
+            return await test(application.bot, api)
+        finally:
+            await application.shutdown()
+            await api.stop()
+
+    return asyncio.run(run())
+
+
+def sent(api, method="sendMessage", chat_id=None) -> list[tuple[float, dict]]:
+    """(time, params) of the calls the fake API received"""
+    return [
+        (at, params) for at, logged_method, params in api.log
+        if logged_method == method and (chat_id is None or params["chat_id"] == str(chat_id))
+    ]
+
+
+def test_chats_are_paced_separately():
+    async def test(bot, api):
+        # A burst of the bucket size goes out at once, the rest at the chat's rate
+        await asyncio.gather(
+            *(bot.send_message(GROUP_ID, str(index)) for index in range(64)),
+            *(bot.send_message(OTHER_GROUP_ID, str(index)) for index in range(2)),
+        )
+        return api
+
+    group_per_minute = 60
+    api = run_with_bot(test, group_per_minute=group_per_minute)
+
+    group = [at for at, _ in sent(api, chat_id=GROUP_ID)]
+    other = [at for at, _ in sent(api, chat_id=OTHER_GROUP_ID)]
+    assert len(group) == 64
+    # Four over the burst, a second apart
+    assert group[-1] - group[0] >= 4 * 60 / group_per_minute * 0.9
+    assert group[group_per_minute - 1] - group[0] < 1
+    # The busy group does not hold up the other one
+    assert max(other) - group[0] < 1
+
+
+def test_global_limit_spans_all_chats():
+    async def test(bot, api):
+        await asyncio.gather(*(bot.send_message(PRIVATE_CHAT_ID + index, "hi") for index in range(30)))
+        return api
+
+    api = run_with_bot(test, global_per_second=10)
+
+    times = [at for at, _ in sent(api)]
+    assert len(times) == 30
+    # 10 at once, the other 20 at 10 per second
+    assert times[-1] - times[0] >= 20 / 10 * 0.9
+
+
+def test_retry_after_requeues_and_pauses_the_chat():
+    retries = metrics.total("telegram_api_retries_total")
+
+    async def test(bot, api):
+        api.flood_next()
+        first = asyncio.create_task(bot.send_message(PRIVATE_CHAT_ID, "first"))
+        await asyncio.sleep(0.1)
+        # Queued behind the pause Telegram asked for
+        second = asyncio.create_task(bot.send_message(PRIVATE_CHAT_ID, "second"))
+        return await first, await second, api
+
+    first, second, api = run_with_bot(test)
+
+    calls = sent(api, chat_id=PRIVATE_CHAT_ID)
+    assert [params["text"] for _, params in calls] == ["first", "first", "second"]
+    flooded_at = calls[0][0]
+    assert calls[1][0] - flooded_at >= api.retry_after * 0.9
+    assert calls[2][0] - flooded_at >= api.retry_after * 0.9
+    assert first.text == "first" and second.text == "second"
+    assert metrics.total("telegram_api_retries_total") == retries + 1
+
+
+def test_interactive_calls_overtake_background_ones():
+    async def test(bot, api):
+        # Use up the chat's burst, so the next calls have to wait
+        await asyncio.gather(*(bot.send_message(PRIVATE_CHAT_ID, "burst") for _ in range(5)))
+        background = [
+            asyncio.create_task(bot.send_message(
+                PRIVATE_CHAT_ID, f"background {index}", rate_limit_args={"priority": PRIORITY_BACKGROUND}
+            ))
+            for index in range(3)
+        ]
+        await asyncio.sleep(0.05)
+        interactive = asyncio.create_task(bot.send_message(
+            PRIVATE_CHAT_ID, "interactive", rate_limit_args={"priority": PRIORITY_INTERACTIVE}
+        ))
+        await asyncio.gather(*background, interactive)
+        return api
+
+    api = run_with_bot(test, private_per_second=5)
+
+    texts = [params["text"] for _, params in sent(api) if params["text"] != "burst"]
+    assert texts == ["interactive", "background 0", "background 1", "background 2"]
+
+
+def test_waiting_message_edits_are_coalesced():
+    coalesced = metrics.total("telegram_api_coalesced_edits_total")
+
+    async def test(bot, api):
+        await asyncio.gather(*(bot.send_message(PRIVATE_CHAT_ID, "burst") for _ in range(5)))
+        # Progress updates of one status message, faster than the chat's rate
+        results = await asyncio.gather(*(
+            bot.edit_message_text(f"progress {index}", chat_id=PRIVATE_CHAT_ID, message_id=7)
+            for index in range(5)
+        ))
+        return results, api
+
+    results, api = run_with_bot(test, private_per_second=5)
+
+    edits = [params["text"] for _, params in sent(api, "editMessageText")]
+    assert edits == ["progress 4"]
+    assert results[:4] == [True] * 4
+    assert metrics.total("telegram_api_coalesced_edits_total") == coalesced + 4
@@ -0,0 +1,138 @@
+import html
+import re
+from telegram import MessageEntity
+from telegram.constants import MessageEntityType, MessageLimit
+from utils.text_chunker import pack_chunks, protect_entities, restore_entities, split_text, utf16_length
+
+MAX_LENGTH = MessageLimit.MAX_TEXT_LENGTH
+
+
+def entity(entity_type, text: str, before: str, **kwargs) -> MessageEntity:
+    """Entity covering `text`, placed right after `before`, in UTF-16 offsets"""
+    return MessageEntity(entity_type, utf16_length(before), utf16_length(text), **kwargs)
+
+
+def round_trip(text: str, entities, chunk_size: int) -> list[tuple[str, str]]:
+    """Mask, split and restore the text the way /translate does, with a translator returning its input"""
+    masked, replacements = protect_entities(text, entities)
+    chunks = split_text(masked, chunk_size)
+    assert "".join(chunks) == masked
+    return [
+        (restore_entities(chunk, chunk, replacements), restore_entities(chunk, chunk, replacements, markup=False))
+        for chunk in chunks
+    ]
+
+
+def test_long_text_splits_at_sentences():
+    sentence = "This sentence is one of many in a very long message. "
+    text = sentence * 200
+
+    chunks = split_text(text, MAX_LENGTH)
+
+    assert len(text) > MAX_LENGTH
+    assert len(chunks) == 3
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= MAX_LENGTH for chunk in chunks)
+    assert all(chunk.endswith(". ") for chunk in chunks)
+
+
+def test_text_without_boundaries_is_cut_hard():
+    text = "a" * (MAX_LENGTH * 2 + 10)
+
+    chunks = split_text(text, MAX_LENGTH)
+
+    assert [len(chunk) for chunk in chunks] == [MAX_LENGTH, MAX_LENGTH, 10]
+
+
+def test_hard_cut_keeps_surrogate_pairs_whole():
+    # Two UTF-16 code units each
+    text = "😀" * (MAX_LENGTH + 10)
+
+    chunks = split_text(text, MAX_LENGTH)
+
+    assert chunks == ["😀" * MAX_LENGTH, "😀" * 10]
+    assert all(chunk.encode("utf-16-le").decode("utf-16-le") == chunk for chunk in chunks)
+
+
+def test_paragraphs_are_preferred_over_lines():
+    paragraph = "line one\nline two\n\n"
+    chunks = split_text(paragraph * 3, len(paragraph) + 5)
+
+    assert chunks == [paragraph] * 3
+
+
+def test_entity_offsets_count_utf16_units():
+    before = "😀 Hi 𝒜, ask "
+    text = before + "@admin about `git log` 🙂"
+    entities = [
+        entity(MessageEntityType.MENTION, "@admin", before),
+        entity(MessageEntityType.CODE, "git log", before + "@admin about `"),
+    ]
+
+    masked, replacements = protect_entities(text, entities)
+
+    assert masked == "😀 Hi 𝒜, ask ⟦0⟧ about `⟦1⟧` 🙂"
+    assert replacements == [("@admin", "@admin"), ("<code>git log</code>", "git log")]
+
+
+def test_entities_at_chunk_boundaries_stay_whole():
+    filler = "Some words to translate around the entities. " * 30
+    code = "for item in items:\n    print(item)"
+    url = "https://example.com/a/very/long/path"
+    text = filler + code + " " + filler + url + " 😀" * 50 + " " + filler
+    entities = [
+        entity(MessageEntityType.PRE, code, filler, language="python"),
+        entity(MessageEntityType.URL, url, filler + code + " " + filler),
+    ]
+
+    # Chunks barely longer than the filler: both entities sit at a chunk boundary
+    rendered = round_trip(text, entities, len(filler) + 10)
+
+    assert "".join(plain for _, plain in rendered) == text
+    html_text = "".join(markup for markup, _ in rendered)
+    assert '<pre><code class="language-python">for item in items:\n    print(item)</code></pre>' in html_text
+    assert html_text.count(url) == 1
+    assert not re.search(r"⟦\d+⟧", html_text)
+
+
+def test_messages_respect_the_length_limit():
+    text = ("Emoji 😀 and text with <html> characters & more. " * 300).strip()
+    rendered = round_trip(text, [], 1500)
+
+    messages = pack_chunks(rendered, MAX_LENGTH)
+
+    assert len(text) > MAX_LENGTH * 3
+    # Two 1500 character chunks fit in a message, three do not
+    assert len(messages) == (len(rendered) + 1) // 2
+    assert all(len(html.unescape(message)) <= MAX_LENGTH for message in messages)
+    assert html.unescape("".join(messages)) == text
+
+
+def test_chunk_longer_than_a_message_is_split_as_plain_text():
+    text = "word " * 1000
+    messages = pack_chunks([("<b>ignored</b>", text)], MAX_LENGTH)
+
+    assert len(messages) == 2
+    assert all(len(message) <= MAX_LENGTH for message in messages)
+    assert "".join(messages) == text
+
+
+def test_message_length_counts_utf16_code_units():
+    # Under the limit in characters, over it in UTF-16 code units
+    text = ("Party 🎉🎉 tonight 😀. " * 200).strip()
+    rendered = round_trip(text, [], 1500)
+
+    messages = pack_chunks(rendered, MAX_LENGTH)
+
+    assert len(text) < MAX_LENGTH < utf16_length(text)
+    assert len(messages) == 2
+    assert all(utf16_length(html.unescape(message)) <= MAX_LENGTH for message in messages)
+    assert html.unescape("".join(messages)) == text
+
+
+def test_long_chunk_of_astral_characters_is_cut_by_utf16_length():
+    text = "😀" * 3000
+    messages = pack_chunks([(text, text)], MAX_LENGTH)
+
+    assert [utf16_length(message) for message in messages] == [MAX_LENGTH, 6000 - MAX_LENGTH]
+    assert "".join(messages) == text
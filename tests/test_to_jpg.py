@@ -0,0 +1,166 @@
+import asyncio
+import io
+from types import SimpleNamespace
+from PIL import Image
+from telegram.error import BadRequest
+import database.db_manager as db_manager
+import handlers.to_jpg as to_jpg
+from config import TOJPG_MAX_FILE_MB, TOJPG_WORKER_MEMORY_MB
+from handlers.to_jpg import ToJpgHandler
+from translations import t
+from utils.helpers import format_file_size
+from utils.image_converter import ConversionPool, convert_to_jpg
+from utils.metrics import metrics
+
+
+def make_jpg() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), "navy").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def make_png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), "navy").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def exceed_memory_ceiling(source, profile, target_size):
+    """Stands in for a conversion that needs more memory than a worker may use"""
+    return bytearray(TOJPG_WORKER_MEMORY_MB * 1024 * 1024)
+
+
+class FakeFile:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.file_size = len(data)
+
+    async def download_to_memory(self, out):
+        out.write(self.data)
+
+
+class FakeBot:
+    """Serves every file_id as the same JPEG, counting downloads"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.downloads = 0
+
+    async def get_file(self, file_id):
+        self.downloads += 1
+        return FakeFile(self.data)
+
+
+class FakeChat:
+    """Replies to media groups, rejecting any item sent by file_id"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def reply_media_group(self, media):
+        self.sent.append([item.media for item in media])
+        if any(isinstance(item.media, str) for item in media):
+            raise BadRequest("Wrong file identifier/http url specified")
+        return [
+            SimpleNamespace(photo=[SimpleNamespace(file_id=f"uploaded-{index}")])
+            for index in range(len(media))
+        ]
+
+
+class FakeMessage:
+    """Message with a document, recording the replies"""
+
+    def __init__(self, file_size: int):
+        self.message_id = 1
+        self.photo = None
+        self.document = SimpleNamespace(
+            file_id="document-1", file_unique_id="unique-document-1", file_name="image.png", file_size=file_size
+        )
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+
+def run_with_db(test, tmp_path, monkeypatch):
+    monkeypatch.setattr(db_manager, "DB_PATH", str(tmp_path / "bot.db"))
+
+    async def run():
+        await db_manager.init_db()
+        try:
+            return await test()
+        finally:
+            await db_manager.close_db()
+
+    return asyncio.run(run())
+
+
+def photo_message(message_id: int):
+    photo = SimpleNamespace(file_id=f"photo-{message_id}", file_unique_id=f"unique-{message_id}", file_size=1000)
+    return SimpleNamespace(message_id=message_id, document=None, photo=[photo])
+
+
+def test_rejected_photo_file_ids_are_uploaded_as_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_manager, "DB_PATH", str(tmp_path / "bot.db"))
+    jpg = make_jpg()
+    bot = FakeBot(jpg)
+    chat = FakeChat()
+    context = SimpleNamespace(bot=bot)
+    handler = ToJpgHandler()
+    messages = [photo_message(1), photo_message(2)]
+
+    async def run():
+        await db_manager.init_db()
+        try:
+            # Telegram photos are re-sent by file_id first
+            items = [await handler._prepare_album_item(message, context, True, ("balanced", None))
+                     for message in messages]
+            await handler._send_album_chunk(chat, items, messages, context, True, ("balanced", None))
+        finally:
+            await db_manager.close_db()
+
+    asyncio.run(run())
+
+    first, retry = chat.sent
+    assert first == ["photo-1", "photo-2"]
+    # The retry downloads the photos and uploads their bytes
+    assert not any(isinstance(media, str) for media in retry)
+    assert bot.downloads == 2
+
+
+def test_file_over_the_byte_limit_is_refused_before_download(tmp_path, monkeypatch):
+    bot = FakeBot(make_png())
+    message = FakeMessage((TOJPG_MAX_FILE_MB + 1) * 1024 * 1024)
+
+    run_with_db(
+        lambda: ToJpgHandler()._convert_single_message(message, SimpleNamespace(bot=bot)), tmp_path, monkeypatch
+    )
+
+    assert bot.downloads == 0
+    too_large = t("to_jpg.file_too_large", size=format_file_size(message.document.file_size),
+                  limit=format_file_size(TOJPG_MAX_FILE_MB * 1024 * 1024))
+    assert message.replies == [t("to_jpg.conversion_error", error=too_large)]
+
+
+def test_worker_over_the_memory_ceiling_gets_an_out_of_memory_reply(tmp_path, monkeypatch):
+    png = make_png()
+    bot = FakeBot(png)
+    message = FakeMessage(len(png))
+    pool = ConversionPool(1, 2, timeout=60)
+    monkeypatch.setattr(to_jpg, "conversion_pool", pool)
+    monkeypatch.setattr(to_jpg, "convert_to_jpg", exceed_memory_ceiling)
+    restarts = metrics.total("conversion_pool_restarts_total")
+
+    async def test():
+        try:
+            await ToJpgHandler()._convert_single_message(message, SimpleNamespace(bot=bot))
+            # The worker survived its MemoryError and keeps serving
+            return await pool.run(convert_to_jpg, png)
+        finally:
+            pool.shutdown()
+
+    jpg = run_with_db(test, tmp_path, monkeypatch)
+
+    assert message.replies == [t("to_jpg.conversion_error", error=t("to_jpg.out_of_memory"))]
+    assert jpg.startswith(b"\xff\xd8")
+    assert metrics.total("conversion_pool_restarts_total") == restarts
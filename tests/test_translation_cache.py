@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+import database.db_manager as db_manager
+from utils.translation_cache import TranslationCache
+
+
+class SlowTranslator:
+    """Stand-in for the translation service, counting its calls"""
+
+    def __init__(self, error: Exception = None):
+        self.calls = 0
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        if self.error:
+            raise self.error
+        return "hola", "en"
+
+
+def run_with_cache(test, tmp_path, monkeypatch):
+    monkeypatch.setattr(db_manager, "DB_PATH", str(tmp_path / "bot.db"))
+
+    async def run():
+        await db_manager.init_db()
+        try:
+            return await test(TranslationCache(100, 3600))
+        finally:
+            await db_manager.close_db()
+
+    return asyncio.run(run())
+
+
+def test_identical_requests_share_one_upstream_call(tmp_path, monkeypatch):
+    translator = SlowTranslator()
+
+    async def test(cache):
+        results = await asyncio.gather(*(cache.get_or_translate("hello", "auto", "es", translator) for _ in range(5)))
+        return results, cache.stats["coalesced"]
+
+    results, coalesced = run_with_cache(test, tmp_path, monkeypatch)
+    assert results == [("hola", "en")] * 5
+    assert translator.calls == 1
+    assert coalesced == 4
+
+
+def test_waiters_share_the_upstream_error(tmp_path, monkeypatch):
+    translator = SlowTranslator(error=RuntimeError("upstream down"))
+
+    async def test(cache):
+        results = await asyncio.gather(
+            *(cache.get_or_translate("hello", "auto", "es", translator) for _ in range(3)),
+            return_exceptions=True
+        )
+        return results, cache._in_flight
+
+    results, in_flight = run_with_cache(test, tmp_path, monkeypatch)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert translator.calls == 1
+    assert not in_flight
+
+
+def test_cancelled_request_does_not_strand_its_waiters(tmp_path, monkeypatch):
+    translator = SlowTranslator()
+
+    async def test(cache):
+        leader = asyncio.create_task(cache.get_or_translate("hello", "auto", "es", translator))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cache.get_or_translate("hello", "auto", "es", translator))
+        await asyncio.sleep(0.01)
+        # e.g. the update handling the first request timed out
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        result = await asyncio.wait_for(waiter, 5)
+        return result, cache._in_flight
+
+    result, in_flight = run_with_cache(test, tmp_path, monkeypatch)
+    assert result == ("hola", "en")
+    assert translator.calls == 2
+    assert not in_flight
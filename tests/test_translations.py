@@ -0,0 +1,35 @@
+import string
+import translations
+from translations import Translator, _compile_template, available_languages, check_missing_keys
+
+
+def test_compiled_templates_format_like_str_format():
+    for language in available_languages():
+        for key, (text, render) in Translator(language).translations.items():
+            fields = [field for _, field, _, _ in string.Formatter().parse(text) if field is not None]
+            kwargs = {field: f"<{field}>" for field in fields}
+            if fields:
+                assert render(kwargs) == text.format(**kwargs), key
+            else:
+                assert render is None, key
+
+
+def test_compiled_template_keeps_quotes_braces_and_specs():
+    text = "{{literal}} 'single' \"double\" \\ {name!r:>8} {count:03d}"
+    kwargs = {"name": "x", "count": 7, "unused": 1}
+
+    assert _compile_template(text)(kwargs) == text.format(**kwargs)
+
+
+def test_missing_argument_returns_the_key():
+    translator = Translator("en")
+
+    assert translator.get("del_message.scheduled_confirmation", other="x") == "del_message.scheduled_confirmation"
+
+
+def test_key_check_does_not_load_locales(monkeypatch):
+    monkeypatch.setattr(translations, "_locales", {})
+
+    check_missing_keys()
+
+    assert translations._locales == {}
@@ -1,50 +1,214 @@
-# translations.py
-import json
-import os
-
-
-class Translator:
-    def __init__(self, language="en"):
-        self.language = language
-        self.translations = {}
-        self.load_translations()
-
-    def load_translations(self):
-        """Load translations from JSON file"""
-        file_path = f"translations/{self.language}.json"
-
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                self.translations = json.load(f)
-        else:
-            print(f"Translation file {file_path} not found")
-            self.translations = {}
-
-    def get(self, key, **kwargs):
-        """Get translated text with optional formatting"""
-        keys = key.split('.')
-        value = self.translations
-
-        try:
-            for k in keys:
-                value = value[k]
-            return value.format(**kwargs) if kwargs else value
-        except (KeyError, AttributeError):
-            return key  # Return key if translation not found
-
-
-# Global translator instance
-_translator = None
-
-
-def init_translator(language="en"):
-    """Initialize translator"""
-    global _translator
-    _translator = Translator(language)
-
-
-def t(key, **kwargs):
-    """Get translation"""
-    if _translator is None:
-        init_translator()
-    return _translator.get(key, **kwargs)
\ No newline at end of file
+# translations.py
+import json
+import logging
+import os
+import string
+from contextvars import ContextVar
+from database.db_manager import get_chat_language, save_chat_language
+
+TRANSLATIONS_DIR = "translations"
+
+# UI language of the chat the current update comes from (None = default language)
+_chat_language = ContextVar("chat_language", default=None)
+
+_formatter = string.Formatter()
+
+
+def _flatten(tree, prefix=""):
+    """Flatten nested sections into dotted keys"""
+    flat = {}
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _read_translations(language):
+    """Flattened translations of a language from its JSON file, or None if there is none"""
+    file_path = f"{TRANSLATIONS_DIR}/{language}.json"
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return _flatten(json.load(f))
+
+
+def _compile_template(text):
+    """Function formatting a template with the given arguments, None if it has no fields
+
+    Plain {name} fields are compiled into an f-string, so the template is
+    parsed once instead of on every str.format call. Anything else
+    (positional fields, attribute access, nested specs) is left to str.format.
+    """
+    def fallback(kwargs):
+        return text.format(**kwargs)
+
+    try:
+        parts = list(_formatter.parse(text))
+    except ValueError:
+        return fallback
+    if all(field is None for _, field, _, _ in parts):
+        return None
+
+    namespace = {}
+    body = []
+    for index, (literal, field, spec, conversion) in enumerate(parts):
+        if literal:
+            # Passed as variables, so the text needs no quoting or brace escaping
+            namespace[f"_text{index}"] = literal
+            body.append(f"{{_text{index}}}")
+        if field is None:
+            continue
+        if not field.isidentifier() or "{" in spec or conversion not in (None, "r", "s", "a"):
+            return fallback
+        expression = f"kwargs[{field!r}]"
+        if conversion:
+            expression += f"!{conversion}"
+        if spec:
+            namespace[f"_spec{index}"] = spec
+            expression += f":{{_spec{index}}}"
+        body.append(f"{{{expression}}}")
+
+    exec(f'def render(kwargs):\n    return f"{"".join(body)}"', namespace)
+    return namespace["render"]
+
+
+class Translator:
+    def __init__(self, language="en"):
+        self.language = language
+        # Dotted key -> (text, compiled template or None if it has no replacement fields)
+        self.translations = {}
+        self.load_translations()
+
+    def load_translations(self):
+        """Load translations from JSON file, flattened and with templates compiled"""
+        translations = _read_translations(self.language)
+        if translations is None:
+            print(f"Translation file {TRANSLATIONS_DIR}/{self.language}.json not found")
+            self.translations = {}
+        else:
+            self.translations = {
+                key: (value, _compile_template(value))
+                for key, value in translations.items()
+            }
+
+    def lookup(self, key, kwargs):
+        """Formatted text for a key, or None if this locale does not have it"""
+        entry = self.translations.get(key)
+        if entry is None:
+            return None
+
+        text, render = entry
+        if not (kwargs and render):
+            return text
+        try:
+            return render(kwargs)
+        except (KeyError, IndexError):
+            return key
+
+    def get(self, key, **kwargs):
+        """Get translated text with optional formatting"""
+        text = self.lookup(key, kwargs)
+        return key if text is None else text
+
+
+class ChatLanguages:
+    """UI language chosen per chat, stored in the database and cached in memory"""
+
+    def __init__(self):
+        self._cache = {}
+
+    async def get(self, chat_id):
+        """Language of a chat, or None if it uses the default language"""
+        if chat_id not in self._cache:
+            self._cache[chat_id] = await get_chat_language(chat_id)
+        return self._cache[chat_id]
+
+    async def set(self, chat_id, language):
+        """Change the language of a chat"""
+        await save_chat_language(chat_id, language)
+        self._cache[chat_id] = language
+
+
+# Global translator instance (default language)
+_translator = None
+
+# Loaded locales by language, filled on first use
+_locales = {}
+
+# Global per-chat language store
+chat_languages = ChatLanguages()
+
+
+def init_translator(language="en"):
+    """Initialize translator"""
+    global _translator
+    _translator = Translator(language)
+    _locales[language] = _translator
+
+
+def available_languages():
+    """Languages that have a translation file"""
+    return sorted(
+        os.path.splitext(name)[0]
+        for name in os.listdir(TRANSLATIONS_DIR)
+        if name.endswith(".json")
+    )
+
+
+def default_language():
+    """Language used when a chat has not chosen one"""
+    if _translator is None:
+        init_translator()
+    return _translator.language
+
+
+def get_locale(language):
+    """Translator of a language, loaded on first use"""
+    locale = _locales.get(language)
+    if locale is None:
+        locale = Translator(language)
+        _locales[language] = locale
+    return locale
+
+
+def use_language(language):
+    """Use a chat's language for t() in the current context, returns a token for reset_language()"""
+    return _chat_language.set(language)
+
+
+def reset_language(token):
+    """Go back to the language used before use_language()"""
+    _chat_language.reset(token)
+
+
+def check_missing_keys():
+    """Log keys present in some translation files but missing from others
+
+    Reads the files directly, so locales are still only loaded when a chat uses them.
+    """
+    keys = {language: _read_translations(language).keys() for language in available_languages()}
+    all_keys = set().union(*keys.values())
+    for language, language_keys in keys.items():
+        missing = all_keys - language_keys
+        if missing:
+            logging.warning(
+                f"Translation file {TRANSLATIONS_DIR}/{language}.json is missing keys: "
+                f"{', '.join(sorted(missing))}"
+            )
+
+
+def t(key, **kwargs):
+    """Get translation in the current chat's language, falling back to the default language"""
+    if _translator is None:
+        init_translator()
+
+    language = _chat_language.get()
+    if language and language != _translator.language:
+        text = get_locale(language).lookup(key, kwargs)
+        if text is not None:
+            return text
+
+    text = _translator.lookup(key, kwargs)
+    return key if text is None else text
@@ -0,0 +1,95 @@
+import time
+from telegram.constants import ChatMemberStatus
+from config import ADMIN_CACHE_TTL_SECONDS
+from database.db_manager import (
+    get_allowed_groups, add_allowed_groups, save_allowed_group, delete_allowed_group, set_del_admins_only
+)
+
+
+class AccessControl:
+    """Allowed groups and per-group rules, kept in the database and mirrored in memory.
+
+    Group checks are a set lookup and changes apply at once, without a
+    restart. Instances sharing the database pick up each other's changes
+    when they reload the list (ACCESS_RELOAD_SECONDS). Group admin lookups (getChatMember) are cached for a while and
+    dropped explicitly when a member's status changes.
+    """
+
+    def __init__(self, admin_ttl_seconds: float):
+        self.admin_ttl_seconds = admin_ttl_seconds
+        self._allowed_groups = set()
+        self._del_admins_only = set()
+        # (chat_id, user_id) -> (expires_at, is_admin)
+        self._admins = {}
+
+    async def load(self, seed_groups=()):
+        """Add the configured groups, unless disallowed at runtime, and load the allowed groups"""
+        await add_allowed_groups(list(seed_groups))
+        await self.reload()
+
+    async def reload(self):
+        """Read the allowed groups and their rules from the database again"""
+        allowed_groups = set()
+        del_admins_only = set()
+        for chat_id, admins_only in await get_allowed_groups():
+            allowed_groups.add(chat_id)
+            if admins_only:
+                del_admins_only.add(chat_id)
+
+        for chat_id in self._allowed_groups - allowed_groups:
+            self.invalidate_admins(chat_id)
+        self._allowed_groups = allowed_groups
+        self._del_admins_only = del_admins_only
+
+    @property
+    def allowed_groups(self) -> list[int]:
+        return sorted(self._allowed_groups)
+
+    def is_group_allowed(self, chat_id: int) -> bool:
+        return chat_id in self._allowed_groups
+
+    def is_del_admins_only(self, chat_id: int) -> bool:
+        """True if only group admins may use /del in this group"""
+        return chat_id in self._del_admins_only
+
+    async def allow_group(self, chat_id: int):
+        await save_allowed_group(chat_id)
+        self._allowed_groups.add(chat_id)
+
+    async def disallow_group(self, chat_id: int):
+        await delete_allowed_group(chat_id)
+        self._allowed_groups.discard(chat_id)
+        self._del_admins_only.discard(chat_id)
+        self.invalidate_admins(chat_id)
+
+    async def set_del_admins_only(self, chat_id: int, enabled: bool):
+        await set_del_admins_only(chat_id, enabled)
+        if enabled:
+            self._del_admins_only.add(chat_id)
+        else:
+            self._del_admins_only.discard(chat_id)
+
+    async def is_chat_admin(self, bot, chat_id: int, user_id: int) -> bool:
+        """True if the user is an owner or administrator of the chat (cached)"""
+        key = (chat_id, user_id)
+        entry = self._admins.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        member = await bot.get_chat_member(chat_id, user_id)
+        is_admin = member.status in (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR)
+        self._admins[key] = (time.monotonic() + self.admin_ttl_seconds, is_admin)
+        return is_admin
+
+    def invalidate_admins(self, chat_id: int, user_id: int = None):
+        """Forget cached admin lookups of a chat member, or of a whole chat"""
+        if user_id is not None:
+            self._admins.pop((chat_id, user_id), None)
+            return
+
+        for key in [key for key in self._admins if key[0] == chat_id]:
+            del self._admins[key]
+
+
+# Global access control
+access_control = AccessControl(ADMIN_CACHE_TTL_SECONDS)
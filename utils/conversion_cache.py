@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import os
+from config import TOJPG_CACHE_DIR, TOJPG_CACHE_MAX_MB
+from database.db_manager import get_cached_file_id, save_cached_file_id, delete_cached_file_id
+
+
+class ConversionCache:
+    """Remember converted images by the source's Telegram file_unique_id.
+
+    The first tier maps a cache key to the file_id Telegram returned for our
+    upload, so a repeated conversion is just a re-send. The optional second
+    tier is a size-capped on-disk LRU of encoded bytes, used when Telegram
+    no longer accepts the stored file_id.
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = 0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._disk_usage = None
+        self.stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stale_file_ids": 0,
+        }
+
+    @staticmethod
+    def make_key(file_unique_id: str, send_as_photo: bool, settings: str) -> str:
+        """Build the cache key for a source file, output mode and encoding settings"""
+        output_mode = "photo" if send_as_photo else "document"
+        return f"{file_unique_id}:{output_mode}:{settings}"
+
+    async def get_file_id(self, key: str) -> str | None:
+        """Return the stored Telegram file_id for a key"""
+        return await get_cached_file_id(key)
+
+    async def invalidate_file_id(self, key: str):
+        """Forget a file_id Telegram rejected"""
+        self.stats["stale_file_ids"] += 1
+        await delete_cached_file_id(key)
+
+    async def store(self, key: str, file_id: str, jpg_bytes: bytes = None):
+        """Remember the uploaded file_id and, if given and enabled, the encoded bytes"""
+        await save_cached_file_id(key, file_id)
+        if self.cache_dir and jpg_bytes:
+            await asyncio.to_thread(self._write_bytes, key, jpg_bytes)
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        """Return encoded bytes from the disk cache"""
+        if not self.cache_dir:
+            return None
+        return await asyncio.to_thread(self._read_bytes, key)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".jpg")
+
+    def _read_bytes(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Touch the file so eviction sees it as recently used
+        os.utime(path)
+        return data
+
+    def _write_bytes(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if self._disk_usage is None:
+            self._disk_usage = sum(entry.stat().st_size for entry in os.scandir(self.cache_dir))
+
+        path = self._path(key)
+        if os.path.exists(path):
+            self._disk_usage -= os.path.getsize(path)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self._disk_usage += len(data)
+
+        if self._disk_usage > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Remove least recently used files until the cache fits its size cap"""
+        entries = sorted(os.scandir(self.cache_dir), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self._disk_usage <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._disk_usage -= size
+
+
+# Global conversion cache
+conversion_cache = ConversionCache(TOJPG_CACHE_DIR, TOJPG_CACHE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,152 @@
+import heapq
+import logging
+from datetime import datetime, timezone
+from apscheduler.jobstores.base import JobLookupError
+from config import DEADLINE_PRELOAD_SIZE, SWEEP_RETRY_SECONDS, DEADLINE_RELOAD_SECONDS
+from database.storage import deletion_storage
+from translations import t
+from utils.helpers import to_epoch_ms
+from utils.metrics import metrics
+
+
+class DeletionScheduler:
+    """Run the deletion sweep exactly when the next scheduled message is due.
+
+    The database stays the source of truth; the scheduler only keeps the
+    nearest deadlines in a min-heap and arms a single one-shot job for the
+    earliest of them. With a shared database, deadlines are re-read every
+    DEADLINE_RELOAD_SECONDS so records scheduled by other bot instances are
+    swept as well. Sweeps never overlap, and the first one can be a
+    recovery sweep draining the backlog left by downtime.
+    """
+
+    def __init__(self):
+        self._deadlines = []
+        # Deadlines after this timestamp are not in the heap yet (None = heap holds all of them)
+        self._horizon = None
+        self._job = None
+        self._job_deadline = None
+        self._job_queue = None
+        self._sweep = None
+        self._recovery = None
+        self._running = False
+        self._reload_job = None
+
+    async def start(self, job_queue, sweep, recovery=None):
+        """Seed deadlines from the database and arm the first sweep
+
+        If messages fell due while the bot was down, that sweep is
+        `recovery` (if given) instead of `sweep`.
+        """
+        self._job_queue = job_queue
+        self._sweep = sweep
+        self._recovery = None
+        if recovery is not None:
+            _, overdue = await deletion_storage.count_pending(to_epoch_ms(datetime.now(timezone.utc)))
+            if overdue:
+                self._recovery = recovery
+        await self._load_deadlines(None)
+        self._arm()
+
+        if DEADLINE_RELOAD_SECONDS:
+            self._reload_job = job_queue.run_repeating(
+                self._reload, interval=DEADLINE_RELOAD_SECONDS, name="reload_deletion_deadlines"
+            )
+
+    def stop(self):
+        """Cancel the pending sweep"""
+        self._cancel()
+        if self._reload_job:
+            self._reload_job.schedule_removal()
+            self._reload_job = None
+
+    def _cancel(self):
+        """Remove the armed one-shot job, if any"""
+        if self._job:
+            try:
+                self._job.schedule_removal()
+            except JobLookupError:
+                # The job has already been taken out of the scheduler to run
+                pass
+            self._job = None
+            self._job_deadline = None
+
+    def notify(self, deadline: int):
+        """Register a new deletion deadline (epoch ms) and wake up earlier if needed"""
+        # Deadlines beyond the loaded window are picked up by the next reload
+        if self._horizon is not None and deadline > self._horizon:
+            return
+
+        heapq.heappush(self._deadlines, deadline)
+        if self._job_queue and (self._job_deadline is None or deadline < self._job_deadline):
+            self._arm()
+
+    async def _load_deadlines(self, after):
+        """Load the next batch of deadlines from the database"""
+        deadlines = await deletion_storage.upcoming_deadlines(after, DEADLINE_PRELOAD_SIZE)
+        for deadline in deadlines:
+            heapq.heappush(self._deadlines, deadline)
+
+        self._horizon = deadlines[-1] if len(deadlines) == DEADLINE_PRELOAD_SIZE else None
+
+    async def _reload(self, context):
+        """Replace the heap with the deadlines now in the database"""
+        self._deadlines = []
+        await self._load_deadlines(None)
+        if self._deadlines and (self._job_deadline is None or self._deadlines[0] < self._job_deadline):
+            self._arm()
+
+    def _arm(self):
+        """Schedule a one-shot job for the earliest deadline"""
+        self._cancel()
+        if not self._deadlines:
+            return
+
+        self._job_deadline = self._deadlines[0]
+        # A job scheduled in the past counts as missed and would never run,
+        # so overdue deadlines (e.g. after a restart) are swept right away
+        delay = max(0.0, (self._job_deadline - to_epoch_ms(datetime.now(timezone.utc))) / 1000)
+        self._job = self._job_queue.run_once(
+            self._run,
+            when=delay,
+            name="delete_expired_messages"
+        )
+
+    async def _run(self, context):
+        """Sweep due messages, then re-arm for the next deadline"""
+        deadline = self._job_deadline
+        self._job = None
+        self._job_deadline = None
+        # The sweep in progress re-arms for this deadline when it ends
+        if self._running:
+            return
+
+        now = to_epoch_ms(datetime.now(timezone.utc))
+        if deadline is not None:
+            metrics.observe("deletion_sweep_lag_seconds", max(0, now - deadline) / 1000)
+
+        sweep = self._recovery or self._sweep
+        self._recovery = None
+        self._running = True
+        try:
+            with metrics.time("deletion_sweep_duration_seconds"):
+                await sweep(context.application.bot)
+        except Exception as e:
+            logging.error(t("del_message.check_error", error=e))
+            metrics.inc("deletion_sweep_errors_total")
+            heapq.heappush(self._deadlines, now + SWEEP_RETRY_SECONDS * 1000)
+        finally:
+            self._running = False
+
+        # Everything due before the sweep started has been handled
+        while self._deadlines and self._deadlines[0] <= now:
+            heapq.heappop(self._deadlines)
+
+        if not self._deadlines and self._horizon is not None:
+            await self._load_deadlines(now)
+
+        self._arm()
+
+
+# Global scheduler instance
+deletion_scheduler = DeletionScheduler()
@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from config import EPHEMERAL_MESSAGE_SECONDS, EPHEMERAL_BATCH_SECONDS
+from database.storage import deletion_storage
+from utils.deletion_scheduler import deletion_scheduler
+from utils.helpers import to_epoch_ms
+
+# handler_name of ephemeral notices in the messages table
+EPHEMERAL_HANDLER_NAME = "ephemeral"
+
+
+async def delete_later(message, seconds: float = EPHEMERAL_MESSAGE_SECONDS):
+    """Have a bot notice deleted after `seconds` without waiting for it
+
+    The deletion goes through the same durable store and sweep as /del, so
+    it survives restarts. Deadlines are rounded up to EPHEMERAL_BATCH_SECONDS,
+    so notices sent close together are removed in one sweep, with one
+    deleteMessages call per chat.
+    """
+    step = EPHEMERAL_BATCH_SECONDS * 1000
+    delete_at = to_epoch_ms(datetime.now(timezone.utc)) + int(seconds * 1000)
+    delete_at = -(-delete_at // step) * step
+
+    await deletion_storage.schedule(message.chat_id, message.message_id, delete_at, EPHEMERAL_HANDLER_NAME,
+                                   to_epoch_ms(message.date))
+    deletion_scheduler.notify(delete_at)
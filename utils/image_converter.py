@@ -0,0 +1,344 @@
+import asyncio
+import io
+import logging
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from config import (
+    TOJPG_WORKERS, TOJPG_MAX_QUEUE, TOJPG_TIMEOUT_SECONDS, TOJPG_MAX_MEGAPIXELS, TOJPG_DOWNSCALE_OVERSIZED,
+    TOJPG_WORKER_MEMORY_MB
+)
+from utils.metrics import metrics
+
+# Memory limits are only available on POSIX systems
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# For HEIC support
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIC_SUPPORTED = True
+except ImportError:
+    HEIC_SUPPORTED = False
+
+
+# Named encoding profiles, trading CPU time for file size
+ENCODING_PROFILES = {
+    "fast": {"quality": 85, "optimize": False},
+    "balanced": {"quality": 90, "optimize": True},
+    "smallest": {"quality": 75, "optimize": True, "progressive": True, "subsampling": 2},
+}
+
+# Quality range searched when a target file size is requested
+TARGET_SIZE_MIN_QUALITY = 30
+TARGET_SIZE_MAX_QUALITY = 95
+
+# Bumped whenever encoder output changes, so cached results are not reused
+ENCODER_VERSION = 1
+
+_SIZE_UNITS = {"k": 1024, "m": 1024 * 1024}
+
+
+class ConversionQueueFullError(Exception):
+    """Raised when the conversion pool cannot admit another job"""
+
+
+class ImageTooLargeError(Exception):
+    """Raised when an image has more pixels than the decode budget allows"""
+
+    def __init__(self, megapixels: float, limit: float):
+        super().__init__(megapixels, limit)
+        self.megapixels = megapixels
+        self.limit = limit
+
+
+def parse_encoding_option(option: str) -> tuple[str, int | None] | None:
+    """Parse a profile name or a target size such as `500k` / `2m` into (profile, target_size)"""
+    option = option.lower()
+    if option in ENCODING_PROFILES:
+        return option, None
+
+    match = re.match(r'^(\d*\.?\d+)([km])b?$', option)
+    if match:
+        return "target", int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+    return None
+
+
+def encoding_settings(profile: str, target_size: int = None) -> str:
+    """Stable identifier of the encoder settings, used in cache keys"""
+    if target_size:
+        return f"v{ENCODER_VERSION}-target{target_size}"
+    return f"v{ENCODER_VERSION}-{profile}"
+
+
+def _open_source(source: bytes | str):
+    """Binary file object over image bytes (without copying them) or a file path"""
+    return open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)
+
+
+def sniff_image_format(source: bytes | str) -> str | None:
+    """Detect the real image format from its magic bytes instead of the file name"""
+    with _open_source(source) as f:
+        header = f.read(64)
+
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header.startswith(b'BM'):
+        return 'bmp'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    if header[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    if header[4:8] == b'ftyp':
+        # Major brand followed by the compatible brands of the ftyp box
+        box_size = int.from_bytes(header[:4], 'big')
+        brands = {header[i:i + 4] for i in range(8, min(box_size, len(header)), 4)}
+        if brands & {b'avif', b'avis'}:
+            return 'avif'
+        if brands & {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1'}:
+            return 'heif'
+
+    return None
+
+
+def is_baseline_jpeg(source: bytes | str) -> bool:
+    """True if the source is a sequential (non-progressive) JPEG"""
+    with _open_source(source) as f:
+        if f.read(2) != b'\xff\xd8':
+            return False
+
+        # Walk the marker segments up to the first start-of-frame marker
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return False
+            # Padding bytes before a marker
+            while marker[1] == 0xFF:
+                marker = marker[1:] + f.read(1)
+            if marker[1] in (0xC0, 0xC1):
+                return True
+            if 0xC2 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                return False
+
+            length = f.read(2)
+            if len(length) < 2:
+                return False
+            f.seek(int.from_bytes(length, 'big') - 2, io.SEEK_CUR)
+
+
+def source_size(source: bytes | str) -> int:
+    """Size in bytes of image bytes or of a file"""
+    return os.path.getsize(source) if isinstance(source, str) else len(source)
+
+
+def can_pass_through(source: bytes | str, target_size: int = None) -> bool:
+    """True if the source already is a baseline JPEG that needs no re-encoding"""
+    if target_size and source_size(source) > target_size:
+        return False
+    return sniff_image_format(source) == 'jpeg' and is_baseline_jpeg(source)
+
+
+def init_worker():
+    """Pre-load every Pillow plugin (and the HEIF opener, via the import above) in a worker"""
+    Image.init()
+
+    # The pixel budget below replaces Pillow's own decompression bomb check,
+    # which would refuse oversized JPEGs before they can be downscaled
+    Image.MAX_IMAGE_PIXELS = None
+
+    # Hard memory ceiling for the whole worker process
+    if TOJPG_WORKER_MEMORY_MB and resource is not None:
+        limit = TOJPG_WORKER_MEMORY_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _fit_pixel_budget(image):
+    """Check the pixel count from the header before anything is decoded
+
+    Oversized JPEGs can be decoded at 1/2, 1/4 or 1/8 scale instead (draft
+    mode), other formats over the budget are refused.
+    """
+    max_pixels = TOJPG_MAX_MEGAPIXELS * 1_000_000
+    width, height = image.size
+    if width * height <= max_pixels:
+        return image
+
+    if TOJPG_DOWNSCALE_OVERSIZED and image.format == 'JPEG':
+        scale = math.sqrt(max_pixels / (width * height))
+        # draft() keeps at least the requested size, so ask for half of it to stay in budget
+        image.draft('RGB', (int(width * scale / 2), int(height * scale / 2)))
+        image.thumbnail((int(width * scale), int(height * scale)))
+        return image
+
+    raise ImageTooLargeError(round(width * height / 1_000_000, 1), TOJPG_MAX_MEGAPIXELS)
+
+
+def _to_rgb(image):
+    """Convert an image to a mode JPEG can store"""
+    # Convert to RGB if needed
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Create white background
+        rgb_image = Image.new('RGB', image.size, (255, 255, 255))
+
+        if image.mode == 'P':
+            # Convert palette to RGBA
+            image = image.convert('RGBA')
+
+        # If it has alpha channel, use it as mask
+        if image.mode in ('RGBA', 'LA'):
+            rgb_image.paste(image, mask=image.split()[-1])
+        else:
+            rgb_image.paste(image)
+
+        return rgb_image
+    elif image.mode not in ('RGB', 'L'):
+        # Convert other formats to RGB
+        return image.convert('RGB')
+
+    return image
+
+
+def _encode(image, **options) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format='JPEG', **options)
+    return output.getvalue()
+
+
+def _encode_to_target(image, target_size: int) -> bytes:
+    """Binary-search the highest quality whose output fits in target_size"""
+    low, high = TARGET_SIZE_MIN_QUALITY, TARGET_SIZE_MAX_QUALITY
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(image, quality=quality, optimize=True)
+        if len(data) <= target_size:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    # Even the lowest quality is too big: return the smallest we can do
+    return best or _encode(image, quality=TARGET_SIZE_MIN_QUALITY, optimize=True, subsampling=2)
+
+
+def convert_to_jpg(source: bytes | str, profile: str = "balanced", target_size: int = None) -> bytes:
+    """Convert image bytes (or the file at a path) to JPG using an encoding profile
+
+    Runs inside a worker process. Every format, HEIC included, is decoded
+    straight from the buffer; BytesIO over a bytes object does not copy it.
+    """
+    with _open_source(source) as f:
+        image = _to_rgb(_fit_pixel_budget(Image.open(f)))
+
+        if target_size:
+            return _encode_to_target(image, target_size)
+        return _encode(image, **ENCODING_PROFILES[profile])
+
+
+class ConversionPool:
+    """Bounded process pool that keeps CPU-heavy image work off the event loop"""
+
+    def __init__(self, max_workers: int, max_queue: int, timeout: float):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        # Jobs admitted and not finished yet (running or waiting for a worker)
+        self._active = 0
+
+    @property
+    def queue_position(self) -> int:
+        """Position the next job would get in the queue (0 = a worker is free)"""
+        return max(0, self._active - self.max_workers + 1)
+
+    @property
+    def queued(self) -> int:
+        """Jobs waiting for a free worker"""
+        return max(0, self._active - self.max_workers)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create the executor on first use, and again after it broke"""
+        if self._executor is None:
+            # Spawned workers do not inherit the event loop, sockets or database threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker
+            )
+        return self._executor
+
+    async def run(self, func, *args):
+        """Run `func(*args)` in a worker, raising ConversionQueueFullError, asyncio.TimeoutError or BrokenProcessPool
+
+        A worker dying (e.g. killed by the kernel for using too much memory)
+        fails every job in the pool. Each of them is retried once on a fresh
+        pool; a job that breaks that one too is most likely the cause and
+        fails for good.
+        """
+        if self._active >= self.max_workers + self.max_queue:
+            raise ConversionQueueFullError()
+
+        try:
+            return await self._run_once(func, *args)
+        except BrokenProcessPool:
+            return await self._run_once(func, *args)
+
+    async def _run_once(self, func, *args):
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            # Broken by a job that failed before this one was submitted
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            future = executor.submit(func, *args)
+        self._active += 1
+        # The slot is released when the worker is really done, even after a timeout
+        future.add_done_callback(lambda _: self._release_from_thread(loop))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """Drop a broken executor, so the next job starts a new one"""
+        # Every job of the broken pool ends up here, only the first replaces it
+        if self._executor is not executor:
+            return
+        logging.warning("A conversion worker died, restarting the conversion pool")
+        metrics.inc("conversion_pool_restarts_total")
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _release_from_thread(self, loop):
+        """Hand the slot back on the event loop thread"""
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._release)
+
+    def _release(self):
+        self._active -= 1
+
+    def shutdown(self):
+        """Stop the workers and drop queued jobs"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global conversion pool
+conversion_pool = ConversionPool(TOJPG_WORKERS, TOJPG_MAX_QUEUE, TOJPG_TIMEOUT_SECONDS)
@@ -0,0 +1,208 @@
+import json
+import math
+import os
+import unicodedata
+from collections import Counter, defaultdict
+
+SAMPLES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "langid_samples.json")
+
+# Scripts used by a single language, detected without any statistics
+SCRIPT_LANGUAGES = {
+    "HANGUL": "ko",
+    "HIRAGANA": "ja",
+    "KATAKANA": "ja",
+    "CJK": "zh-cn",
+    "THAI": "th",
+    "GREEK": "el",
+    "HEBREW": "iw",
+    "ARMENIAN": "hy",
+    "GEORGIAN": "ka",
+    "BENGALI": "bn",
+    "GUJARATI": "gu",
+    "GURMUKHI": "pa",
+    "ORIYA": "or",
+    "TAMIL": "ta",
+    "TELUGU": "te",
+    "KANNADA": "kn",
+    "MALAYALAM": "ml",
+    "SINHALA": "si",
+    "KHMER": "km",
+    "LAO": "lo",
+    "MYANMAR": "my",
+    "ETHIOPIC": "am",
+}
+
+# Most frequent trigrams kept per language profile
+PROFILE_SIZE = 1000
+
+# Trigrams of evidence after which the model stops growing more confident
+MAX_EVIDENCE = 30
+
+# Fewer letters than this are too little to tell languages of one script apart
+MIN_LETTERS = 8
+
+# How much worse (in nats per trigram) a text may fit its best profile than
+# that language's own samples do before it is taken for an unknown language
+MAX_FIT_DEFICIT = 0.6
+
+# Profiled languages that languages without a profile read almost exactly
+# like. Malay fits the Indonesian profile as well as Indonesian does, so no
+# confidence or fit threshold separates them, and these detections are left
+# to the translation service too
+NEAR_NEIGHBOURS = {
+    "id": ("ms",),
+    "nl": ("af",),
+    "tr": ("az",),
+    "bg": ("mk",),
+    "sr": ("mk",),
+    "uk": ("be",),
+    "cs": ("sl", "hr"),
+    "sk": ("sl", "hr"),
+}
+
+
+class LanguageDetector:
+    """Offline language identification for the common case of chat messages.
+
+    Languages with a script of their own are recognized from the script
+    alone. Within shared scripts (Latin, Arabic, Cyrillic) messages are
+    scored against character trigram profiles built from a bundled sample
+    corpus. Text that fits even the best profile poorly, such as a language
+    without a profile, is left to the translation service like everything
+    else, and so is text taken for a language in NEAR_NEIGHBOURS.
+    """
+
+    def __init__(self, samples_path: str = SAMPLES_PATH):
+        self.samples_path = samples_path
+        # script -> (languages, trigram -> [(language index, log-probability gain)],
+        #            language floors, fit of each language's own samples)
+        self._models = None
+        self._scripts = {}
+
+    def detect(self, text: str) -> tuple[str | None, float]:
+        """Return (language code, confidence between 0 and 1), or (None, 0.0) when unsure"""
+        scripts = Counter()
+        for char in text:
+            if char.isalpha():
+                scripts[self._script(char)] += 1
+
+        letters = sum(scripts.values())
+        if not letters:
+            return None, 0.0
+
+        # Kana mixed with kanji is Japanese, not Chinese
+        if scripts["HIRAGANA"] or scripts["KATAKANA"]:
+            scripts["HIRAGANA"] += scripts.pop("KATAKANA", 0) + scripts.pop("CJK", 0)
+
+        script, count = scripts.most_common(1)[0]
+        share = count / letters
+
+        if script in SCRIPT_LANGUAGES:
+            return SCRIPT_LANGUAGES[script], share
+
+        model = self._get_models().get(script)
+        if model is None or count < MIN_LETTERS:
+            return None, 0.0
+
+        language, confidence = self._score(model, text)
+        if language in NEAR_NEIGHBOURS:
+            return None, 0.0
+        return language, confidence * share
+
+    @property
+    def languages(self) -> set[str]:
+        """Languages the detector can return"""
+        profiled = {language for model in self._get_models().values() for language in model[0]}
+        return (profiled - NEAR_NEIGHBOURS.keys()) | set(SCRIPT_LANGUAGES.values())
+
+    def _script(self, char: str) -> str:
+        """Unicode script of a letter, taken from the first word of its name"""
+        script = self._scripts.get(char)
+        if script is None:
+            script = unicodedata.name(char, "UNKNOWN").split(" ", 1)[0]
+            self._scripts[char] = script
+        return script
+
+    @staticmethod
+    def _trigrams(text: str):
+        """Character trigrams of the lowercased words, padded with spaces"""
+        for word in "".join(char if char.isalpha() else " " for char in text.lower()).split():
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def _get_models(self) -> dict:
+        """Build the trigram profiles on first use"""
+        if self._models is None:
+            with open(self.samples_path, 'r', encoding='utf-8') as f:
+                samples = json.load(f)
+
+            by_script = defaultdict(list)
+            for language, text in samples.items():
+                script = Counter(self._script(char) for char in text if char.isalpha()).most_common(1)[0][0]
+                by_script[script].append((language, text))
+
+            self._models = {script: self._build_model(entries) for script, entries in by_script.items()}
+        return self._models
+
+    def _build_model(self, entries: list):
+        languages = []
+        floors = []
+        fits = []
+        index = defaultdict(list)
+        for language_index, (language, text) in enumerate(entries):
+            counts = Counter(self._trigrams(text))
+            top = counts.most_common(PROFILE_SIZE)
+            total = sum(count for _, count in top) + len(top)
+
+            # Add-one smoothing; unseen trigrams score the floor
+            floor = math.log(1 / total)
+            for trigram, count in top:
+                index[trigram].append((language_index, math.log((count + 1) / total) - floor))
+
+            # Average log-probability per trigram of the samples themselves,
+            # the baseline that texts of this language are expected to reach
+            kept = dict(top)
+            samples_score = sum(math.log((kept[trigram] + 1) / total) if trigram in kept else floor
+                                for trigram in self._trigrams(text))
+            languages.append(language)
+            floors.append(floor)
+            fits.append(samples_score / sum(counts.values()))
+
+        return languages, dict(index), floors, fits
+
+    @staticmethod
+    def _score(model, text: str) -> tuple[str | None, float]:
+        languages, index, floors, fits = model
+        gains = [0.0] * len(languages)
+        trigram_count = 0
+        for trigram in LanguageDetector._trigrams(text):
+            trigram_count += 1
+            for language_index, gain in index.get(trigram, ()):
+                gains[language_index] += gain
+
+        if not trigram_count:
+            return None, 0.0
+
+        scores = sorted(
+            ((gain + floor * trigram_count, i) for i, (gain, floor) in enumerate(zip(gains, floors))),
+            reverse=True
+        )
+        best, best_index = scores[0]
+
+        # Closer to an unknown language than to the samples of the best one
+        if best / trigram_count < fits[best_index] - MAX_FIT_DEFICIT:
+            return None, 0.0
+
+        if len(scores) == 1:
+            return languages[best_index], 1.0
+        second = scores[1][0]
+
+        # Posterior of the best language against the runner-up, with the
+        # evidence capped so long texts do not become absurdly certain
+        margin = (best - second) / trigram_count * min(trigram_count, MAX_EVIDENCE)
+        return languages[best_index], 1 / (1 + math.exp(-margin))
+
+
+# Global detector, profiles are built on first use
+language_detector = LanguageDetector()
@@ -0,0 +1,250 @@
+import unicodedata
+from googletrans import LANGUAGES
+
+# Names of languages in the languages themselves
+NATIVE_NAMES = {
+    "af": "afrikaans",
+    "am": "አማርኛ",
+    "ar": "العربية",
+    "az": "azərbaycan",
+    "be": "беларуская",
+    "bg": "български",
+    "bn": "বাংলা",
+    "bs": "bosanski",
+    "ca": "català",
+    "cs": "čeština",
+    "cy": "cymraeg",
+    "da": "dansk",
+    "de": "deutsch",
+    "el": "ελληνικά",
+    "en": "english",
+    "es": "español",
+    "et": "eesti",
+    "eu": "euskara",
+    "fa": "فارسی",
+    "fi": "suomi",
+    "fr": "français",
+    "ga": "gaeilge",
+    "gl": "galego",
+    "gu": "ગુજરાતી",
+    "he": "עברית",
+    "hi": "हिन्दी",
+    "hr": "hrvatski",
+    "hu": "magyar",
+    "hy": "հայերեն",
+    "id": "bahasa indonesia",
+    "is": "íslenska",
+    "it": "italiano",
+    "ja": "日本語",
+    "ka": "ქართული",
+    "kk": "қазақ тілі",
+    "km": "ខ្មែរ",
+    "kn": "ಕನ್ನಡ",
+    "ko": "한국어",
+    "ku": "kurdî",
+    "ckb": "کوردی",
+    "ky": "кыргызча",
+    "lo": "ລາວ",
+    "lt": "lietuvių",
+    "lv": "latviešu",
+    "mk": "македонски",
+    "ml": "മലയാളം",
+    "mn": "монгол",
+    "mr": "मराठी",
+    "ms": "bahasa melayu",
+    "my": "မြန်မာ",
+    "ne": "नेपाली",
+    "nl": "nederlands",
+    "no": "norsk",
+    "pa": "ਪੰਜਾਬੀ",
+    "pl": "polski",
+    "ps": "پښتو",
+    "pt": "português",
+    "ro": "română",
+    "ru": "русский",
+    "si": "සිංහල",
+    "sk": "slovenčina",
+    "sl": "slovenščina",
+    "sq": "shqip",
+    "sr": "српски",
+    "sv": "svenska",
+    "sw": "kiswahili",
+    "ta": "தமிழ்",
+    "te": "తెలుగు",
+    "tg": "тоҷикӣ",
+    "th": "ไทย",
+    "tr": "türkçe",
+    "uk": "українська",
+    "ur": "اردو",
+    "uz": "oʻzbek",
+    "vi": "tiếng việt",
+    "zh-cn": "简体中文",
+    "zh-tw": "繁體中文",
+}
+
+# Other common ways to name a language; these win over every other match
+LANGUAGE_ALIASES = {
+    "farsi": "fa",
+    "parsi": "fa",
+    "پارسی": "fa",
+    "chinese": "zh-cn",
+    "mandarin": "zh-cn",
+    "中文": "zh-cn",
+    "汉语": "zh-cn",
+    "漢語": "zh-tw",
+    "portuguese": "pt",
+    "brazilian": "pt",
+    "hebrew": "iw",
+    "burmese": "my",
+    "tagalog": "tl",
+    "filipino": "fil",
+    "kurdish": "ku",
+    "sorani": "ckb",
+    "dari": "fa-af",
+    "castilian": "es",
+    "deutsch": "de",
+    "anglais": "en",
+    "انگلیسی": "en",
+    "عربی": "ar",
+    "ترکی": "tr",
+    "روسی": "ru",
+    "آلمانی": "de",
+    "فرانسوی": "fr",
+}
+
+# Most typos tolerated in a language name
+MAX_TYPOS = 2
+
+# Codes suggested when nothing resembles the requested language
+POPULAR_LANGUAGES = ["en", "fa", "ar", "tr", "ru", "de", "fr", "es", "it", "zh-cn", "ja", "ko", "hi", "ur", "pt"]
+
+
+def normalize_language_name(name: str) -> str:
+    """Case-fold and normalize a language name or code for lookups"""
+    name = unicodedata.normalize("NFKC", name).casefold().replace("_", "-")
+    return " ".join(name.split())
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or limit + 1 as soon as it exceeds the limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _deletes(word: str, max_distance: int) -> set[str]:
+    """Every string obtained by deleting up to max_distance characters of word"""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier for i in range(len(candidate))}
+        results |= frontier
+    return results
+
+
+class LanguageIndex:
+    """Lookup of target languages by code, English name, native name or alias.
+
+    Built once; exact lookups are a single dict access. Typos are matched
+    through a symmetric-delete index: two names within edit distance d share
+    a string reachable from both by deleting at most d characters, so only
+    those few candidates need an exact edit distance check.
+    """
+
+    def __init__(self):
+        self._names = {}
+        # deletion variant -> names it was derived from
+        self._deletes = {}
+        self._build()
+
+    def _add(self, name: str, code: str, override: bool = False):
+        name = normalize_language_name(name)
+        if name and (override or name not in self._names):
+            self._names[name] = code
+
+    def _build(self):
+        for code in LANGUAGES:
+            self._add(code, code)
+
+        for code, name in LANGUAGES.items():
+            self._add(name, code)
+
+        # "chinese (simplified)" is also found as "chinese simplified", and
+        # "filipino (tagalog)" as "filipino" when nothing else claims that name
+        for code, name in LANGUAGES.items():
+            if "(" in name:
+                base, _, detail = name.partition("(")
+                self._add(f"{base} {detail.rstrip(')')}", code)
+                self._add(base, code)
+
+        for code, name in NATIVE_NAMES.items():
+            self._add(name, code)
+
+        for name, code in LANGUAGE_ALIASES.items():
+            self._add(name, code, override=True)
+
+        for name in self._names:
+            for variant in _deletes(name, MAX_TYPOS):
+                self._deletes.setdefault(variant, []).append(name)
+
+    @staticmethod
+    def _max_distance(name: str) -> int:
+        """Typos allowed for a name: none for codes, more for longer names"""
+        if len(name) <= 3:
+            return 0
+        return 1 if len(name) <= 5 else MAX_TYPOS
+
+    def get_code(self, name: str) -> str | None:
+        """Language code for a code, name or alias, or None"""
+        return self._names.get(normalize_language_name(name))
+
+    def suggest(self, name: str, limit: int = 5) -> list[str]:
+        """Codes of the languages closest to a misspelled name, best first"""
+        name = normalize_language_name(name)
+        max_distance = self._max_distance(name)
+        if not max_distance:
+            return []
+
+        candidates = {match for variant in _deletes(name, max_distance) for match in self._deletes.get(variant, ())}
+        matches = sorted(
+            (distance, match) for match in candidates
+            if (distance := edit_distance(name, match, max_distance)) <= max_distance
+        )
+
+        suggestions = []
+        for _, match in matches:
+            code = self._names[match]
+            if code not in suggestions:
+                suggestions.append(code)
+        return suggestions[:limit]
+
+    def resolve(self, name: str) -> tuple[str | None, list[str]]:
+        """Resolve a name to (code, []), or to (None, suggestions) when it is ambiguous or unknown
+
+        A misspelled name with a single close match resolves to that match.
+        """
+        code = self.get_code(name)
+        if code:
+            return code, []
+
+        suggestions = self.suggest(name)
+        if len(suggestions) == 1:
+            return suggestions[0], []
+        return None, suggestions
+
+
+# Global language index
+language_index = LanguageIndex()
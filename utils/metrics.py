@@ -0,0 +1,243 @@
+import asyncio
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Every metric the bot exports: name -> (type, help)
+METRICS = {
+    "bot_command_duration_seconds": ("histogram", "Time spent handling a command"),
+    "bot_command_errors_total": ("counter", "Commands that ended with an unhandled exception"),
+    "tojpg_stage_duration_seconds": ("histogram", "Time spent in each /tojpg stage (download, convert, upload)"),
+    "translation_upstream_duration_seconds": ("histogram", "Time spent waiting for the translation service"),
+    "translation_errors_total": ("counter", "Failed requests to the translation service"),
+    "db_query_duration_seconds": ("histogram", "Time spent in database functions"),
+    "deletion_sweep_duration_seconds": ("histogram", "Time spent in a deletion sweep"),
+    "deletion_sweep_lag_seconds": ("histogram", "Delay between a deletion deadline and the sweep handling it"),
+    "deletion_sweep_errors_total": ("counter", "Deletion sweeps that failed and were retried"),
+    "deleted_messages_total": ("counter", "Messages deleted by the deletion sweep"),
+    "deletion_errors_total": ("counter", "Messages the deletion sweep failed to delete"),
+    "deletions_skipped_total": ("counter", "Deletions dropped without an API call, the message being too old to delete"),
+    "deletions_pending": ("gauge", "Messages scheduled for deletion"),
+    "deletions_overdue": ("gauge", "Messages past their deletion deadline and not deleted yet"),
+    "telegram_api_request_duration_seconds": ("histogram", "Time spent in Bot API requests"),
+    "telegram_api_errors_total": ("counter", "Bot API requests that failed"),
+    "telegram_api_retries_total": ("counter", "Bot API requests queued again after a RetryAfter"),
+    "telegram_api_coalesced_edits_total": ("counter", "Message edits dropped because a newer edit was queued"),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result"),
+    "conversion_pool_restarts_total": ("counter", "Times the conversion pool was restarted after a worker died"),
+    "queue_depth": ("gauge", "Work waiting in each queue"),
+    "uptime_seconds": ("gauge", "Time since the bot started"),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus format"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket, plus the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def average(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf if above the last bucket)"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """In-process counters, gauges and histograms, rendered in the Prometheus text format.
+
+    Values are plain dict entries updated on the event loop, so recording a
+    value costs a dict lookup. Values that are cheaper to read on demand
+    (queue depths, cache stats, pending deletions) come from collectors that
+    run just before the metrics are read.
+    """
+
+    def __init__(self):
+        # (name, labels) -> value, for counters and gauges
+        self._values = {}
+        # (name, labels) -> Histogram
+        self._histograms = {}
+        self._collectors = []
+        self.started = time.monotonic()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase a counter"""
+        key = self._key(name, labels)
+        self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge (or a counter kept elsewhere)"""
+        self._values[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a value in a histogram"""
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """Record the time spent in a `with` block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name: str):
+        """Decorator recording the duration of an async function, labelled with its name"""
+
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.time(name, function=func.__name__):
+                    return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def value(self, name: str, **labels) -> float:
+        return self._values.get(self._key(name, labels), 0)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._histograms.get(self._key(name, labels)) or Histogram()
+
+    def total(self, name: str, **labels) -> float:
+        """Sum of a metric over the label sets matching `labels` (histograms: their counts)"""
+        total = 0
+        for (metric_name, key_labels), value in list(self._values.items()) + list(self._histograms.items()):
+            if metric_name == name and labels.items() <= dict(key_labels).items():
+                total += value.count if isinstance(value, Histogram) else value
+        return total
+
+    def add_collector(self, collector):
+        """Register an async callable that refreshes values before they are read"""
+        self._collectors.append(collector)
+
+    async def collect(self):
+        """Run the collectors"""
+        self.set("uptime_seconds", time.monotonic() - self.started)
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                logging.error(f"Metrics collector {collector.__name__} failed: {e}")
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+            for (metric_name, labels), value in sorted(self._values.items()):
+                if metric_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+            for (metric_name, labels), histogram in sorted(self._histograms.items()):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    bucket_labels = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{key}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class MetricsServer:
+    """Minimal HTTP server answering GET /metrics for a Prometheus scraper"""
+
+    def __init__(self, metrics: Metrics, host: str, port: int):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Skip the headers, the request has no body we care about
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+            if parts[:1] == ["GET"] and path == "/metrics":
+                await self.metrics.collect()
+                status, body = "200 OK", self.metrics.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+# Global metrics registry
+metrics = Metrics()
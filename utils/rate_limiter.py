@@ -0,0 +1,194 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+from utils.metrics import metrics
+
+# Request priorities, lower runs first; pass as rate_limit_args={"priority": ...}
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Requests that are never delayed: Telegram expects these answered at once
+_UNTHROTTLED_ENDPOINTS = {"getUpdates", "setWebhook", "deleteWebhook", "getMe", "answerCallbackQuery"}
+
+# Idle per-chat buckets are dropped once there are more than this many
+_MAX_IDLE_BUCKETS = 1000
+
+
+class PriorityTokenBucket:
+    """Token bucket whose waiters are served by priority, then in arrival order"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        # (priority, arrival, future)
+        self._waiters = []
+        self._arrivals = itertools.count()
+        self._wakeup = None
+
+    @property
+    def waiting(self) -> int:
+        """Number of requests waiting for a token"""
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        """True if the bucket is full and nobody waits for it"""
+        self._refill()
+        return not self._waiters and self._tokens >= self.capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        """Wait for a token"""
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        self._schedule()
+        await future
+
+    def release(self):
+        """Give back an unused token"""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + 1)
+        self._serve()
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next `seconds` (Telegram asked us to back off)"""
+        self._refill()
+        # The next token becomes available exactly `seconds` from now
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
+        self._reschedule()
+
+    def _serve(self):
+        self._wakeup = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            # Skip waiters that were cancelled meanwhile
+            if future.done():
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+    def _schedule(self):
+        """Wake up when the next token is available, if anyone is waiting"""
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        if self._waiters and self._wakeup is None:
+            delay = max(0.0, (1 - self._tokens) / self.rate)
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._serve)
+
+    def _reschedule(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        self._schedule()
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """Throttle every Bot API call to Telegram's flood limits.
+
+    Each request takes a token from its chat's bucket (groups and private
+    chats have different limits) and then from the global bucket. Waiting
+    requests are served by priority, so interactive replies overtake
+    background work such as the deletion sweep. A RetryAfter pauses the
+    affected bucket and the request is queued again. A status message edit
+    still waiting for its turn is dropped when a newer edit of the same
+    message arrives.
+    """
+
+    def __init__(self, global_per_second: float, group_per_minute: float, private_per_second: float,
+                 max_retries: int):
+        self.group_per_minute = group_per_minute
+        self.private_per_second = private_per_second
+        self.max_retries = max_retries
+        self._global_bucket = PriorityTokenBucket(global_per_second, global_per_second)
+        self._chat_buckets = {}
+        # (chat_id, message_id) -> number of the latest edit requested
+        self._edits = {}
+        self._edit_numbers = itertools.count()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def waiting(self) -> int:
+        """Number of requests waiting for their turn"""
+        return self._global_bucket.waiting + sum(bucket.waiting for bucket in self._chat_buckets.values())
+
+    def _get_chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= _MAX_IDLE_BUCKETS:
+                for idle_chat_id in [key for key, value in self._chat_buckets.items() if value.idle]:
+                    del self._chat_buckets[idle_chat_id]
+
+            # Groups and channels have negative ids (or an @username)
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = PriorityTokenBucket(self.group_per_minute / 60, self.group_per_minute)
+            else:
+                bucket = PriorityTokenBucket(self.private_per_second, self.private_per_second)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if endpoint in _UNTHROTTLED_ENDPOINTS:
+            return await callback(*args, **kwargs)
+
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_INTERACTIVE)
+        chat_id = data.get("chat_id")
+        chat_bucket = self._get_chat_bucket(chat_id) if chat_id is not None else None
+
+        edit_key = None
+        if endpoint == "editMessageText" and chat_id is not None:
+            edit_key = (chat_id, data.get("message_id"))
+            edit_number = next(self._edit_numbers)
+            self._edits[edit_key] = edit_number
+
+        try:
+            for attempt in itertools.count():
+                if chat_bucket is not None:
+                    await chat_bucket.acquire(priority)
+
+                    # A newer edit of this message is queued: it makes this one pointless
+                    if edit_key is not None and self._edits.get(edit_key) != edit_number:
+                        chat_bucket.release()
+                        metrics.inc("telegram_api_coalesced_edits_total")
+                        return True
+
+                await self._global_bucket.acquire(priority)
+
+                try:
+                    with metrics.time("telegram_api_request_duration_seconds", endpoint=endpoint):
+                        return await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    if attempt >= self.max_retries:
+                        metrics.inc("telegram_api_errors_total", endpoint=endpoint, error=type(e).__name__)
+                        raise
+
+                    logging.warning(f"Flood limit hit on {endpoint} for chat {chat_id}, retrying in {e.retry_after}s")
+                    metrics.inc("telegram_api_retries_total", endpoint=endpoint)
+                    (chat_bucket or self._global_bucket).pause(e.retry_after)
+                except TelegramError as e:
+                    metrics.inc("telegram_api_errors_total", endpoint=endpoint, error=type(e).__name__)
+                    raise
+        finally:
+            if edit_key is not None and self._edits.get(edit_key) == edit_number:
+                del self._edits[edit_key]
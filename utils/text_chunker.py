@@ -0,0 +1,208 @@
+import html
+import re
+from telegram.constants import MessageEntityType
+
+# Placeholder standing in for an entity while the text is translated
+PLACEHOLDER = "⟦{}⟧"
+# Translators sometimes add spaces inside the brackets
+_PLACEHOLDER_RE = re.compile(r"⟦\s*(\d+)\s*⟧")
+
+# Entities whose text must reach the reply untranslated
+PROTECTED_ENTITY_TYPES = {
+    MessageEntityType.BOT_COMMAND,
+    MessageEntityType.CASHTAG,
+    MessageEntityType.CODE,
+    MessageEntityType.CUSTOM_EMOJI,
+    MessageEntityType.EMAIL,
+    MessageEntityType.HASHTAG,
+    MessageEntityType.MENTION,
+    MessageEntityType.PHONE_NUMBER,
+    MessageEntityType.PRE,
+    MessageEntityType.TEXT_LINK,
+    MessageEntityType.TEXT_MENTION,
+    MessageEntityType.URL,
+}
+
+# Boundaries to split at, from the most to the least preferred:
+# paragraphs, lines, sentences, words
+_SPLIT_PATTERNS = [
+    re.compile(r"\n\s*\n"),
+    re.compile(r"\n"),
+    re.compile(r"(?<=[.!?;؟。！？…])\s+"),
+    re.compile(r"\s+"),
+]
+
+
+def utf16_length(text: str) -> int:
+    """Length in UTF-16 code units, the way Telegram counts offsets and message length"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _hard_cut(text: str, max_length: int, length) -> list[str]:
+    """Cut text into pieces of at most max_length, never inside a character"""
+    if length is len:
+        return [text[i:i + max_length] for i in range(0, len(text), max_length)]
+
+    pieces = []
+    start = 0
+    current = 0
+    for i, char in enumerate(text):
+        size = length(char)
+        if current + size > max_length and i > start:
+            pieces.append(text[start:i])
+            start, current = i, 0
+        current += size
+    pieces.append(text[start:])
+    return pieces
+
+
+def _entity_html(entity, text: str) -> str:
+    """HTML for an entity that keeps its formatting in the reply"""
+    escaped = html.escape(text, quote=False)
+    if entity.type == MessageEntityType.CODE:
+        return f"<code>{escaped}</code>"
+    if entity.type == MessageEntityType.PRE:
+        if entity.language:
+            return f'<pre><code class="language-{html.escape(entity.language)}">{escaped}</code></pre>'
+        return f"<pre>{escaped}</pre>"
+    if entity.type == MessageEntityType.TEXT_LINK:
+        return f'<a href="{html.escape(entity.url)}">{escaped}</a>'
+    if entity.type == MessageEntityType.TEXT_MENTION:
+        return f'<a href="tg://user?id={entity.user.id}">{escaped}</a>'
+    if entity.type == MessageEntityType.CUSTOM_EMOJI:
+        return f'<tg-emoji emoji-id="{entity.custom_emoji_id}">{escaped}</tg-emoji>'
+    return escaped
+
+
+def protect_entities(text: str, entities) -> tuple[str, list[tuple[str, str]]]:
+    """Replace untranslatable entities (code, links, mentions, ...) with numbered placeholders
+
+    Returns the masked text and, per placeholder, the (html, plain text) it stands for.
+    Entity offsets are in UTF-16 code units, so the text is sliced in that encoding.
+    """
+    utf16 = text.encode("utf-16-le")
+    parts = []
+    replacements = []
+    position = 0
+    for entity in sorted(entities or (), key=lambda e: e.offset):
+        start = entity.offset * 2
+        end = start + entity.length * 2
+        # Entities nested in an already protected one are part of it
+        if entity.type not in PROTECTED_ENTITY_TYPES or start < position:
+            continue
+
+        entity_text = utf16[start:end].decode("utf-16-le")
+        parts.append(utf16[position:start].decode("utf-16-le"))
+        parts.append(PLACEHOLDER.format(len(replacements)))
+        replacements.append((_entity_html(entity, entity_text), entity_text))
+        position = end
+
+    parts.append(utf16[position:].decode("utf-16-le"))
+    return "".join(parts), replacements
+
+
+def restore_entities(text: str, source: str, replacements: list[tuple[str, str]], markup: bool = True) -> str:
+    """Put protected entities back in place of the placeholders of a translated chunk
+
+    `source` is the masked chunk that was translated. With markup the result
+    is HTML, otherwise plain text. Placeholders of `source` the translator
+    dropped are appended at the end rather than lost.
+    """
+    expected = [int(index) for index in _PLACEHOLDER_RE.findall(source)]
+    restored = []
+    position = 0
+    for match in _PLACEHOLDER_RE.finditer(text):
+        index = int(match.group(1))
+        if index not in expected:
+            continue
+        expected.remove(index)
+        segment = text[position:match.start()]
+        restored.append(html.escape(segment, quote=False) if markup else segment)
+        restored.append(replacements[index][0 if markup else 1])
+        position = match.end()
+
+    segment = text[position:]
+    restored.append(html.escape(segment, quote=False) if markup else segment)
+    for index in expected:
+        restored.append(" " + replacements[index][0 if markup else 1])
+    return "".join(restored)
+
+
+def strip_placeholders(text: str) -> str:
+    """Text without its entity placeholders"""
+    return _PLACEHOLDER_RE.sub("", text)
+
+
+def split_text(text: str, max_length: int, level: int = 0, length=len) -> list[str]:
+    """Split text into chunks of at most max_length characters at natural boundaries
+
+    Separators stay attached to the chunk before them, so joining the chunks
+    gives back the original text. `length` measures a chunk, e.g. utf16_length
+    for Telegram's limits.
+    """
+    if length(text) <= max_length:
+        return [text] if text else []
+    if level == len(_SPLIT_PATTERNS):
+        return _hard_cut(text, max_length, length)
+
+    pieces = []
+    start = 0
+    for match in _SPLIT_PATTERNS[level].finditer(text):
+        if match.end() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    if start < len(text):
+        pieces.append(text[start:])
+
+    chunks = []
+    current = ""
+    current_length = 0
+    for piece in pieces:
+        piece_length = length(piece)
+        if piece_length > max_length:
+            if current:
+                chunks.append(current)
+                current, current_length = "", 0
+            chunks.extend(split_text(piece, max_length, level + 1, length))
+        elif current_length + piece_length > max_length:
+            chunks.append(current)
+            current, current_length = piece, piece_length
+        else:
+            current += piece
+            current_length += piece_length
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def pack_chunks(chunks: list[tuple[str, str]], max_length: int) -> list[str]:
+    """Group rendered (html, plain text) chunks into as few HTML messages as the length limit allows
+
+    Length is measured on the plain text in UTF-16 code units, as Telegram
+    does once the markup is parsed. A chunk too long on its own is sent as
+    split plain text.
+    """
+    messages = []
+    current_html = ""
+    current_length = 0
+    for chunk_html, chunk_text in chunks:
+        chunk_length = utf16_length(chunk_text)
+        if chunk_length > max_length:
+            pieces = [
+                (html.escape(piece, quote=False), utf16_length(piece))
+                for piece in split_text(chunk_text, max_length, length=utf16_length)
+            ]
+        else:
+            pieces = [(chunk_html, chunk_length)]
+
+        for piece_html, piece_length in pieces:
+            if current_length + piece_length > max_length and current_html.strip():
+                messages.append(current_html)
+                current_html, current_length = "", 0
+            current_html += piece_html
+            current_length += piece_length
+
+    if current_html.strip():
+        messages.append(current_html)
+    return messages
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+from config import TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL_HOURS
+from database.db_manager import get_cached_translation, save_cached_translation
+from utils.helpers import to_epoch_ms
+
+
+class TranslationCache:
+    """Two-tier translation cache with in-flight request coalescing.
+
+    An in-memory LRU with a TTL sits in front of a persistent SQLite table.
+    Concurrent requests for the same (text, source, target) share a single
+    upstream call instead of each making their own.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at, (translated_text, source_language))
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._upstream_calls = 0
+        self._upstream_seconds = 0.0
+        self.stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "coalesced": 0,
+            "misses": 0,
+            "saved_seconds": 0.0,
+        }
+
+    @staticmethod
+    def make_key(text: str, source_language: str, target_language: str) -> str:
+        """Cache key from the normalized text hash and the language pair"""
+        normalized = unicodedata.normalize("NFC", text.strip())
+        text_hash = hashlib.sha256(normalized.encode()).hexdigest()
+        return f"{text_hash}:{source_language}:{target_language}"
+
+    async def get_or_translate(self, text: str, source_language: str, target_language: str, translate):
+        """Return a cached (translated_text, source_language) or compute it with `translate()`"""
+        key = self.make_key(text, source_language, target_language)
+
+        result = self._get_from_memory(key)
+        if result is not None:
+            self._record_hit("memory_hits")
+            return result
+
+        # An identical request is already on its way upstream: wait for its answer
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self._record_hit("coalesced")
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise
+            # The request we waited for was cancelled, not this one: make it ourselves
+            return await self.get_or_translate(text, source_language, target_language, translate)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._get_from_db(key)
+            if result is not None:
+                self._record_hit("db_hits")
+            else:
+                self.stats["misses"] += 1
+                started = time.monotonic()
+                result = await translate()
+                self._upstream_calls += 1
+                self._upstream_seconds += time.monotonic() - started
+                await save_cached_translation(key, result[0], result[1], to_epoch_ms(datetime.now(timezone.utc)))
+
+            self._put_in_memory(key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    def _record_hit(self, counter: str):
+        """Count a hit and the upstream time it saved (average upstream latency)"""
+        self.stats[counter] += 1
+        if self._upstream_calls:
+            self.stats["saved_seconds"] += self._upstream_seconds / self._upstream_calls
+
+    def _get_from_memory(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return result
+
+    def _put_in_memory(self, key: str, result: tuple):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _get_from_db(self, key: str):
+        not_before = to_epoch_ms(datetime.now(timezone.utc)) - int(self.ttl_seconds * 1000)
+        return await get_cached_translation(key, not_before)
+
+
+# Global translation cache
+translation_cache = TranslationCache(TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL_HOURS * 3600)
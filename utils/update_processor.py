@@ -0,0 +1,85 @@
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# BaseUpdateProcessor.process_update() takes its own semaphore before
+# do_process_update() runs. Updates waiting for their chat's turn must not
+# hold a global slot, so that semaphore is made too wide to ever block and
+# the real limit is applied once the chat's turn has come.
+_UNBOUNDED = 2 ** 31 - 1
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently while keeping each chat's updates in order.
+
+    Updates of one chat run one after another, in the order they arrived;
+    different chats run in parallel up to `max_concurrent` updates at once.
+    Commands can get their own, lower limits (e.g. CPU-heavy conversions).
+    """
+
+    def __init__(self, max_concurrent: int, command_limits: dict = None):
+        super().__init__(_UNBOUNDED)
+        self.max_concurrent = max_concurrent
+        self._global_limit = asyncio.Semaphore(max_concurrent)
+        self._command_limits = {
+            command: asyncio.Semaphore(limit) for command, limit in (command_limits or {}).items()
+        }
+        # chat_id -> [lock, updates holding or waiting for it]
+        self._chat_locks = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def waiting(self) -> int:
+        """Updates waiting for their chat's turn"""
+        return sum(count - lock.locked() for lock, count in self._chat_locks.values())
+
+    @staticmethod
+    def _get_chat_id(update):
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    @staticmethod
+    def _get_command(update):
+        """Command name of a command message, without the leading / and @botname"""
+        if not isinstance(update, Update) or not update.effective_message:
+            return None
+
+        text = update.effective_message.text
+        if not text or not text.startswith("/"):
+            return None
+        parts = text[1:].split(maxsplit=1)
+        return parts[0].split("@", 1)[0].lower() if parts else None
+
+    async def do_process_update(self, update, coroutine):
+        chat_id = self._get_chat_id(update)
+        if chat_id is None:
+            await self._run(update, coroutine)
+            return
+
+        entry = self._chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes its waiters first-in first-out
+            async with entry[0]:
+                await self._run(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat_id]
+
+    async def _run(self, update, coroutine):
+        command_limit = self._command_limits.get(self._get_command(update))
+        if command_limit is None:
+            async with self._global_limit:
+                await coroutine
+            return
+
+        async with command_limit:
+            async with self._global_limit:
+                await coroutine